@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+brickv (Brick Viewer)
+
+benchmark_enumerate.py: Feeds synthetic enumerate callbacks into the infos
+                        store and reports the time per callback
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public
+License along with this program; if not, write to the
+Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+Boston, MA 02111-1307, USA.
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from PyQt4.QtCore import pyqtSignal
+from PyQt4.QtGui import QApplication
+
+from brickv import infos
+from brickv.bindings.ip_connection import IPConnection
+
+class BenchmarkApplication(QApplication):
+    infos_changed_signal = pyqtSignal(str, bool)
+
+def synthetic_enumerate_callbacks(brick_count):
+    callbacks = []
+
+    for i in range(brick_count):
+        brick_uid = 'B{0}'.format(i)
+
+        callbacks.append((brick_uid, '0', '0', False))
+
+        for port in 'ab':
+            callbacks.append(('{0}{1}'.format(brick_uid, port), brick_uid, port, True))
+
+    # bricks and bricklets arrive in arbitrary order on a real site
+    random.shuffle(callbacks)
+
+    return callbacks
+
+# does the infos work of MainWindow.cb_enumerate
+def cb_enumerate(uid, connected_uid, position, is_bricklet, enumeration_type):
+    if enumeration_type == IPConnection.ENUMERATION_TYPE_DISCONNECTED:
+        if infos.get_info(uid) != None:
+            infos.remove_info(uid)
+    else:
+        device_info = infos.get_info(uid)
+        is_new = device_info == None
+
+        if is_new:
+            device_info = infos.BrickletInfo() if is_bricklet else infos.BrickInfo()
+            device_info.name = ('Bricklet ' if is_bricklet else 'Brick ') + uid
+
+        device_info.uid = uid
+        device_info.connected_uid = connected_uid
+        device_info.position = position
+        device_info.enumeration_type = enumeration_type
+
+        if is_new:
+            infos.add_info(device_info)
+        else:
+            infos.update_info(device_info)
+
+def run(brick_count):
+    callbacks = synthetic_enumerate_callbacks(brick_count)
+    start = time.time()
+
+    for uid, connected_uid, position, is_bricklet in callbacks:
+        cb_enumerate(uid, connected_uid, position, is_bricklet, IPConnection.ENUMERATION_TYPE_AVAILABLE)
+
+    for uid, connected_uid, position, is_bricklet in callbacks:
+        cb_enumerate(uid, connected_uid, position, is_bricklet, IPConnection.ENUMERATION_TYPE_AVAILABLE)
+
+    duration = time.time() - start
+
+    # every Bricklet has to be linked to its Brick regardless of the order
+    for brick_info in infos.get_brick_infos():
+        assert brick_info.bricklets['a'].connected_uid == brick_info.uid
+        assert brick_info.bricklets['b'].connected_uid == brick_info.uid
+
+    start = time.time()
+
+    for uid, connected_uid, position, is_bricklet in callbacks:
+        cb_enumerate(uid, connected_uid, position, is_bricklet, IPConnection.ENUMERATION_TYPE_DISCONNECTED)
+
+    duration += time.time() - start
+
+    print('{0:5} devices: {1:8.3f} s total, {2:8.1f} us per callback'
+          .format(len(callbacks), duration, duration * 1000000.0 / (len(callbacks) * 3)))
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the infos store with synthetic enumerate callbacks.')
+    parser.add_argument('brick_counts', metavar='BRICK_COUNT', type=int, nargs='*', default=[50, 100, 200, 400],
+                        help='number of Bricks, each with two Bricklets')
+
+    args = parser.parse_args()
+    app = BenchmarkApplication(sys.argv)
+
+    # linear enumeration shows as a constant time per callback
+    for brick_count in args.brick_counts:
+        run(brick_count)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+brickv (Brick Viewer)
+
+benchmark_red_api.py: Refreshes the commands of a list of programs from a
+                      simulated RED Brick with and without pipelining
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public
+License along with this program; if not, write to the
+Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+Boston, MA 02111-1307, USA.
+"""
+
+import os
+import sys
+import time
+import heapq
+import struct
+import argparse
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from PyQt4.QtCore import pyqtSignal
+from PyQt4.QtGui import QApplication
+
+from brickv.bindings.ip_connection import IPConnection
+from brickv.bindings.brick_red import BrickRED
+from brickv.plugin_system.plugins.red import api
+from brickv.plugin_system.plugins.red.api import REDBrick, REDString, REDList
+
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue # Python 2 fallback
+
+class BenchmarkApplication(QApplication):
+    object_creator_signal = pyqtSignal(object)
+
+class SimulatedREDConnection(IPConnection):
+    """
+    Answers the string and list functions of the RED Brick API. The requests
+    are handled one after the other, each takes service_time seconds, and
+    each response arrives latency seconds after it was handled.
+    """
+
+    def __init__(self, latency, service_time):
+        IPConnection.__init__(self)
+
+        self.latency = latency
+        self.service_time = service_time
+        self.objects = {} # object ID -> string data or list of object IDs
+        self.next_object_id = 1
+        self.request_count = 0
+        self.requests = Queue()
+        self.responses = [] # heap of (due time, order, packet)
+        self.responses_condition = threading.Condition()
+
+        for target in [self.handle_requests, self.deliver_responses]:
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+
+    def add_string(self, data):
+        object_id = self.next_object_id
+        self.next_object_id += 1
+        self.objects[object_id] = data
+
+        return object_id
+
+    def add_list(self, items):
+        return self.add_string([self.add_string(item) for item in items])
+
+    # overrides IPConnection.send
+    def send(self, packet):
+        self.request_count += 1
+        self.requests.put(packet)
+
+    def handle_requests(self):
+        order = 0
+
+        while True:
+            packet = self.requests.get()
+            time.sleep(self.service_time)
+
+            uid, length, function_id, sequence_number_and_options, flags = struct.unpack('<IBBBB', packet[:8])
+            payload = packet[8:]
+
+            if function_id == BrickRED.FUNCTION_GET_STRING_LENGTH:
+                object_id, = struct.unpack('<H', payload)
+                response = struct.pack('<BI', 0, len(self.objects[object_id]))
+            elif function_id == BrickRED.FUNCTION_GET_STRING_CHUNK:
+                object_id, offset = struct.unpack('<HI', payload)
+                response = struct.pack('<B63s', 0, self.objects[object_id][offset:offset + 63])
+            elif function_id == BrickRED.FUNCTION_GET_LIST_LENGTH:
+                object_id, = struct.unpack('<H', payload)
+                response = struct.pack('<BH', 0, len(self.objects[object_id]))
+            elif function_id == BrickRED.FUNCTION_GET_LIST_ITEM:
+                object_id, index, session_id = struct.unpack('<HHH', payload)
+                response = struct.pack('<BHB', 0, self.objects[object_id][index], BrickRED.OBJECT_TYPE_STRING)
+            else:
+                response = b'' # release_object_unchecked
+
+            if (sequence_number_and_options & 0x08) == 0:
+                continue
+
+            header = struct.pack('<IBBBB', uid, 8 + len(response), function_id, sequence_number_and_options, 0)
+
+            with self.responses_condition:
+                heapq.heappush(self.responses, (time.time() + self.latency, order, header + response))
+                self.responses_condition.notify()
+
+            order += 1
+
+    def deliver_responses(self):
+        while True:
+            with self.responses_condition:
+                while len(self.responses) == 0:
+                    self.responses_condition.wait()
+
+                due, order, packet = self.responses[0]
+                delay = due - time.time()
+
+                if delay > 0:
+                    self.responses_condition.wait(delay)
+                    continue
+
+                heapq.heappop(self.responses)
+
+            self.handle_response(packet)
+
+class BenchmarkSession(object):
+    def __init__(self, brick):
+        self._brick = brick
+        self._session_id = 1
+        self.error_count = 0
+
+    def increase_error_count(self):
+        self.error_count += 1
+
+# returns the object IDs of (executable, arguments, environment) per program
+def create_programs(ipcon, program_count, argument_count, environment_count):
+    programs = []
+
+    for i in range(program_count):
+        executable = ipcon.add_string('/usr/bin/python{0}'.format(i))
+        arguments = ipcon.add_list(['--argument-{0}={1}'.format(k, 'x' * 40) for k in range(argument_count)])
+        environment = ipcon.add_list(['VARIABLE_{0}={1}'.format(k, 'y' * 90) for k in range(environment_count)])
+
+        programs.append((executable, arguments, environment))
+
+    return programs
+
+def refresh(session, programs):
+    commands = []
+
+    for executable, arguments, environment in programs:
+        commands.append((unicode(REDString(session).attach(executable)),
+                         REDList(session).attach(arguments).items,
+                         REDList(session).attach(environment).items))
+
+    return commands
+
+def run(window, ipcon, session, programs):
+    api.PIPELINE_WINDOW = window
+    ipcon.request_count = 0
+    start = time.time()
+    commands = refresh(session, programs)
+    duration = time.time() - start
+
+    print('window {0:2}: {1:8.3f} s, {2:6} requests'.format(window, duration, ipcon.request_count))
+
+    return commands
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the refresh of program commands from a simulated RED Brick.')
+    parser.add_argument('--programs', type=int, default=10, help='number of programs')
+    parser.add_argument('--arguments', type=int, default=5, help='number of arguments per program')
+    parser.add_argument('--environment', type=int, default=10, help='number of environment variables per program')
+    parser.add_argument('--latency', type=float, default=1.0, help='latency per response in ms')
+    parser.add_argument('--service-time', type=float, default=0.1, help='time the RED Brick takes per request in ms')
+
+    args = parser.parse_args()
+    app = BenchmarkApplication(sys.argv)
+
+    # the objects are created in the main thread, so the signal calls this directly
+    app.object_creator_signal.connect(lambda object_creator: object_creator.create())
+
+    ipcon = SimulatedREDConnection(args.latency / 1000.0, args.service_time / 1000.0)
+    session = BenchmarkSession(REDBrick('RED', ipcon))
+    programs = create_programs(ipcon, args.programs, args.arguments, args.environment)
+
+    # window 1 is the round trip per request behavior without pipelining
+    baseline = run(1, ipcon, session, programs)
+
+    for window in [4, 8]:
+        assert run(window, ipcon, session, programs) == baseline
+
+if __name__ == '__main__':
+    main()
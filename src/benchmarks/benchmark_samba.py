@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+brickv (Brick Viewer)
+
+benchmark_samba.py: Compares writing a firmware word by word, page by page
+                    and differentially to a Brick in bootloader mode
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public
+License along with this program; if not, write to the
+Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+Boston, MA 02111-1307, USA.
+"""
+
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from brickv.samba import SAMBA, SAMBARebootError
+
+def split_pages(firmware, page_size):
+    pages = []
+
+    for offset in range(0, len(firmware), page_size):
+        page = firmware[offset:offset + page_size]
+        pages.append(page + '\xff' * (page_size - len(page)))
+
+    return pages
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark writing a firmware to a Brick in bootloader mode. ' +
+                                                 'The firmware is written three times, the last time ' +
+                                                 'differentially, then it is verified and the Brick is ' +
+                                                 'restarted.')
+    parser.add_argument('port', help='serial port of the Brick, e.g. /dev/ttyACM0')
+    parser.add_argument('firmware', help='firmware file')
+
+    args = parser.parse_args()
+
+    with open(args.firmware, 'rb') as f:
+        firmware = f.read()
+
+    samba = SAMBA(args.port)
+    pages = split_pages(firmware, samba.flash_page_size)
+
+    samba.erase()
+    samba.bulk_write = False
+    samba.write_pages(pages, 0, 'word writes')
+
+    samba.erase()
+    samba.bulk_write = True
+    samba.write_pages(pages, 0, 'bulk writes')
+
+    # nothing changed since the bulk writes, all pages are skipped
+    try:
+        samba.flash(firmware, None, False, True)
+    except SAMBARebootError:
+        pass
+
+    print(samba.format_write_timings())
+
+    word_duration = samba.write_timings[0][4]
+    bulk_duration = samba.write_timings[1][4]
+    differential_duration = samba.write_timings[2][4]
+
+    if samba.write_timings[1][1] != 'bulk':
+        print('\nbulk writes are not supported by this bootloader, word writes were used')
+    else:
+        print('\nbulk writes are {0:.1f}x faster'.format(word_duration / max(bulk_duration, 0.001)))
+
+    print('differential writes of an unchanged firmware are {0:.1f}x faster'
+          .format(word_duration / max(differential_duration, 0.001)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+brickv (Brick Viewer)
+
+benchmark_startup.py: Starts Brick Viewer repeatedly with the startup profiler
+                      and compares the result against a saved baseline
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public
+License along with this program; if not, write to the
+Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+Boston, MA 02111-1307, USA.
+"""
+
+import os
+import sys
+import json
+import tempfile
+import argparse
+import subprocess
+
+MAIN_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'brickv', 'main.py')
+
+# returns {name: milliseconds} for all phases and events of a report
+def parse_report(report):
+    values = {}
+
+    for line in report.splitlines():
+        parts = line.rsplit(None, 1)
+
+        if len(parts) != 2:
+            continue
+
+        try:
+            values[parts[0].strip()] = float(parts[1])
+        except ValueError:
+            pass
+
+    return values
+
+def run_once():
+    fd, report_filename = tempfile.mkstemp(suffix='.txt')
+    os.close(fd)
+
+    try:
+        subprocess.check_call([sys.executable, MAIN_PATH, '--profile-startup-quit',
+                               '--profile-startup-report', report_filename],
+                              stderr=open(os.devnull, 'w'))
+
+        with open(report_filename, 'rb') as f:
+            return parse_report(f.read())
+    finally:
+        os.remove(report_filename)
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+
+    if len(values) % 2 == 1:
+        return values[middle]
+
+    return (values[middle - 1] + values[middle]) / 2.0
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the startup of Brick Viewer.')
+    parser.add_argument('--runs', type=int, default=5, help='number of starts, the median is reported')
+    parser.add_argument('--save', help='save the result as baseline JSON file')
+    parser.add_argument('--baseline', help='compare against this baseline JSON file')
+    parser.add_argument('--tolerance', type=float, default=20.0,
+                        help='allowed slowdown against the baseline in percent')
+
+    args = parser.parse_args()
+
+    # the first start warms the disk cache, it is not counted
+    run_once()
+
+    runs = [run_once() for i in range(max(args.runs, 1))]
+    names = sorted(set().union(*[run.keys() for run in runs]))
+    result = dict((name, median([run.get(name, 0.0) for run in runs])) for name in names)
+    baseline = None
+    regressions = []
+
+    if args.baseline != None:
+        with open(args.baseline, 'rb') as f:
+            baseline = json.load(f)
+
+    for name in names:
+        line = '{0:<40}{1:10.1f} ms'.format(name, result[name])
+
+        if baseline != None and name in baseline:
+            change = (result[name] - baseline[name]) * 100.0 / max(baseline[name], 1.0)
+            line += '{0:+9.1f} %'.format(change)
+
+            # tiny phases are too noisy to judge
+            if change > args.tolerance and result[name] - baseline[name] > 10.0:
+                regressions.append(name)
+
+        print(line)
+
+    if args.save != None:
+        with open(args.save, 'wb') as f:
+            json.dump(result, f, indent=2, sort_keys=True)
+
+    if len(regressions) > 0:
+        print('\nregressions: ' + ', '.join(regressions))
+        return 1
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
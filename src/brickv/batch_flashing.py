@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+brickv (Brick Viewer)
+
+batch_flashing.py: Flashing of many Bricks at once
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public
+License along with this program; if not, write to the
+Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+Boston, MA 02111-1307, USA.
+"""
+
+import os
+
+from PyQt4.QtCore import QTimer
+from PyQt4.QtGui import QDialog, QLabel, QPushButton, QTableWidget, QTableWidgetItem, \
+                        QProgressBar, QAbstractItemView, QHeaderView, QVBoxLayout, QHBoxLayout
+
+from brickv.samba import BatchFlasher, BATCH_FLASH_STATE_FLASHING
+from brickv.bindings.ip_connection import base58encode, uid64_to_uid32
+from brickv.utils import get_main_window, get_home_path, get_save_file_name
+
+UPDATE_INTERVAL = 100 # ms
+
+COLUMN_PORT = 0
+COLUMN_STATE = 1
+COLUMN_PROGRESS = 2
+COLUMN_UID = 3
+COLUMN_MESSAGE = 4
+
+def format_uid(uid64):
+    return base58encode(uid64_to_uid32(uid64))
+
+class BatchFlashingWindow(QDialog):
+    """
+    Flashes the same firmware to the Bricks at all given serial ports at
+    once and shows the progress and the result per port.
+    """
+
+    def __init__(self, parent, port_names, firmware, title, differential):
+        QDialog.__init__(self, parent)
+
+        self.setWindowTitle('Flashing ' + title)
+        self.resize(800, 400)
+
+        self.flasher = BatchFlasher(port_names, firmware, differential=differential)
+        self.progress_bars = []
+
+        self.table = QTableWidget(len(self.flasher.jobs), 5, self)
+        self.table.setHorizontalHeaderLabels(['Port', 'State', 'Progress', 'UID', 'Message'])
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.verticalHeader().hide()
+        self.table.horizontalHeader().setResizeMode(COLUMN_MESSAGE, QHeaderView.Stretch)
+
+        for row, job in enumerate(self.flasher.jobs):
+            progress_bar = QProgressBar(self.table)
+
+            self.progress_bars.append(progress_bar)
+            self.table.setItem(row, COLUMN_PORT, QTableWidgetItem(job.port_name))
+            self.table.setCellWidget(row, COLUMN_PROGRESS, progress_bar)
+
+            for column in [COLUMN_STATE, COLUMN_UID, COLUMN_MESSAGE]:
+                self.table.setItem(row, column, QTableWidgetItem(''))
+
+        self.label_summary = QLabel(self)
+        self.button_save_report = QPushButton('Save Report', self)
+        self.button_close = QPushButton('Close', self)
+
+        self.button_save_report.clicked.connect(self.save_report_clicked)
+        self.button_close.clicked.connect(self.close)
+
+        button_layout = QHBoxLayout()
+        button_layout.addWidget(self.label_summary, 1)
+        button_layout.addWidget(self.button_save_report)
+        button_layout.addWidget(self.button_close)
+
+        layout = QVBoxLayout(self)
+        layout.addWidget(self.table, 1)
+        layout.addLayout(button_layout)
+
+        self.update_timer = QTimer(self)
+        self.update_timer.setInterval(UPDATE_INTERVAL)
+        self.update_timer.timeout.connect(self.update_jobs)
+
+        self.update_jobs()
+        self.flasher.start()
+        self.update_timer.start()
+
+    # overrides QDialog.reject, the dialog cannot be closed while flashing
+    def reject(self):
+        if self.flasher.is_finished():
+            QDialog.reject(self)
+
+    # overrides QDialog.closeEvent
+    def closeEvent(self, event):
+        if self.flasher.is_finished():
+            QDialog.closeEvent(self, event)
+        else:
+            event.ignore()
+
+    def update_jobs(self):
+        for row, job in enumerate(self.flasher.jobs):
+            progress_bar = self.progress_bars[row]
+
+            if job.state == BATCH_FLASH_STATE_FLASHING:
+                self.table.item(row, COLUMN_STATE).setText(job.title)
+            else:
+                self.table.item(row, COLUMN_STATE).setText(job.state)
+
+            if job.uid64 != None:
+                self.table.item(row, COLUMN_UID).setText(format_uid(job.uid64))
+
+            self.table.item(row, COLUMN_MESSAGE).setText(job.message)
+
+            if job.is_finished():
+                progress_bar.setMaximum(1)
+                progress_bar.setValue(1)
+            else:
+                progress_bar.setMaximum(job.maximum)
+                progress_bar.setValue(job.value)
+
+        finished = self.flasher.is_finished()
+
+        if finished:
+            self.update_timer.stop()
+            self.label_summary.setText(self.flasher.format_summary())
+        else:
+            self.label_summary.setText('Flashing...')
+
+        self.button_save_report.setEnabled(finished)
+        self.button_close.setEnabled(finished)
+
+    def save_report_clicked(self):
+        filename = get_save_file_name(get_main_window(), 'Save Report',
+                                      os.path.join(get_home_path(), 'flashing_report.txt'), '*.txt')
+
+        if len(filename) == 0:
+            return
+
+        with open(filename, 'wb') as f:
+            f.write(self.flasher.format_report(format_uid) + '\n')
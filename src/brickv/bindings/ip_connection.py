@@ -128,6 +128,7 @@ class Device:
         self.expected_response_function_id = None # protected by request_lock
         self.expected_response_sequence_number = None # protected by request_lock
         self.response_queue = Queue()
+        self.pipelined_response_queue = None # protected by request_lock
         self.request_lock = Lock()
 
         self.response_expected = [Device.RESPONSE_EXPECTED_INVALID_FUNCTION_ID] * 256
@@ -888,10 +889,8 @@ class IPConnection:
 
             self.disconnect_probe_flag = False
 
-    def send_request(self, device, function_id, data, form, form_ret):
-        length = 8 + struct.calcsize('<' + form)
-        request, response_expected, sequence_number = \
-            self.create_packet_header(device, length, function_id)
+    def pack_payload(self, data, form):
+        payload = b''
 
         def pack_string(f, d):
             if sys.hexversion < 0x03000000:
@@ -913,19 +912,44 @@ class IPConnection:
 
         for f, d in zip(form.split(' '), data):
             if len(f) > 1 and not 's' in f and not 'c' in f:
-                request += struct.pack('<' + f, *d)
+                payload += struct.pack('<' + f, *d)
             elif 's' in f:
-                request += pack_string(f, d)
+                payload += pack_string(f, d)
             elif 'c' in f:
                 if len(f) > 1:
                     if int(f.replace('c', '')) != len(d):
                         raise ValueError('Incorrect char list length')
                     for k in d:
-                        request += pack_string('c', k)
+                        payload += pack_string('c', k)
                 else:
-                    request += pack_string(f, d)
+                    payload += pack_string(f, d)
             else:
-                request += struct.pack('<' + f, d)
+                payload += struct.pack('<' + f, d)
+
+        return payload
+
+    def check_error_code(self, function_id, response):
+        error_code = get_error_code_from_data(response)
+
+        if error_code == 0:
+            # no error
+            pass
+        elif error_code == 1:
+            msg = 'Got invalid parameter for function {0}'.format(function_id)
+            raise Error(Error.INVALID_PARAMETER, msg)
+        elif error_code == 2:
+            msg = 'Function {0} is not supported'.format(function_id)
+            raise Error(Error.NOT_SUPPORTED, msg)
+        else:
+            msg = 'Function {0} returned an unknown error'.format(function_id)
+            raise Error(Error.UNKNOWN_ERROR_CODE, msg)
+
+    def send_request(self, device, function_id, data, form, form_ret):
+        length = 8 + struct.calcsize('<' + form)
+        request, response_expected, sequence_number = \
+            self.create_packet_header(device, length, function_id)
+
+        request += self.pack_payload(data, form)
 
         if response_expected:
             with device.request_lock:
@@ -950,20 +974,7 @@ class IPConnection:
                     device.expected_response_function_id = None
                     device.expected_response_sequence_number = None
 
-            error_code = get_error_code_from_data(response)
-
-            if error_code == 0:
-                # no error
-                pass
-            elif error_code == 1:
-                msg = 'Got invalid parameter for function {0}'.format(function_id)
-                raise Error(Error.INVALID_PARAMETER, msg)
-            elif error_code == 2:
-                msg = 'Function {0} is not supported'.format(function_id)
-                raise Error(Error.NOT_SUPPORTED, msg)
-            else:
-                msg = 'Function {0} returned an unknown error'.format(function_id)
-                raise Error(Error.UNKNOWN_ERROR_CODE, msg)
+            self.check_error_code(function_id, response)
 
             if len(form_ret) > 0:
                 return self.deserialize_data(response[8:], form_ret)
@@ -1005,6 +1016,12 @@ class IPConnection:
             device.response_queue.put(packet)
             return
 
+        pipelined_response_queue = device.pipelined_response_queue
+
+        if pipelined_response_queue is not None:
+            pipelined_response_queue.put(packet)
+            return
+
         # Response seems to be OK, but can't be handled
 
     def handle_disconnect_by_peer(self, disconnect_reason, socket_id, disconnect_immediately):
@@ -1051,6 +1068,88 @@ class IPConnection:
                                  'c B',
                                  '32B')
 
+    # Sends a request without waiting for its response. The caller has to hold
+    # device.request_lock and has to set device.pipelined_response_queue, all
+    # responses of the device are put into that queue then. The sequence number
+    # of the request is returned, the packet is only sent if accept() returns
+    # True for it, otherwise None is returned
+    def send_pipelined_request(self, device, function_id, payload, accept=None):
+        request, response_expected, sequence_number = \
+            self.create_packet_header(device, 8 + len(payload), function_id)
+
+        if accept is not None and not accept(sequence_number):
+            return None
+
+        self.send(request + payload)
+
+        return sequence_number
+
+    # Sends the requests, given as (function_id, data, form, form_ret) tuples,
+    # with up to window of them in flight and returns their results in order.
+    # Errors are raised like by send_request, the responses of the requests
+    # that are still in flight then are dropped
+    def send_pipelined_requests(self, device, requests, window=8):
+        results = [None] * len(requests)
+        outstanding = {} # sequence number -> (index, function_id, form_ret)
+        next_index = 0
+        queue = Queue()
+        accept = lambda sequence_number: sequence_number not in outstanding
+
+        with device.request_lock:
+            device.pipelined_response_queue = queue
+
+            try:
+                while next_index < len(requests) or len(outstanding) > 0:
+                    while next_index < len(requests) and len(outstanding) < window:
+                        function_id, data, form, form_ret = requests[next_index]
+                        sequence_number = self.send_pipelined_request(device, function_id,
+                                                                      self.pack_payload(data, form), accept)
+
+                        # the sequence number is still in flight, the next
+                        # response has to be received first
+                        if sequence_number is None:
+                            break
+
+                        outstanding[sequence_number] = (next_index, function_id, form_ret)
+                        next_index += 1
+
+                    try:
+                        response = queue.get(True, self.timeout)
+                    except Empty:
+                        function_id = min(outstanding.values())[1]
+                        msg = 'Did not receive response for function {0} in time'.format(function_id)
+                        raise Error(Error.TIMEOUT, msg)
+
+                    sequence_number = get_sequence_number_from_data(response)
+
+                    # ignore old responses that arrived after a timeout
+                    if sequence_number not in outstanding or \
+                       outstanding[sequence_number][1] != get_function_id_from_data(response):
+                        continue
+
+                    index, function_id, form_ret = outstanding.pop(sequence_number)
+
+                    self.check_error_code(function_id, response)
+
+                    if len(form_ret) > 0:
+                        results[index] = self.deserialize_data(response[8:], form_ret)
+            finally:
+                device.pipelined_response_queue = None
+
+        return results
+
+    def write_bricklet_plugin_pipelined(self, device, port, position, plugin_chunk, accept=None):
+        return self.send_pipelined_request(device,
+                                           IPConnection.FUNCTION_WRITE_BRICKLET_PLUGIN,
+                                           self.pack_payload((port, position, plugin_chunk), 'c B 32B'),
+                                           accept)
+
+    def read_bricklet_plugin_pipelined(self, device, port, position, accept=None):
+        return self.send_pipelined_request(device,
+                                           IPConnection.FUNCTION_READ_BRICKLET_PLUGIN,
+                                           self.pack_payload((port, position), 'c B'),
+                                           accept)
+
     def get_adc_calibration(self, device):
         return self.send_request(device,
                                  IPConnection.FUNCTION_GET_ADC_CALIBRATION,
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+"""
+brickv (Brick Viewer)
+
+bricklet_updater.py: Concurrent update of all outdated Bricklet plugins
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public
+License along with this program; if not, write to the
+Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+Boston, MA 02111-1307, USA.
+"""
+
+import time
+import logging
+import functools
+import threading
+
+from PyQt4.QtCore import QObject, QTimer, pyqtSignal
+
+from brickv.bindings.ip_connection import Error
+from brickv.download_cache import download_firmware
+from brickv.plugin_transfer import PluginTransfer, PluginTransferError, split_plugin
+from brickv import infos
+
+MAX_PARALLEL_DOWNLOADS = 4
+RESET_POLL_INTERVAL = 250 # ms
+RESET_TIMEOUT = 12.0 # seconds
+
+class BrickletUpdate(object):
+    def __init__(self, brick, port, bricklet):
+        self.brick = brick
+        self.port = port
+        self.bricklet = bricklet
+        self.plugin = None
+        self.value = 0
+        self.maximum = 0
+
+    def get_download_key(self):
+        return (self.bricklet.url_part, self.bricklet.firmware_version_latest)
+
+# returns a list of BrickletUpdate lists, one list per Brick that has
+# outdated Bricklets connected
+def plan_bricklet_updates():
+    plan = []
+
+    for brick in infos.get_brick_infos():
+        updates = []
+
+        for port in sorted(brick.bricklets):
+            bricklet = brick.bricklets[port]
+
+            if bricklet != None and bricklet.protocol_version in [1, 2] and \
+               bricklet.firmware_version_installed < bricklet.firmware_version_latest:
+                updates.append(BrickletUpdate(brick, port, bricklet))
+
+        if len(updates) > 0:
+            plan.append(updates)
+
+    return plan
+
+class BrickletUpdater(QObject):
+    """
+    Executes a plan from plan_bricklet_updates. All required plugins are
+    downloaded in parallel first. Then the Bricklets of each Brick are
+    written one after the other, but the Bricks are handled concurrently.
+    At last the Bricks are reset and the enumeration is polled until all
+    of them are back, instead of waiting for a fixed time.
+    """
+
+    progress_changed = pyqtSignal(str, int, int) # label, value, maximum
+    finished = pyqtSignal(object) # None on success, otherwise a PluginTransferError
+
+    # internal, emitted by the download threads
+    download_done = pyqtSignal(object, object) # download key, data or None
+
+    def __init__(self, ipcon, plan):
+        QObject.__init__(self)
+
+        self.ipcon = ipcon
+        self.plan = plan
+        self.updates = [update for updates in plan for update in updates]
+        self.download_keys = list(set(update.get_download_key() for update in self.updates))
+        self.downloads = {} # download key -> data or None
+        self.download_queue = list(self.download_keys)
+        self.download_lock = threading.Lock()
+        self.transfers = [] # keeps the transfers alive until they are finished
+        self.running_transfers = 0
+        self.error = None
+        self.reset_start = None
+        self.reset_timer = QTimer(self)
+
+        self.download_done.connect(self.handle_download_done)
+        self.reset_timer.setInterval(RESET_POLL_INTERVAL)
+        self.reset_timer.timeout.connect(self.poll_reset)
+
+    def start(self):
+        if len(self.updates) == 0:
+            self.finished.emit(None)
+            return
+
+        self.progress_changed.emit('Downloading {0} Bricklet plugin(s)'.format(len(self.download_keys)),
+                                   0, len(self.download_keys))
+
+        for i in range(min(MAX_PARALLEL_DOWNLOADS, len(self.download_keys))):
+            thread = threading.Thread(target=self.download_loop)
+            thread.daemon = True
+            thread.start()
+
+    # internal
+    def download_loop(self):
+        while True:
+            with self.download_lock:
+                if len(self.download_queue) == 0:
+                    return
+
+                key = self.download_queue.pop(0)
+
+            url_part, version = key
+
+            try:
+                data = download_firmware('bricklets', url_part, version)
+            except:
+                logging.exception('Could not download Bricklet plugin {0}'.format(url_part))
+                data = None
+
+            self.download_done.emit(key, data)
+
+    # internal
+    def handle_download_done(self, key, data):
+        self.downloads[key] = data
+
+        self.progress_changed.emit('Downloading {0} Bricklet plugin(s)'.format(len(self.download_keys)),
+                                   len(self.downloads), len(self.download_keys))
+
+        if len(self.downloads) < len(self.download_keys):
+            return
+
+        for update in self.updates:
+            data = self.downloads[update.get_download_key()]
+
+            if data == None:
+                self.finished.emit(PluginTransferError('Could not download {0} Bricklet plugin {1}.{2}.{3}'
+                                                       .format(update.bricklet.name, *update.bricklet.firmware_version_latest)))
+                return
+
+            update.plugin = map(ord, data) # Convert plugin to list of bytes
+            update.maximum = len(split_plugin(update.plugin)) * 2
+
+        for updates in self.plan:
+            self.start_transfer(list(updates))
+
+        self.report_transfer_progress()
+
+    # internal, remaining is the list of updates of one Brick that are left
+    def start_transfer(self, remaining):
+        update = remaining.pop(0)
+        transfer = PluginTransfer(self.ipcon, update.brick.plugin.device, update.port, update.plugin)
+
+        transfer.progress_changed.connect(functools.partial(self.handle_transfer_progress, update))
+        transfer.finished.connect(functools.partial(self.handle_transfer_finished, remaining))
+
+        self.transfers.append(transfer)
+        self.running_transfers += 1
+        transfer.start()
+
+    # internal
+    def handle_transfer_progress(self, update, value, maximum):
+        update.value = value
+        update.maximum = maximum
+
+        self.report_transfer_progress()
+
+    # internal
+    def handle_transfer_finished(self, remaining, error):
+        self.running_transfers -= 1
+
+        if error != None:
+            if self.error == None:
+                self.error = error
+        elif len(remaining) > 0 and self.error == None:
+            self.start_transfer(remaining)
+            return
+
+        # a failed Brick does not stop the transfers to the other Bricks, but
+        # nothing is reset then
+        if self.running_transfers > 0:
+            return
+
+        if self.error != None:
+            self.finished.emit(self.error)
+        else:
+            self.reset_bricks()
+
+    # internal
+    def report_transfer_progress(self):
+        self.progress_changed.emit('Writing and verifying {0} Bricklet plugin(s)'.format(len(self.updates)),
+                                   sum(update.value for update in self.updates),
+                                   max(sum(update.maximum for update in self.updates), 1))
+
+    # internal
+    def reset_bricks(self):
+        # the enumeration type of the infos is set again by the enumerate
+        # callback, so the Bricks that did not come back yet are marked here
+        for updates in self.plan:
+            brick = updates[0].brick
+            brick.enumeration_type = -1
+
+            try:
+                brick.plugin.device.reset()
+            except:
+                pass
+
+        self.reset_start = time.time()
+        self.poll_reset()
+        self.reset_timer.start()
+
+    # internal
+    def count_reset_bricks(self):
+        count = 0
+
+        for updates in self.plan:
+            info = infos.get_info(updates[0].brick.uid)
+
+            # a Brick connected by USB is removed and added again by the
+            # disconnect and connect enumeration
+            if info != None and info.enumeration_type != -1:
+                count += 1
+
+        return count
+
+    # internal
+    def poll_reset(self):
+        count = self.count_reset_bricks()
+
+        self.progress_changed.emit('Waiting for Bricks to reset', count, len(self.plan))
+
+        if count == len(self.plan) or time.time() - self.reset_start > RESET_TIMEOUT:
+            self.reset_timer.stop()
+            self.finished.emit(None)
+            return
+
+        # the Bricks handle the enumerate request after the reset request, so
+        # only Bricks that are already reset can respond to it
+        try:
+            self.ipcon.enumerate()
+        except Error:
+            pass
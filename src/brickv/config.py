@@ -39,6 +39,11 @@ def legacy_set_secret(secret): pass
 def legacy_get_remember_secret(): return DEFAULT_REMEMBER_SECRET
 def legacy_set_remember_secret(remember): pass
 
+def get_use_opengl_plots(): return DEFAULT_USE_OPENGL_PLOTS
+def set_use_opengl_plots(use): pass
+
+def save_config_values(): pass
+
 if sys.platform.startswith('linux') or sys.platform.startswith('freebsd'):
     from brickv.config_linux import *
 elif sys.platform == 'darwin':
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+brickv (Brick Viewer)
+
+config_cache.py: In-memory cache of the config values with delayed saving
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public
+License along with this program; if not, write to the
+Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+Boston, MA 02111-1307, USA.
+"""
+
+import os
+import sys
+import atexit
+import logging
+import tempfile
+import threading
+
+SAVE_DELAY = 1.0 # seconds
+
+class ConfigCache(object):
+    """
+    Loads all config values once and serves reads from memory. Changed
+    values are collected and saved together SAVE_DELAY seconds after the
+    last change, and at exit at the latest.
+
+    load() has to return a dict of all stored values. save(changed) gets a
+    dict of the values changed since the last save and has to merge them
+    into the stored ones, so changes done by another instance of Brick
+    Viewer in the meantime are kept.
+    """
+
+    def __init__(self, load, save):
+        self.load = load
+        self.save = save
+        self.values = None
+        self.changed = {}
+        self.lock = threading.RLock()
+        self.timer = None
+
+        atexit.register(self.flush)
+
+    # internal
+    def get_values(self):
+        if self.values == None:
+            try:
+                self.values = self.load()
+            except:
+                logging.exception('Could not load config')
+                self.values = {}
+
+        return self.values
+
+    def get(self, key, default):
+        with self.lock:
+            return self.get_values().get(key, default)
+
+    def set(self, key, value):
+        with self.lock:
+            values = self.get_values()
+
+            if key in values and values[key] == value:
+                return
+
+            values[key] = value
+            self.changed[key] = value
+
+            if self.timer != None:
+                self.timer.cancel()
+
+            self.timer = threading.Timer(SAVE_DELAY, self.flush)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def flush(self):
+        with self.lock:
+            if self.timer != None:
+                self.timer.cancel()
+                self.timer = None
+
+            if len(self.changed) == 0:
+                return
+
+            changed = self.changed
+            self.changed = {}
+
+            try:
+                self.save(changed)
+            except:
+                logging.exception('Could not save config')
+
+                # keep the values, the next set or flush tries again
+                self.changed = changed
+
+# renames source to target, replacing target if it exists. os.rename cannot
+# do that on Windows
+def replace_file(source, target):
+    if sys.platform == 'win32':
+        import ctypes
+
+        MOVEFILE_REPLACE_EXISTING = 0x1
+        MOVEFILE_WRITE_THROUGH = 0x8
+
+        if not ctypes.windll.kernel32.MoveFileExW(unicode(source), unicode(target),
+                                                  MOVEFILE_REPLACE_EXISTING | MOVEFILE_WRITE_THROUGH):
+            raise ctypes.WinError()
+    else:
+        os.rename(source, target)
+
+# writes a file by writing a temporary file next to it and renaming that
+# over the original one, so the file is never left half written
+def write_file_atomically(filename, write):
+    dirname = os.path.dirname(filename)
+
+    if not os.path.exists(dirname):
+        os.makedirs(dirname)
+
+    fd, temp_filename = tempfile.mkstemp(prefix=os.path.basename(filename) + '.', dir=dirname)
+
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+
+        replace_file(temp_filename, filename)
+    except:
+        os.remove(temp_filename)
+        raise
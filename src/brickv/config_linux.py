@@ -22,6 +22,7 @@ Boston, MA 02111-1307, USA.
 """
 
 from brickv.config_common import *
+from brickv.config_cache import ConfigCache, write_file_atomically
 import os
 
 try:
@@ -38,24 +39,45 @@ else:
 
 CONFIG_DIRNAME = os.path.dirname(CONFIG_FILENAME)
 
-def get_config_value(section, option, default):
-    scp = configparser.SafeConfigParser()
+# internal
+def load_config():
+    # RawConfigParser, because values can contain % and are never interpolated
+    scp = configparser.RawConfigParser()
     scp.read(CONFIG_FILENAME)
-    try:
-        return scp.get(section, option)
-    except configparser.Error:
-        return default
 
-def set_config_value(section, option, value):
-    scp = configparser.SafeConfigParser()
+    values = {}
+
+    for section in scp.sections():
+        for option, value in scp.items(section):
+            values[(section, option)] = value
+
+    return values
+
+# internal
+def save_config(changed):
+    scp = configparser.RawConfigParser()
     scp.read(CONFIG_FILENAME)
-    if not scp.has_section(section):
-        scp.add_section(section)
-    scp.set(section, option, value)
-    if not os.path.exists(CONFIG_DIRNAME):
-        os.makedirs(CONFIG_DIRNAME)
-    with open(CONFIG_FILENAME, 'wb') as f:
-        scp.write(f)
+
+    for (section, option), value in changed.items():
+        if not scp.has_section(section):
+            scp.add_section(section)
+
+        scp.set(section, option, value)
+
+    write_file_atomically(CONFIG_FILENAME, scp.write)
+
+if '_config_cache' not in globals():
+    _config_cache = ConfigCache(load_config, save_config)
+
+def get_config_value(section, option, default):
+    # RawConfigParser stores options in lower case
+    return _config_cache.get((section, option.lower()), default)
+
+def set_config_value(section, option, value):
+    _config_cache.set((section, option.lower()), value)
+
+def save_config_values():
+    _config_cache.flush()
 
 def get_host_info_strings(count):
     host_info_strings = []
@@ -136,3 +158,16 @@ def legacy_get_remember_secret():
 
 def legacy_set_remember_secret(remember):
     set_config_value('Authentication', 'RememberSecret', str(bool(remember)))
+
+def get_use_opengl_plots():
+    value = get_config_value('Plot', 'UseOpenGL', str(DEFAULT_USE_OPENGL_PLOTS)).lower()
+
+    if value == 'true':
+        return True
+    elif value == 'false':
+        return False
+    else:
+        return DEFAULT_USE_OPENGL_PLOTS
+
+def set_use_opengl_plots(use):
+    set_config_value('Plot', 'UseOpenGL', str(bool(use)))
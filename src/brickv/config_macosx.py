@@ -22,6 +22,7 @@ Boston, MA 02111-1307, USA.
 """
 
 from brickv.config_common import *
+from brickv.config_cache import ConfigCache, write_file_atomically
 import plistlib
 import os
 import subprocess
@@ -29,24 +30,40 @@ import subprocess
 CONFIG_FILENAME = os.path.expanduser('~/Library/Preferences/com.tinkerforge.brickv.plist')
 CONFIG_DIRNAME = os.path.dirname(CONFIG_FILENAME)
 
-def get_plist_value(name, default):
+# internal
+def read_plist():
+    subprocess.call(['plutil', '-convert', 'xml1', CONFIG_FILENAME])
+    return plistlib.readPlist(CONFIG_FILENAME)
+
+# internal
+def load_config():
     try:
-        subprocess.call(['plutil', '-convert', 'xml1', CONFIG_FILENAME])
-        root = plistlib.readPlist(CONFIG_FILENAME)
-        return root[name]
+        return dict(read_plist())
     except:
-        return default
+        return {}
 
-def set_plist_value(name, value):
+# internal
+def save_config(changed):
     try:
-        subprocess.call(['plutil', '-convert', 'xml1', CONFIG_FILENAME])
-        root = plistlib.readPlist(CONFIG_FILENAME)
+        root = read_plist()
     except:
         root = {}
-    root[name] = value
-    if not os.path.exists(CONFIG_DIRNAME):
-        os.makedirs(CONFIG_DIRNAME)
-    plistlib.writePlist(root, CONFIG_FILENAME)
+
+    root.update(changed)
+
+    write_file_atomically(CONFIG_FILENAME, lambda f: plistlib.writePlist(root, f))
+
+if '_config_cache' not in globals():
+    _config_cache = ConfigCache(load_config, save_config)
+
+def get_plist_value(name, default):
+    return _config_cache.get(name, default)
+
+def set_plist_value(name, value):
+    _config_cache.set(name, value)
+
+def save_config_values():
+    _config_cache.flush()
 
 def get_host_info_strings(count):
     host_info_strings = []
@@ -127,3 +144,16 @@ def legacy_get_remember_secret():
 
 def legacy_set_remember_secret(remember):
     set_plist_value('RememberSecret', str(bool(remember)))
+
+def get_use_opengl_plots():
+    value = get_plist_value('UseOpenGLPlots', str(DEFAULT_USE_OPENGL_PLOTS)).lower()
+
+    if value == 'true':
+        return True
+    elif value == 'false':
+        return False
+    else:
+        return DEFAULT_USE_OPENGL_PLOTS
+
+def set_use_opengl_plots(use):
+    set_plist_value('UseOpenGLPlots', str(bool(use)))
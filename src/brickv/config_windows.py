@@ -22,6 +22,7 @@ Boston, MA 02111-1307, USA.
 """
 
 from brickv.config_common import *
+from brickv.config_cache import ConfigCache
 
 try:
     import winreg
@@ -30,31 +31,64 @@ except:
 
 KEY_NAME = 'Software\\Tinkerforge\\Brickv'
 
-def get_registry_value(name, default):
+# internal
+def load_config():
+    values = {}
+
     try:
         reg = winreg.OpenKey(winreg.HKEY_CURRENT_USER, KEY_NAME)
     except WindowsError:
-        return default
-    else:
-        try:
-            return winreg.QueryValueEx(reg, name)[0]
-        except:
-            return default
-        finally:
-            winreg.CloseKey(reg)
+        return values
 
-def set_registry_value(name, type_, value):
+    try:
+        i = 0
+
+        while True:
+            try:
+                name, value, type_ = winreg.EnumValue(reg, i)
+            except WindowsError: # no more values
+                break
+
+            values[name] = (type_, value)
+            i += 1
+    finally:
+        winreg.CloseKey(reg)
+
+    return values
+
+# internal
+def save_config(changed):
     try:
         reg = winreg.CreateKey(winreg.HKEY_CURRENT_USER, KEY_NAME)
     except WindowsError:
         logging.warn('Could not create registry key: HKCU\\{0}'.format(KEY_NAME))
-    else:
-        try:
-            winreg.SetValueEx(reg, name, 0, type_, value)
-        except:
-            logging.warn('Could not set registry value: HKCU\\{0}\\{1}'.format(KEY_NAME, name))
-        finally:
-            winreg.CloseKey(reg)
+        return
+
+    try:
+        for name, (type_, value) in changed.items():
+            try:
+                winreg.SetValueEx(reg, name, 0, type_, value)
+            except:
+                logging.warn('Could not set registry value: HKCU\\{0}\\{1}'.format(KEY_NAME, name))
+    finally:
+        winreg.CloseKey(reg)
+
+if '_config_cache' not in globals():
+    _config_cache = ConfigCache(load_config, save_config)
+
+def get_registry_value(name, default):
+    type_value = _config_cache.get(name, None)
+
+    if type_value == None:
+        return default
+
+    return type_value[1]
+
+def set_registry_value(name, type_, value):
+    _config_cache.set(name, (type_, value))
+
+def save_config_values():
+    _config_cache.flush()
 
 def get_host_info_strings(count):
     host_info_strings = []
@@ -145,3 +179,21 @@ def legacy_get_remember_secret():
 
 def legacy_set_remember_secret(remember):
     set_registry_value('RememberSecret', winreg.REG_DWORD, int(bool(remember)))
+
+def get_use_opengl_plots():
+    if DEFAULT_USE_OPENGL_PLOTS:
+        default = 1
+    else:
+        default = 0
+
+    value = get_registry_value('UseOpenGLPlots', default)
+
+    if value == 1:
+        return True
+    elif value == 0:
+        return False
+    else:
+        return DEFAULT_USE_OPENGL_PLOTS
+
+def set_use_opengl_plots(use):
+    set_registry_value('UseOpenGLPlots', winreg.REG_DWORD, int(bool(use)))
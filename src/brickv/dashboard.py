@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+"""
+brickv (Brick Viewer)
+
+dashboard.py: Live values of many devices at once
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public
+License along with this program; if not, write to the
+Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+Boston, MA 02111-1307, USA.
+"""
+
+import time
+import logging
+import threading
+
+try:
+    from queue import Queue
+except:
+    from Queue import Queue # Python 2 fallback
+
+from PyQt4.QtCore import Qt, QObject, QTimer, pyqtSignal
+from PyQt4.QtGui import QDialog, QFrame, QLabel, QComboBox, QPushButton, QToolButton, \
+                        QScrollArea, QWidget, QGridLayout, QVBoxLayout, QHBoxLayout, QFont
+
+from brickv import infos
+from brickv.bindings import ip_connection
+from brickv.bindings.ip_connection import IPConnection
+from brickv.data_logger import DATA_SOURCES, DEVICE_CLASSES, read_sources
+from brickv.plot_widget import PlotWidget
+
+POLL_INTERVAL = 500 # ms
+POLL_THREAD_COUNT = 4
+TILE_COLUMN_COUNT = 4
+
+class DashboardPoller(QObject):
+    """
+    Reads the values of the tiles with a few worker threads. The devices
+    connected to the same Brick are read as one batch by one thread, a new
+    batch for a Brick is only queued after its previous one finished.
+    """
+
+    qtcb_values = pyqtSignal(str, object, float)
+    qtcb_error = pyqtSignal(str)
+
+    def __init__(self):
+        QObject.__init__(self)
+
+        self.queue = Queue()
+        self.pending_bricks = set()
+        self.pending_lock = threading.Lock()
+
+        for i in range(POLL_THREAD_COUNT):
+            thread = threading.Thread(target=self.loop)
+            thread.daemon = True
+            thread.start()
+
+    # batch is a list of (uid, device, sources) tuples
+    def poll(self, brick_uid, batch):
+        with self.pending_lock:
+            if brick_uid in self.pending_bricks:
+                return
+
+            self.pending_bricks.add(brick_uid)
+
+        self.queue.put((brick_uid, batch))
+
+    def loop(self):
+        while True:
+            brick_uid, batch = self.queue.get()
+
+            try:
+                for uid, device, sources in batch:
+                    try:
+                        values = read_sources(device, sources)
+                    except ip_connection.Error:
+                        self.qtcb_error.emit(uid)
+                        continue
+
+                    self.qtcb_values.emit(uid, values, time.time())
+            except:
+                logging.exception('Error while polling dashboard values')
+            finally:
+                with self.pending_lock:
+                    self.pending_bricks.discard(brick_uid)
+
+class DashboardTile(QFrame):
+    def __init__(self, uid, source, title, remove_handler, parent):
+        QFrame.__init__(self, parent)
+
+        self.uid = uid
+        self.source = source
+
+        self.setFrameShape(QFrame.StyledPanel)
+
+        label_title = QLabel(title, self)
+        label_title.setWordWrap(True)
+
+        button_clear = QToolButton(self)
+        button_clear.setText('Clear')
+
+        button_remove = QToolButton(self)
+        button_remove.setText('Remove')
+        button_remove.clicked.connect(lambda: remove_handler(self))
+
+        font = QFont()
+        font.setPointSize(16)
+
+        self.label_value = QLabel('-', self)
+        self.label_value.setFont(font)
+
+        self.plot_widget = PlotWidget(source.unit, [['', Qt.red, None]], clear_button=button_clear,
+                                      parent=self, scales_visible=False)
+        self.plot_widget.setMinimumSize(200, 120)
+        self.plot_widget.stop = False
+
+        header_layout = QHBoxLayout()
+        header_layout.addWidget(label_title, 1)
+        header_layout.addWidget(button_clear)
+        header_layout.addWidget(button_remove)
+
+        layout = QVBoxLayout(self)
+        layout.addLayout(header_layout)
+        layout.addWidget(self.label_value)
+        layout.addWidget(self.plot_widget, 1)
+
+    # tiles scrolled out of the view are not polled
+    def is_in_view(self):
+        return self.isVisible() and not self.visibleRegion().isEmpty()
+
+    def set_value(self, value, timestamp):
+        value = value / self.source.divisor
+
+        self.label_value.setText(u'{0:.2f} {1}'.format(value, self.source.unit))
+        self.plot_widget.push_samples(0, [timestamp], [value])
+
+    def set_error(self):
+        self.label_value.setText('Timeout')
+
+    def set_disconnected(self):
+        self.label_value.setText('Disconnected')
+
+class DashboardWindow(QDialog):
+    def __init__(self, parent, ipcon):
+        QDialog.__init__(self, parent)
+
+        self.setWindowTitle('Dashboard')
+        self.resize(1000, 700)
+
+        self.ipcon = ipcon
+        self.tiles = [] # DashboardTile, in display order
+        self.tiles_by_uid = {} # uid -> list of DashboardTile
+        self.available_sources = [] # (uid, source, title) per combo item
+        self.poller = DashboardPoller()
+        self.poller.qtcb_values.connect(self.cb_values)
+        self.poller.qtcb_error.connect(self.cb_error)
+
+        self.combo_source = QComboBox(self)
+        self.button_add = QPushButton('Add', self)
+        self.button_add_all = QPushButton('Add All', self)
+
+        self.button_add.clicked.connect(self.add_clicked)
+        self.button_add_all.clicked.connect(self.add_all_clicked)
+
+        self.tile_container = QWidget()
+        self.tile_layout = QGridLayout(self.tile_container)
+        self.tile_layout.setAlignment(Qt.AlignTop)
+
+        scroll_area = QScrollArea(self)
+        scroll_area.setWidgetResizable(True)
+        scroll_area.setWidget(self.tile_container)
+
+        source_layout = QHBoxLayout()
+        source_layout.addWidget(QLabel('Value:', self))
+        source_layout.addWidget(self.combo_source, 1)
+        source_layout.addWidget(self.button_add)
+        source_layout.addWidget(self.button_add_all)
+
+        layout = QVBoxLayout(self)
+        layout.addLayout(source_layout)
+        layout.addWidget(scroll_area, 1)
+
+        self.poll_timer = QTimer(self)
+        self.poll_timer.setInterval(POLL_INTERVAL)
+        self.poll_timer.timeout.connect(self.poll)
+
+        infos.get_infos_changed_signal().connect(self.update_sources)
+
+        self.update_sources()
+
+    # overrides QDialog.showEvent
+    def showEvent(self, event):
+        QDialog.showEvent(self, event)
+        self.poll_timer.start()
+
+    # overrides QDialog.hideEvent
+    def hideEvent(self, event):
+        QDialog.hideEvent(self, event)
+        self.poll_timer.stop()
+
+    # returns a list of (uid, source, title) tuples for all connected devices
+    def get_available_sources(self):
+        available = []
+
+        for info in infos.get_device_infos():
+            device_class = DEVICE_CLASSES.get(info.device_identifier)
+
+            if device_class == None:
+                continue
+
+            for source in DATA_SOURCES[device_class]:
+                available.append((info.uid, source, u'{0} [{1}] {2}'.format(info.name, info.uid, source.name)))
+
+        return available
+
+    def update_sources(self, *args):
+        self.combo_source.clear()
+
+        self.available_sources = self.get_available_sources()
+
+        for uid, source, title in self.available_sources:
+            self.combo_source.addItem(title)
+
+        enabled = self.combo_source.count() > 0
+
+        self.button_add.setEnabled(enabled)
+        self.button_add_all.setEnabled(enabled)
+
+        for tile in self.tiles:
+            if infos.get_info(tile.uid) == None:
+                tile.set_disconnected()
+
+    def has_tile(self, uid, source):
+        for tile in self.tiles_by_uid.get(uid, []):
+            if tile.source == source:
+                return True
+
+        return False
+
+    def add_tile(self, uid, source, title):
+        if self.has_tile(uid, source):
+            return
+
+        tile = DashboardTile(uid, source, title, self.remove_tile, self.tile_container)
+        count = len(self.tiles)
+
+        self.tiles.append(tile)
+        self.tiles_by_uid.setdefault(uid, []).append(tile)
+        self.tile_layout.addWidget(tile, count // TILE_COLUMN_COUNT, count % TILE_COLUMN_COUNT)
+
+    def remove_tile(self, tile):
+        self.tiles.remove(tile)
+        self.tiles_by_uid[tile.uid].remove(tile)
+
+        if len(self.tiles_by_uid[tile.uid]) == 0:
+            del self.tiles_by_uid[tile.uid]
+
+        # refill the grid to close the gap
+        for other in self.tiles:
+            self.tile_layout.removeWidget(other)
+
+        self.tile_layout.removeWidget(tile)
+        tile.hide()
+        tile.setParent(None)
+
+        for i, other in enumerate(self.tiles):
+            self.tile_layout.addWidget(other, i // TILE_COLUMN_COUNT, i % TILE_COLUMN_COUNT)
+
+    def add_clicked(self):
+        index = self.combo_source.currentIndex()
+
+        if index < 0:
+            return
+
+        self.add_tile(*self.available_sources[index])
+
+    def add_all_clicked(self):
+        for uid, source, title in self.get_available_sources():
+            self.add_tile(uid, source, title)
+
+    def poll(self):
+        if self.ipcon.get_connection_state() != IPConnection.CONNECTION_STATE_CONNECTED:
+            return
+
+        batches = {} # brick uid -> {uid -> (device, sources)}
+
+        for tile in self.tiles:
+            if not tile.is_in_view():
+                continue
+
+            info = infos.get_info(tile.uid)
+
+            if info == None or info.plugin == None:
+                continue
+
+            device_batch = batches.setdefault(info.connected_uid, {})
+
+            if tile.uid not in device_batch:
+                device_batch[tile.uid] = (info.plugin.device, [])
+
+            device_batch[tile.uid][1].append(tile.source)
+
+        for brick_uid, device_batch in batches.items():
+            self.poller.poll(brick_uid, [(uid, device, sources) for uid, (device, sources) in device_batch.items()])
+
+    def cb_values(self, uid, values, timestamp):
+        tiles = self.tiles_by_uid.get(uid, [])
+
+        for source, value in values:
+            for tile in tiles:
+                if tile.source == source:
+                    tile.set_value(value, timestamp)
+
+    def cb_error(self, uid):
+        for tile in self.tiles_by_uid.get(uid, []):
+            tile.set_error()
@@ -0,0 +1,419 @@
+# -*- coding: utf-8 -*-
+"""
+brickv (Brick Viewer)
+
+data_logger.py: Headless data logger for the values charted by the plugins
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public
+License along with this program; if not, write to the
+Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+Boston, MA 02111-1307, USA.
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+import threading
+from collections import namedtuple
+
+from brickv import config
+from brickv.time_series_log import TimeSeriesLogWriter
+from brickv.bindings import ip_connection
+from brickv.bindings.ip_connection import IPConnection
+from brickv.bindings.bricklet_ac_current import BrickletACCurrent
+from brickv.bindings.bricklet_accelerometer import BrickletAccelerometer
+from brickv.bindings.bricklet_ambient_light import BrickletAmbientLight
+from brickv.bindings.bricklet_ambient_light_v2 import BrickletAmbientLightV2
+from brickv.bindings.bricklet_analog_in import BrickletAnalogIn
+from brickv.bindings.bricklet_analog_in_v2 import BrickletAnalogInV2
+from brickv.bindings.bricklet_barometer import BrickletBarometer
+from brickv.bindings.bricklet_current12 import BrickletCurrent12
+from brickv.bindings.bricklet_current25 import BrickletCurrent25
+from brickv.bindings.bricklet_distance_ir import BrickletDistanceIR
+from brickv.bindings.bricklet_distance_us import BrickletDistanceUS
+from brickv.bindings.bricklet_gas_detector import BrickletGasDetector
+from brickv.bindings.bricklet_heart_rate import BrickletHeartRate
+from brickv.bindings.bricklet_humidity import BrickletHumidity
+from brickv.bindings.bricklet_industrial_dual_0_20ma import BrickletIndustrialDual020mA
+from brickv.bindings.bricklet_industrial_dual_analog_in import BrickletIndustrialDualAnalogIn
+from brickv.bindings.bricklet_laser_range_finder import BrickletLaserRangeFinder
+from brickv.bindings.bricklet_line import BrickletLine
+from brickv.bindings.bricklet_linear_poti import BrickletLinearPoti
+from brickv.bindings.bricklet_load_cell import BrickletLoadCell
+from brickv.bindings.bricklet_moisture import BrickletMoisture
+from brickv.bindings.bricklet_ptc import BrickletPTC
+from brickv.bindings.bricklet_rotary_poti import BrickletRotaryPoti
+from brickv.bindings.bricklet_sound_intensity import BrickletSoundIntensity
+from brickv.bindings.bricklet_temperature import BrickletTemperature
+from brickv.bindings.bricklet_temperature_ir import BrickletTemperatureIR
+from brickv.bindings.bricklet_voltage import BrickletVoltage
+from brickv.bindings.bricklet_voltage_current import BrickletVoltageCurrent
+
+DEFAULT_PERIOD = 1.0 # seconds
+DEFAULT_CHUNK_LENGTH = 60 * 60 # seconds
+DEFAULT_MAX_CHUNK_COUNT = 31 * 24 # one month of one hour chunks
+FSYNC_INTERVAL = 5.0 # seconds
+CONNECT_RETRY_INTERVAL = 5.0 # seconds
+MAX_ERROR_COUNT = 3 # consecutive errors before a device is polled less often
+MAX_BACKOFF = 60.0 # seconds
+CHUNK_PREFIX = 'brickv-log-'
+CHUNK_SUFFIX = '.csv'
+
+# a value charted by a plugin: getter is the name of the device function,
+# args are passed to it, index selects an element of a tuple result and
+# the raw value is divided by divisor
+DataSource = namedtuple('DataSource', 'name unit getter args index divisor')
+
+def data_source(name, unit, getter, divisor=1.0, args=(), index=None):
+    return DataSource(name, unit, getter, args, index, float(divisor))
+
+# mirrors the PlotWidget curves of the plugins
+DATA_SOURCES = {
+    BrickletACCurrent: [data_source('Current', 'A', 'get_current', 1000)],
+    BrickletAccelerometer: [data_source('Acceleration X', 'G', 'get_acceleration', 1000, index=0),
+                            data_source('Acceleration Y', 'G', 'get_acceleration', 1000, index=1),
+                            data_source('Acceleration Z', 'G', 'get_acceleration', 1000, index=2)],
+    BrickletAmbientLight: [data_source('Illuminance', 'lx', 'get_illuminance', 10)],
+    BrickletAmbientLightV2: [data_source('Illuminance', 'lx', 'get_illuminance', 100)],
+    BrickletAnalogIn: [data_source('Voltage', 'mV', 'get_voltage')],
+    BrickletAnalogInV2: [data_source('Voltage', 'V', 'get_voltage', 1000)],
+    BrickletBarometer: [data_source('Air Pressure', 'mbar', 'get_air_pressure', 1000),
+                        data_source('Altitude', 'm', 'get_altitude', 100)],
+    BrickletCurrent12: [data_source('Current', 'mA', 'get_current')],
+    BrickletCurrent25: [data_source('Current', 'mA', 'get_current')],
+    BrickletDistanceIR: [data_source('Distance', 'cm', 'get_distance', 10)],
+    BrickletDistanceUS: [data_source('Distance', '', 'get_distance_value')],
+    BrickletGasDetector: [data_source('Value', '', 'get_value')],
+    BrickletHeartRate: [data_source('Heart Rate', 'BPM', 'get_heart_rate')],
+    BrickletHumidity: [data_source('Relative Humidity', '%RH', 'get_humidity', 10)],
+    BrickletIndustrialDual020mA: [data_source('Current Sensor 0', 'mA', 'get_current', 1000 * 1000, args=(0,)),
+                                  data_source('Current Sensor 1', 'mA', 'get_current', 1000 * 1000, args=(1,))],
+    BrickletIndustrialDualAnalogIn: [data_source('Voltage Channel 0', 'V', 'get_voltage', 1000, args=(0,)),
+                                     data_source('Voltage Channel 1', 'V', 'get_voltage', 1000, args=(1,))],
+    BrickletLaserRangeFinder: [data_source('Distance', 'cm', 'get_distance'),
+                               data_source('Velocity', 'm/s', 'get_velocity', 100)],
+    BrickletLine: [data_source('Reflectivity', '', 'get_reflectivity')],
+    BrickletLinearPoti: [data_source('Position', '', 'get_position')],
+    BrickletLoadCell: [data_source('Weight', 'g', 'get_weight')],
+    BrickletMoisture: [data_source('Moisture', '', 'get_moisture_value')],
+    BrickletPTC: [data_source('Temperature', u'°C', 'get_temperature', 100)],
+    BrickletRotaryPoti: [data_source('Position', '', 'get_position')],
+    BrickletSoundIntensity: [data_source('Intensity Value', '', 'get_intensity')],
+    BrickletTemperature: [data_source('Temperature', u'°C', 'get_temperature', 100)],
+    BrickletTemperatureIR: [data_source('Object Temperature', u'°C', 'get_object_temperature', 10),
+                            data_source('Ambient Temperature', u'°C', 'get_ambient_temperature', 10)],
+    BrickletVoltage: [data_source('Voltage', 'mV', 'get_voltage')],
+    BrickletVoltageCurrent: [data_source('Current', 'mA', 'get_current'),
+                             data_source('Voltage', 'mV', 'get_voltage'),
+                             data_source('Power', 'mW', 'get_power')]
+}
+
+DEVICE_CLASSES = dict((device_class.DEVICE_IDENTIFIER, device_class) for device_class in DATA_SOURCES)
+
+# returns a list of (source, raw value) tuples, can raise ip_connection.Error
+def read_sources(device, sources):
+    results = {}
+    values = []
+
+    for source in sources:
+        key = (source.getter, source.args)
+
+        # sources that share a getter are read with one call
+        if key not in results:
+            results[key] = getattr(device, source.getter)(*source.args)
+
+        value = results[key]
+
+        if source.index != None:
+            value = value[source.index]
+
+        values.append((source, value))
+
+    return values
+
+class LoggedDevice(object):
+    def __init__(self, device_class, uid, ipcon):
+        self.device = device_class(uid, ipcon)
+        self.uid = uid
+        self.name = device_class.DEVICE_DISPLAY_NAME
+        self.sources = DATA_SOURCES[device_class]
+        self.error_count = 0
+        self.next_poll = 0
+
+    def report_success(self):
+        if self.error_count >= MAX_ERROR_COUNT:
+            logging.info('{0} [{1}] is responsive again'.format(self.name, self.uid))
+
+        self.error_count = 0
+        self.next_poll = 0
+
+    # an unresponsive device is kept, but polled with an exponentially
+    # growing interval, so it doesn't stall the other devices with timeouts
+    def report_error(self, period):
+        self.error_count += 1
+
+        if self.error_count >= MAX_ERROR_COUNT:
+            if self.error_count == MAX_ERROR_COUNT:
+                logging.warn('{0} [{1}] is unresponsive, polling it less often'.format(self.name, self.uid))
+
+            exponent = min(self.error_count - MAX_ERROR_COUNT + 1, 16)
+            self.next_poll = time.time() + min(period * 2 ** exponent, MAX_BACKOFF)
+
+class ChunkedLogWriter(object):
+    """
+    Writes CSV rows into chunk files that are rotated every chunk_length
+    seconds. Only the newest max_chunk_count chunks are kept.
+    """
+
+    def __init__(self, directory, chunk_length, max_chunk_count):
+        self.directory = directory
+        self.chunk_length = chunk_length
+        self.max_chunk_count = max_chunk_count
+        self.f = None
+        self.chunk_start = None
+        self.last_sync = None
+
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+
+    def get_chunk_filenames(self):
+        filenames = [filename for filename in os.listdir(self.directory)
+                     if filename.startswith(CHUNK_PREFIX) and filename.endswith(CHUNK_SUFFIX)]
+
+        # the timestamp in the file name makes lexical order chronological
+        return sorted(filenames)
+
+    def rotate(self, now):
+        self.close()
+
+        self.chunk_start = now
+        filename = CHUNK_PREFIX + time.strftime('%Y%m%d-%H%M%S', time.localtime(now)) + CHUNK_SUFFIX
+        self.f = open(os.path.join(self.directory, filename), 'ab')
+        self.last_sync = now
+
+        if self.f.tell() == 0:
+            self.f.write('Time,UID,Device,Value Name,Value,Unit\n')
+
+        chunk_filenames = self.get_chunk_filenames()
+
+        for chunk_filename in chunk_filenames[:max(len(chunk_filenames) - self.max_chunk_count, 0)]:
+            try:
+                os.remove(os.path.join(self.directory, chunk_filename))
+            except OSError:
+                logging.exception('Could not remove old log chunk {0}'.format(chunk_filename))
+
+    def write(self, now, rows):
+        if self.f == None or now - self.chunk_start >= self.chunk_length:
+            self.rotate(now)
+
+        timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(now)) + '.{0:03d}'.format(int(now * 1000) % 1000)
+        lines = []
+
+        for uid, device_name, source, value in rows:
+            lines.append(u'{0},{1},{2},{3},{4!r},{5}\n'.format(timestamp, uid, device_name, source.name,
+                                                              value / source.divisor, source.unit).encode('utf-8'))
+
+        self.f.write(''.join(lines))
+
+        if now - self.last_sync >= FSYNC_INTERVAL:
+            self.f.flush()
+            os.fsync(self.f.fileno())
+            self.last_sync = now
+
+    def close(self):
+        if self.f != None:
+            self.f.flush()
+            os.fsync(self.f.fileno())
+            self.f.close()
+            self.f = None
+
+class TimeSeriesLogDataWriter(object):
+    """
+    Writes the raw values into an indexed time series log, one channel per
+    device value. The log is not rotated, it stays fast to seek through the
+    index regardless of its length.
+    """
+
+    def __init__(self, filename):
+        self.log_writer = TimeSeriesLogWriter(filename)
+        self.channels = {} # (uid, value name) -> channel id
+        self.last_sync = time.time()
+
+    def write(self, now, rows):
+        for uid, device_name, source, value in rows:
+            key = (uid, source.name)
+
+            if key not in self.channels:
+                name = u'{0} [{1}] {2}'.format(device_name, uid, source.name)
+                self.channels[key] = self.log_writer.get_channel(name, source.unit, source.divisor)
+
+            self.log_writer.append(self.channels[key], now, value)
+
+        if now - self.last_sync >= FSYNC_INTERVAL:
+            self.log_writer.flush()
+            self.last_sync = now
+
+    def close(self):
+        self.log_writer.close()
+
+class DataLogger(object):
+    """
+    Polls the values of all supported devices from a single thread. Devices
+    are added and removed by enumeration, therefore the number of threads
+    (this one plus the two IPConnection threads) does not depend on the
+    number of devices.
+    """
+
+    def __init__(self, host, port, secret, writer, period):
+        self.host = host
+        self.port = port
+        self.secret = secret
+        self.writer = writer
+        self.period = period
+        self.devices = {} # uid -> LoggedDevice
+        self.devices_lock = threading.Lock()
+        self.running = True
+
+        self.ipcon = IPConnection()
+        self.ipcon.register_callback(IPConnection.CALLBACK_ENUMERATE, self.cb_enumerate)
+        self.ipcon.register_callback(IPConnection.CALLBACK_CONNECTED, self.cb_connected)
+
+    def cb_connected(self, connect_reason):
+        if len(self.secret) > 0:
+            try:
+                self.ipcon.authenticate(self.secret)
+            except:
+                logging.exception('Could not authenticate')
+                return
+
+        # devices might have changed while the connection was lost
+        with self.devices_lock:
+            self.devices = {}
+
+        self.ipcon.enumerate()
+
+    def cb_enumerate(self, uid, connected_uid, position, hardware_version,
+                     firmware_version, device_identifier, enumeration_type):
+        with self.devices_lock:
+            if enumeration_type == IPConnection.ENUMERATION_TYPE_DISCONNECTED:
+                self.devices.pop(uid, None)
+            elif uid in self.devices:
+                # the device announced itself, poll it normally again
+                self.devices[uid].report_success()
+            elif device_identifier in DEVICE_CLASSES:
+                self.devices[uid] = LoggedDevice(DEVICE_CLASSES[device_identifier], uid, self.ipcon)
+
+                logging.info('Logging {0} [{1}]'.format(self.devices[uid].name, uid))
+
+    def connect(self):
+        while self.running:
+            try:
+                self.ipcon.connect(self.host, self.port)
+                return True
+            except:
+                logging.error('Could not connect to {0}:{1}, retrying in {2} seconds'
+                              .format(self.host, self.port, CONNECT_RETRY_INTERVAL))
+
+                time.sleep(CONNECT_RETRY_INTERVAL)
+
+        return False
+
+    def poll(self):
+        with self.devices_lock:
+            devices = self.devices.values()
+
+        rows = []
+        now = time.time()
+
+        for logged_device in devices:
+            if logged_device.next_poll > now:
+                continue
+
+            try:
+                for source, value in read_sources(logged_device.device, logged_device.sources):
+                    rows.append((logged_device.uid, logged_device.name, source, value))
+
+                logged_device.report_success()
+            except ip_connection.Error:
+                logged_device.report_error(self.period)
+
+        if len(rows) > 0:
+            self.writer.write(time.time(), rows)
+
+    def run(self):
+        if not self.connect():
+            return
+
+        next_poll = time.time()
+
+        try:
+            while self.running:
+                self.poll()
+
+                next_poll += self.period
+                delay = next_poll - time.time()
+
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    # polling took longer than the period, don't try to catch up
+                    next_poll = time.time()
+        finally:
+            self.writer.close()
+
+            try:
+                self.ipcon.disconnect()
+            except:
+                pass
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Log the values charted by Brick Viewer without GUI.')
+    parser.add_argument('--headless-log', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--host', default=config.DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=config.DEFAULT_PORT)
+    parser.add_argument('--secret', default=config.DEFAULT_SECRET)
+    parser.add_argument('--directory', default='.', help='directory for the log chunks')
+    parser.add_argument('--format', choices=['csv', 'tslog'], default='csv',
+                        help='rotated CSV chunks or one indexed time series log')
+    parser.add_argument('--tslog-file', default='brickv-log.tslog',
+                        help='time series log file name inside the directory, appended to if it exists')
+    parser.add_argument('--period', type=float, default=DEFAULT_PERIOD, help='polling period in seconds')
+    parser.add_argument('--chunk-length', type=int, default=DEFAULT_CHUNK_LENGTH, help='chunk length in seconds')
+    parser.add_argument('--max-chunk-count', type=int, default=DEFAULT_MAX_CHUNK_COUNT,
+                        help='number of chunks to keep, older ones are removed')
+
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.INFO)
+
+    if args.format == 'tslog':
+        if not os.path.exists(args.directory):
+            os.makedirs(args.directory)
+
+        writer = TimeSeriesLogDataWriter(os.path.join(args.directory, args.tslog_file))
+    else:
+        writer = ChunkedLogWriter(args.directory, args.chunk_length, max(args.max_chunk_count, 1))
+
+    data_logger = DataLogger(args.host, args.port, args.secret, writer, max(args.period, 0.01))
+
+    try:
+        data_logger.run()
+    except KeyboardInterrupt:
+        data_logger.running = False
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
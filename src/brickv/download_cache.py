@@ -0,0 +1,358 @@
+# -*- coding: utf-8 -*-
+"""
+brickv (Brick Viewer)
+
+download_cache.py: Local cache of firmwares, plugins and IMU calibrations
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public
+License along with this program; if not, write to the
+Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+Boston, MA 02111-1307, USA.
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import logging
+import urllib2
+import zipfile
+import threading
+
+from brickv.config_cache import write_file_atomically
+
+LATEST_VERSIONS_URL = 'http://download.tinkerforge.com/latest_versions.txt'
+FIRMWARE_URL = 'http://download.tinkerforge.com/firmwares/'
+
+LATEST_VERSIONS_KEY = 'latest_versions'
+BUNDLE_INDEX_NAME = 'index.json'
+
+def get_cache_path():
+    if sys.platform == 'win32':
+        return os.path.join(os.getenv('LOCALAPPDATA', os.path.expanduser('~')), 'Tinkerforge', 'Brickv', 'Cache')
+    elif sys.platform == 'darwin':
+        return os.path.expanduser('~/Library/Caches/com.tinkerforge.brickv')
+    else:
+        xdg_cache_home = os.getenv('XDG_CACHE_HOME')
+
+        if xdg_cache_home is None or len(xdg_cache_home) < 1:
+            xdg_cache_home = os.path.expanduser('~/.cache')
+
+        return os.path.join(xdg_cache_home, 'Tinkerforge', 'brickv')
+
+# kind is 'bricks' or 'bricklets'
+def get_firmware_key(kind, url_part, version):
+    return '{0}/{1}/{2}.{3}.{4}'.format(kind, url_part, *version)
+
+def get_imu_calibration_key(uid):
+    return 'imu_calibration/' + uid
+
+class DownloadCache(object):
+    """
+    Content-addressed store of downloaded files. The files are stored by
+    their SHA-256 under objects/, the index maps keys like
+    bricklets/temperature/2.0.3 to the SHA-256 and the URL the file was
+    downloaded from. The checksum of a file is checked on every read, a
+    broken file is removed from the cache.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.objects_path = os.path.join(path, 'objects')
+        self.index_filename = os.path.join(path, BUNDLE_INDEX_NAME)
+        self.lock = threading.RLock()
+        self.index = None
+
+    # internal
+    def get_index(self):
+        if self.index == None:
+            try:
+                with open(self.index_filename, 'rb') as f:
+                    self.index = json.load(f)
+            except IOError:
+                self.index = {}
+            except ValueError:
+                logging.warn('Download cache index is broken, starting with an empty one')
+                self.index = {}
+
+        return self.index
+
+    # internal
+    def save_index(self):
+        data = json.dumps(self.index, indent=1, sort_keys=True)
+
+        write_file_atomically(self.index_filename, lambda f: f.write(data))
+
+    def has(self, key):
+        with self.lock:
+            return key in self.get_index()
+
+    def keys(self):
+        with self.lock:
+            return list(self.get_index().keys())
+
+    def get(self, key):
+        with self.lock:
+            entry = self.get_index().get(key)
+
+            if entry == None:
+                return None
+
+            try:
+                with open(os.path.join(self.objects_path, entry['sha256']), 'rb') as f:
+                    data = f.read()
+            except IOError:
+                data = None
+
+            if data == None or hashlib.sha256(data).hexdigest() != entry['sha256']:
+                logging.warn('Removing broken entry {0} from the download cache'.format(key))
+
+                del self.index[key]
+                self.save_index()
+
+                return None
+
+            return data
+
+    def put(self, key, data, url=None):
+        sha256 = hashlib.sha256(data).hexdigest()
+        filename = os.path.join(self.objects_path, sha256)
+
+        with self.lock:
+            if not os.path.exists(filename):
+                write_file_atomically(filename, lambda f: f.write(data))
+
+            self.get_index()[key] = {'sha256': sha256, 'size': len(data), 'url': url, 'time': time.time()}
+            self.save_index()
+
+    # like put, but a cache that cannot be written is only logged. a download
+    # is still usable if it cannot be cached
+    def try_put(self, key, data, url=None):
+        try:
+            self.put(key, data, url)
+        except:
+            logging.exception('Could not put {0} into the download cache'.format(key))
+
+    # returns the versions of url_part that are in the cache
+    def get_versions(self, kind, url_part):
+        prefix = '{0}/{1}/'.format(kind, url_part)
+        versions = []
+
+        for key in self.keys():
+            if key.startswith(prefix):
+                try:
+                    versions.append(tuple(map(int, key[len(prefix):].split('.'))))
+                except ValueError:
+                    pass
+
+        return versions
+
+    # writes all cached files into a zip file that can be imported on a
+    # computer without internet access
+    def export_bundle(self, filename):
+        with self.lock:
+            index = dict(self.get_index())
+
+        bundle = zipfile.ZipFile(filename, 'w', zipfile.ZIP_DEFLATED)
+
+        try:
+            written = set()
+
+            for key in list(index.keys()):
+                data = self.get(key)
+
+                if data == None:
+                    del index[key]
+                    continue
+
+                sha256 = index[key]['sha256']
+
+                if sha256 not in written:
+                    bundle.writestr('objects/' + sha256, data)
+                    written.add(sha256)
+
+            bundle.writestr(BUNDLE_INDEX_NAME, json.dumps(index, indent=1, sort_keys=True))
+        finally:
+            bundle.close()
+
+        return len(index)
+
+    # imports the files of a bundle written by export_bundle, files with a
+    # wrong checksum are skipped. returns the number of imported files
+    def import_bundle(self, filename):
+        bundle = zipfile.ZipFile(filename, 'r')
+        count = 0
+
+        try:
+            index = json.loads(bundle.read(BUNDLE_INDEX_NAME))
+
+            for key, entry in index.items():
+                try:
+                    data = bundle.read('objects/' + entry['sha256'])
+                except KeyError:
+                    continue
+
+                if hashlib.sha256(data).hexdigest() != entry['sha256']:
+                    logging.warn('Skipping broken entry {0} of offline bundle'.format(key))
+                    continue
+
+                self.put(key, data, entry.get('url'))
+                count += 1
+        finally:
+            bundle.close()
+
+        return count
+
+if '_download_cache' not in globals():
+    _download_cache = None
+
+def get_download_cache():
+    global _download_cache
+
+    if _download_cache == None:
+        _download_cache = DownloadCache(get_cache_path())
+
+    return _download_cache
+
+# report_progress gets the number of downloaded bytes and the total length
+def download(url, report_progress=None, chunk_size=1024):
+    response = urllib2.urlopen(url, timeout=10)
+
+    try:
+        try:
+            length = int(response.headers['Content-Length'])
+        except (KeyError, ValueError):
+            length = 0
+
+        chunks = []
+        received = 0
+        chunk = response.read(chunk_size)
+
+        while len(chunk) > 0:
+            chunks.append(chunk)
+            received += len(chunk)
+
+            if report_progress != None:
+                report_progress(received, length)
+
+            chunk = response.read(chunk_size)
+
+        # a connection that closes early ends the download like a complete one
+        if length > 0 and received != length:
+            raise urllib2.URLError('Incomplete download of {0}: received {1} of {2} bytes'.format(url, received, length))
+
+        return ''.join(chunks)
+    finally:
+        response.close()
+
+# returns the latest_versions.txt content and True if it comes from the
+# cache because tinkerforge.com is not reachable. raises urllib2.URLError if
+# it is neither reachable nor cached
+def download_latest_versions():
+    cache = get_download_cache()
+
+    try:
+        data = download(LATEST_VERSIONS_URL)
+    except urllib2.URLError:
+        data = cache.get(LATEST_VERSIONS_KEY)
+
+        if data == None:
+            raise
+
+        return data, True
+
+    cache.try_put(LATEST_VERSIONS_KEY, data, LATEST_VERSIONS_URL)
+
+    return data, False
+
+# returns a Brick firmware or Bricklet plugin from the cache or downloads it,
+# also trying the beta versions. returns None if it is not available
+def download_firmware(kind, url_part, version, report_progress=None):
+    cache = get_download_cache()
+    key = get_firmware_key(kind, url_part, version)
+    data = cache.get(key)
+
+    if data != None:
+        return data
+
+    prefix = kind[:-1] # brick or bricklet
+    urls = [FIRMWARE_URL + '{0}/{1}/{2}_{1}_firmware_{3}_{4}_{5}.bin'.format(kind, url_part, prefix, *version)]
+
+    for beta in range(5, 0, -1):
+        urls.append(FIRMWARE_URL + '{0}/{1}/{2}_{1}_firmware_{4}_{5}_{6}_beta{3}.bin'.format(kind, url_part, prefix, beta, *version))
+
+    for url in urls:
+        try:
+            data = download(url, report_progress)
+        except urllib2.URLError:
+            continue
+
+        cache.try_put(key, data, url)
+
+        return data
+
+    return None
+
+class Prefetcher(object):
+    """
+    Downloads firmwares and plugins into the cache in a background thread.
+    """
+
+    def __init__(self):
+        self.queue = []
+        self.lock = threading.Lock()
+        self.thread = None
+
+    # items is a list of (kind, url_part, version) tuples
+    def prefetch(self, items):
+        with self.lock:
+            self.queue += items
+
+            if self.thread == None:
+                self.thread = threading.Thread(target=self.loop)
+                self.thread.daemon = True
+                self.thread.start()
+
+    def loop(self):
+        while True:
+            with self.lock:
+                if len(self.queue) == 0:
+                    self.thread = None
+                    return
+
+                kind, url_part, version = self.queue.pop(0)
+
+            try:
+                download_firmware(kind, url_part, version)
+            except:
+                logging.exception('Could not prefetch {0}'.format(get_firmware_key(kind, url_part, version)))
+
+if '_prefetcher' not in globals():
+    _prefetcher = Prefetcher()
+
+# latest is a list of (kind, url_part, version) tuples. only firmwares and
+# plugins that were used before, i.e. an older version of them is cached,
+# are prefetched
+def prefetch_newer_versions(latest):
+    cache = get_download_cache()
+    items = []
+
+    for kind, url_part, version in latest:
+        versions = cache.get_versions(kind, url_part)
+
+        if len(versions) > 0 and max(versions) < version:
+            items.append((kind, url_part, version))
+
+    if len(items) > 0:
+        _prefetcher.prefetch(items)
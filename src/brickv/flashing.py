@@ -24,29 +24,34 @@ Boston, MA 02111-1307, USA.
 """
 
 from brickv.ui_flashing import Ui_Flashing
-from brickv.bindings.ip_connection import IPConnection, Error, base58encode, \
+from brickv.bindings.ip_connection import Error, base58encode, \
                                           base58decode, BASE58, uid64_to_uid32
 from brickv.imu_calibration import parse_imu_calibration, IMU_CALIBRATION_URL
-from PyQt4.QtCore import Qt, QTimer
+from PyQt4.QtCore import Qt, QTimer, QEventLoop
 from PyQt4.QtGui import QApplication, QColor, QDialog, QMessageBox, \
                         QProgressDialog, QStandardItemModel, QStandardItem, QBrush
-from brickv.samba import SAMBA, SAMBAException, SAMBARebootError, get_serial_ports
+from brickv.samba import SAMBA, SAMBAException, SAMBARebootError
+from brickv.batch_flashing import BatchFlashingWindow
+from brickv.plugin_transfer import PluginTransfer
+from brickv.bricklet_updater import BrickletUpdater, plan_bricklet_updates
+from brickv.serial_port_monitor import SerialPortMonitor, looks_like_bootloader_port, is_bootloader_port
+from brickv.download_cache import FIRMWARE_URL, LATEST_VERSIONS_KEY, get_download_cache, get_imu_calibration_key, \
+                                  download, download_latest_versions, download_firmware, prefetch_newer_versions
 from brickv.infos import get_version_string
-from brickv.utils import get_main_window, get_home_path, get_open_file_name
+from brickv.utils import get_main_window, get_home_path, get_open_file_name, get_save_file_name
 from brickv import infos
 
 import os
 import urllib2
-import time
 import struct
+import logging
 from serial import SerialException
 
-LATEST_VERSIONS_URL = 'http://download.tinkerforge.com/latest_versions.txt'
-FIRMWARE_URL = 'http://download.tinkerforge.com/firmwares/'
 SELECT = 'Select...'
 CUSTOM = 'Custom...'
 NO_BRICK = 'No Brick found'
 NO_BOOTLOADER = 'No Brick in Bootloader found'
+AUTO_FLASH_DELAY = 1000 # ms, Bricks plugged in together are flashed together
 
 def error_to_name(e):
     if e.value == Error.TIMEOUT:
@@ -60,6 +65,12 @@ def error_to_name(e):
     else:
         return e.message
 
+def plugin_transfer_error_to_text(e):
+    if e.error != None:
+        return e.message + ': ' + error_to_name(e.error)
+    else:
+        return e.message
+
 class ProgressWrapper(object):
     def __init__(self, progress):
         self.progress = progress
@@ -91,12 +102,18 @@ class FlashingWindow(QDialog, Ui_Flashing):
         self.plugin_infos = {}
         self.brick_infos = []
         self.refresh_updates_pending = False
+        self.latest_versions_from_cache = False
+        self.auto_flash_port_names = set()
+        self.serial_port_monitor = SerialPortMonitor()
 
         self.parent = parent
+        self.serial_port_monitor.ports_changed.connect(self.serial_ports_changed)
+        self.serial_port_monitor.bootloader_ports_added.connect(self.bootloader_ports_added)
         self.tab_widget.currentChanged.connect(self.tab_changed)
         self.button_serial_port_refresh.clicked.connect(self.refresh_serial_ports)
         self.combo_firmware.currentIndexChanged.connect(self.firmware_changed)
         self.button_firmware_save.clicked.connect(self.firmware_save_clicked)
+        self.button_firmware_save_all.clicked.connect(self.firmware_save_all_clicked)
         self.button_firmware_browse.clicked.connect(self.firmware_browse_clicked)
         self.button_uid_load.clicked.connect(self.uid_load_clicked)
         self.button_uid_save.clicked.connect(self.uid_save_clicked)
@@ -111,7 +128,7 @@ class FlashingWindow(QDialog, Ui_Flashing):
         self.update_tool_label.hide()
         self.no_connection_label.hide()
 
-        self.refresh_serial_ports()
+        self.serial_ports_changed([])
 
         self.combo_firmware.addItem(CUSTOM)
         self.combo_firmware.setDisabled(True)
@@ -131,6 +148,8 @@ class FlashingWindow(QDialog, Ui_Flashing):
 
         self.update_button_refresh.clicked.connect(self.refresh_updates_clicked)
         self.update_button_bricklets.clicked.connect(self.auto_update_bricklets_clicked)
+        self.update_button_export_bundle.clicked.connect(self.export_bundle_clicked)
+        self.update_button_import_bundle.clicked.connect(self.import_bundle_clicked)
 
         self.update_ui_state()
         self.update_bricks()
@@ -153,9 +172,7 @@ class FlashingWindow(QDialog, Ui_Flashing):
         okay = True
 
         try:
-            response = urllib2.urlopen(LATEST_VERSIONS_URL, timeout=10)
-            latest_versions_data = response.read()
-            response.close()
+            latest_versions_data, self.latest_versions_from_cache = download_latest_versions()
         except urllib2.URLError:
             okay = False
             progress.cancel()
@@ -207,6 +224,12 @@ class FlashingWindow(QDialog, Ui_Flashing):
                 elif parts[0] == 'bricklets':
                     self.refresh_plugin_info(parts[1], latest_version)
 
+        if okay and not self.latest_versions_from_cache:
+            latest = [('bricks', url_part, info.firmware_version_latest) for url_part, info in self.firmware_infos.items()] + \
+                     [('bricklets', url_part, info.firmware_version_latest) for url_part, info in self.plugin_infos.items()]
+
+            prefetch_newer_versions(latest)
+
         if okay:
             # update combo_firmware
             if len(self.firmware_infos) > 0:
@@ -328,52 +351,71 @@ class FlashingWindow(QDialog, Ui_Flashing):
     def popup_fail(self, title, message):
         QMessageBox.critical(self, title, message, QMessageBox.Ok)
 
+    # overrides QDialog.showEvent
+    def showEvent(self, event):
+        QDialog.showEvent(self, event)
+
+        self.serial_port_monitor.start()
+
+    # overrides QDialog.hideEvent
+    def hideEvent(self, event):
+        QDialog.hideEvent(self, event)
+
+        self.serial_port_monitor.stop()
+
     def refresh_serial_ports(self):
-        progress = self.create_progress_bar('Discovering')
+        self.serial_port_monitor.rescan()
+
+    def serial_ports_changed(self, ports):
         current_text = self.combo_serial_port.currentText()
+        preferred_index = None
+
         self.combo_serial_port.clear()
 
-        try:
-            progress.setLabelText('Discovering serial ports')
-            progress.setMaximum(0)
-            progress.setValue(0)
-            progress.show()
+        for port in ports:
+            if preferred_index is None and looks_like_bootloader_port(port):
+                preferred_index = self.combo_serial_port.count()
 
-            ports = get_serial_ports()
-        except:
-            progress.cancel()
+            if len(port[1]) > 0 and port[0] != port[1]:
+                self.combo_serial_port.addItem(u'{0} - {1}'.format(port[0], port[1]), port[0])
+            else:
+                self.combo_serial_port.addItem(port[0], port[0])
+
+        # keep the selection if the selected port is still there
+        current_index = self.combo_serial_port.findText(current_text)
+
+        if self.combo_serial_port.count() == 0:
             self.combo_serial_port.addItem(NO_BOOTLOADER)
-            self.update_ui_state()
-            self.popup_fail('Brick', 'Could not discover serial ports')
-        else:
-            preferred_index = None
-
-            for port in ports:
-                if preferred_index is None:
-                    if 'ttyACM' in port[0] or \
-                       'ttyUSB' in port[0] or \
-                       'usbmodemfd' in port[0] or \
-                       'AT91 USB to Serial Converter' in port[1] or \
-                       'GPS Camera Detect' in port[1]:
-                        preferred_index = self.combo_serial_port.count()
-
-                if len(port[1]) > 0 and port[0] != port[1]:
-                    self.combo_serial_port.addItem(u'{0} - {1}'.format(port[0], port[1]), port[0])
-                else:
-                    self.combo_serial_port.addItem(port[0], port[0])
+        elif current_index >= 0:
+            self.combo_serial_port.setCurrentIndex(current_index)
+        elif preferred_index is not None:
+            self.combo_serial_port.setCurrentIndex(preferred_index)
 
-            if self.combo_serial_port.count() == 0:
-                self.combo_serial_port.addItem(NO_BOOTLOADER)
-            elif preferred_index is not None:
-                self.combo_serial_port.setCurrentIndex(preferred_index)
-            else:
-                index = self.combo_serial_port.findText(current_text)
-                if index >= 0:
-                    self.combo_serial_port.setCurrentIndex(index)
+        self.update_ui_state()
 
-            self.update_ui_state()
+    def bootloader_ports_added(self, port_names):
+        if not self.checkbox_auto_flash.isChecked() or self.combo_firmware.currentText() == SELECT:
+            return
 
-        progress.cancel()
+        if len(self.auto_flash_port_names) == 0:
+            QTimer.singleShot(AUTO_FLASH_DELAY, self.auto_flash)
+
+        self.auto_flash_port_names.update(port_names)
+
+    def auto_flash(self):
+        # wait for a running flashing or an open message box
+        if QApplication.activeModalWidget() != None:
+            QTimer.singleShot(AUTO_FLASH_DELAY, self.auto_flash)
+            return
+
+        ports = self.serial_port_monitor.get_ports()
+        port_names = [port[0] for port in ports or [] if port[0] in self.auto_flash_port_names]
+
+        self.auto_flash_port_names = set()
+
+        if len(port_names) > 0 and self.isVisible() and self.checkbox_auto_flash.isChecked() and \
+           self.combo_firmware.currentText() != SELECT:
+            self.flash_all(port_names)
 
     def update_ui_state(self):
         is_firmware_select = self.combo_firmware.currentText() == SELECT
@@ -384,8 +426,10 @@ class FlashingWindow(QDialog, Ui_Flashing):
         self.combo_port.setEnabled(has_bricklet_ports)
         self.combo_plugin.setEnabled(has_bricklet_ports and self.combo_plugin.count() > 1)
         self.button_firmware_save.setEnabled(not is_firmware_select and not is_no_bootloader)
+        self.button_firmware_save_all.setEnabled(not is_firmware_select and not is_no_bootloader)
         self.edit_custom_firmware.setEnabled(is_firmware_custom)
         self.button_firmware_browse.setEnabled(is_firmware_custom)
+        self.checkbox_differential.setEnabled(not is_firmware_select and not is_no_bootloader)
         self.edit_uid.setEnabled(has_bricklet_ports)
         self.button_uid_load.setEnabled(has_bricklet_ports)
         self.button_uid_save.setEnabled(has_bricklet_ports)
@@ -414,34 +458,16 @@ class FlashingWindow(QDialog, Ui_Flashing):
         if len(filename) > 0:
             self.edit_custom_firmware.setText(filename)
 
-    def firmware_save_clicked(self):
-        port_name = self.combo_serial_port.itemData(self.combo_serial_port.currentIndex())
-
-        try:
-            samba = SAMBA(port_name)
-        except SAMBAException as e:
-            self.refresh_serial_ports()
-            self.popup_fail('Brick', 'Could not connect to Brick: {0}'.format(str(e)))
-            return
-        except SerialException as e:
-            self.refresh_serial_ports()
-            self.popup_fail('Brick', str(e)[0].upper() + str(e)[1:])
-            return
-        except:
-            self.refresh_serial_ports()
-            self.popup_fail('Brick', 'Could not connect to Brick')
-            return
-
-        progress = ProgressWrapper(self.create_progress_bar('Flashing'))
-        samba.progress = progress
+    # returns (firmware, name, version) for the selected firmware, name and
+    # version are None for a custom firmware. all three are None if the
+    # firmware could not be read or downloaded
+    def get_firmware(self, progress):
         current_text = self.combo_firmware.currentText()
-
-        # Get firmware
         name = None
         version = None
 
         if current_text == SELECT:
-            return
+            return None, None, None
         elif current_text == CUSTOM:
             firmware_file_name = self.edit_custom_firmware.text()
 
@@ -451,7 +477,7 @@ class FlashingWindow(QDialog, Ui_Flashing):
             except IOError:
                 progress.cancel()
                 self.popup_fail('Brick', 'Could not read firmware file')
-                return
+                return None, None, None
         else:
             url_part = self.combo_firmware.itemData(self.combo_firmware.currentIndex())
             name = self.firmware_infos[url_part].name
@@ -459,44 +485,46 @@ class FlashingWindow(QDialog, Ui_Flashing):
 
             progress.reset('Downloading {0} Brick firmware {1}.{2}.{3}'.format(name, *version), 0)
 
-            response = None
-
-            try:
-                response = urllib2.urlopen(FIRMWARE_URL + 'bricks/{0}/brick_{0}_firmware_{1}_{2}_{3}.bin'.format(url_part, *version), timeout=10)
-            except urllib2.URLError:
-                pass
+            def report_progress(value, maximum):
+                progress.setMaximum(maximum)
+                progress.update(value)
 
-            beta = 5
+            firmware = download_firmware('bricks', url_part, version, report_progress)
 
-            while response is None and beta > 0:
-                try:
-                    response = urllib2.urlopen(FIRMWARE_URL + 'bricks/{0}/brick_{0}_firmware_{2}_{3}_{4}_beta{1}.bin'.format(url_part, beta, *version), timeout=10)
-                except urllib2.URLError:
-                    beta -= 1
-
-            if response is None:
+            if firmware is None:
                 progress.cancel()
                 self.popup_fail('Brick', 'Could not download {0} Brick firmware {1}.{2}.{3}'.format(name, *version))
-                return
+                return None, None, None
 
-            try:
-                length = int(response.headers['Content-Length'])
-                progress.setMaximum(length)
-                progress.update(0)
-                QApplication.processEvents()
-                firmware = ''
-                chunk = response.read(1024)
-
-                while len(chunk) > 0:
-                    firmware += chunk
-                    progress.update(len(firmware))
-                    chunk = response.read(1024)
-
-                response.close()
-            except urllib2.URLError:
-                progress.cancel()
-                self.popup_fail('Brick', 'Could not download {0} Brick firmware {1}.{2}.{3}'.format(name, *version))
-                return
+        return firmware, name, version
+
+    def firmware_save_clicked(self):
+        port_name = self.combo_serial_port.itemData(self.combo_serial_port.currentIndex())
+
+        try:
+            samba = SAMBA(port_name)
+        except SAMBAException as e:
+            self.refresh_serial_ports()
+            self.popup_fail('Brick', 'Could not connect to Brick: {0}'.format(str(e)))
+            return
+        except SerialException as e:
+            self.refresh_serial_ports()
+            self.popup_fail('Brick', str(e)[0].upper() + str(e)[1:])
+            return
+        except:
+            self.refresh_serial_ports()
+            self.popup_fail('Brick', 'Could not connect to Brick')
+            return
+
+        progress = ProgressWrapper(self.create_progress_bar('Flashing'))
+        samba.progress = progress
+        current_text = self.combo_firmware.currentText()
+
+        # Get firmware
+        firmware, name, version = self.get_firmware(progress)
+
+        if firmware is None:
+            return
 
         # Get IMU UID
         imu_uid = None
@@ -529,28 +557,29 @@ class FlashingWindow(QDialog, Ui_Flashing):
             if result == QMessageBox.Yes:
                 progress.reset('Downloading factory calibration for IMU Brick', 0)
 
-                try:
-                    imu_calibration_text = ''
-                    response = urllib2.urlopen(IMU_CALIBRATION_URL + '{0}.txt'.format(imu_uid), timeout=10)
-                    chunk = response.read(1024)
-
-                    while len(chunk) > 0:
-                        imu_calibration_text += chunk
-                        chunk = response.read(1024)
-
-                    response.close()
-                except urllib2.HTTPError as e:
-                    if e.code == 404:
-                        imu_calibration_text = None
-                        self.popup_ok('IMU Brick', 'No factory calibration for IMU Brick [{0}] available'.format(imu_uid))
-                    else:
+                imu_calibration_key = get_imu_calibration_key(imu_uid)
+                imu_calibration_text = get_download_cache().get(imu_calibration_key)
+
+                if imu_calibration_text is None:
+                    imu_calibration_url = IMU_CALIBRATION_URL + '{0}.txt'.format(imu_uid)
+
+                    try:
+                        imu_calibration_text = download(imu_calibration_url)
+                    except urllib2.HTTPError as e:
+                        if e.code == 404:
+                            imu_calibration_text = None
+                            self.popup_ok('IMU Brick', 'No factory calibration for IMU Brick [{0}] available'.format(imu_uid))
+                        else:
+                            progress.cancel()
+                            self.popup_fail('IMU Brick', 'Could not download factory calibration for IMU Brick [{0}]'.format(imu_uid))
+                            return
+                    except urllib2.URLError:
                         progress.cancel()
                         self.popup_fail('IMU Brick', 'Could not download factory calibration for IMU Brick [{0}]'.format(imu_uid))
                         return
-                except urllib2.URLError:
-                    progress.cancel()
-                    self.popup_fail('IMU Brick', 'Could not download factory calibration for IMU Brick [{0}]'.format(imu_uid))
-                    return
+
+                    if imu_calibration_text is not None and len(imu_calibration_text) > 0:
+                        get_download_cache().try_put(imu_calibration_key, imu_calibration_text, imu_calibration_url)
 
                 if imu_calibration_text is not None:
                     if len(imu_calibration_text) == 0:
@@ -601,13 +630,16 @@ class FlashingWindow(QDialog, Ui_Flashing):
                                        message)
 
         try:
-            samba.flash(firmware, imu_calibration, lock_imu_calibration_pages)
+            samba.flash(firmware, imu_calibration, lock_imu_calibration_pages,
+                        self.checkbox_differential.isChecked())
+            logging.info(samba.format_write_timings())
             # close serial device before showing dialog, otherwise exchanging
             # the brick while the dialog is open will force it to show up as ttyACM1
             samba = None
             progress.cancel()
             report_result(True)
         except SAMBARebootError as e:
+            logging.info(samba.format_write_timings())
             samba = None
             progress.cancel()
             self.refresh_serial_ports()
@@ -628,6 +660,39 @@ class FlashingWindow(QDialog, Ui_Flashing):
             self.refresh_serial_ports()
             self.popup_fail('Brick', 'Could not flash Brick')
 
+    def firmware_save_all_clicked(self):
+        # other serial devices must not get the SAM-BA protocol written to them
+        port_names = [port[0] for port in self.serial_port_monitor.get_ports() or [] if is_bootloader_port(port)]
+
+        if len(port_names) == 0:
+            self.popup_fail('Brick', 'No Brick in bootloader mode found')
+            return
+
+        self.flash_all(port_names)
+
+    def flash_all(self, port_names):
+        progress = ProgressWrapper(self.create_progress_bar('Flashing'))
+        firmware, name, version = self.get_firmware(progress)
+
+        if firmware is None:
+            return
+
+        progress.cancel()
+
+        if name == 'IMU':
+            self.popup_fail('Brick', 'IMU Bricks have to be flashed one by one to restore their factory calibration')
+            return
+
+        if name != None:
+            title = '{0} Brick firmware {1}.{2}.{3}'.format(name, *version)
+        else:
+            title = 'custom firmware'
+
+        BatchFlashingWindow(self, port_names, firmware, title,
+                            self.checkbox_differential.isChecked()).exec_()
+
+        self.refresh_serial_ports()
+
     def uid_save_clicked(self):
         device, port = self.current_device_and_port()
         uid = self.edit_uid.text()
@@ -733,118 +798,55 @@ class FlashingWindow(QDialog, Ui_Flashing):
         progress.setMaximum(0)
         progress.show()
 
-        response = None
-
-        try:
-            response = urllib2.urlopen(FIRMWARE_URL + 'bricklets/{0}/bricklet_{0}_firmware_{1}_{2}_{3}.bin'.format(url_part, *version), timeout=10)
-        except urllib2.URLError:
-            pass
-
-        beta = 5
-
-        while response is None and beta > 0:
-            try:
-                response = urllib2.urlopen(FIRMWARE_URL + 'bricklets/{0}/bricklet_{0}_firmware_{2}_{3}_{4}_beta{1}.bin'.format(url_part, beta, *version), timeout=10)
-            except urllib2.URLError:
-                beta -= 1
-
-        if response is None:
-            progress.cancel()
-            if popup:
-                self.popup_fail('Bricklet', 'Could not download {0} Bricklet plugin {1}.{2}.{3}'.format(name, *version))
-            return None
-
-        try:
-            length = int(response.headers['Content-Length'])
-            progress.setMaximum(length)
-            progress.setValue(0)
+        def report_progress(value, maximum):
+            progress.setMaximum(maximum)
+            progress.setValue(value)
             QApplication.processEvents()
-            plugin = []
-            chunk = response.read(256)
 
-            while len(chunk) > 0:
-                plugin += map(ord, chunk) # Convert plugin to list of bytes
-                progress.setValue(len(plugin))
-                chunk = response.read(256)
+        data = download_firmware('bricklets', url_part, version, report_progress)
 
-            response.close()
-        except urllib2.URLError:
+        if data is None:
             progress.cancel()
             if popup:
                 self.popup_fail('Bricklet', 'Could not download {0} Bricklet plugin {1}.{2}.{3}'.format(name, *version))
             return None
 
+        plugin = map(ord, data) # Convert plugin to list of bytes
+
         return plugin
 
     def write_bricklet_plugin(self, plugin, device, port, name, progress, popup=True):
-        # Write
-        progress.setLabelText('Writing plugin: ' + name)
+        progress.setLabelText('Writing and verifying plugin: ' + name)
         progress.setMaximum(0)
         progress.setValue(0)
         progress.show()
 
-        plugin_chunks = []
-        offset = 0
-
-        while offset < len(plugin):
-            chunk = plugin[offset:offset + IPConnection.PLUGIN_CHUNK_SIZE]
+        transfer = PluginTransfer(self.parent.ipcon, device, port, plugin)
+        loop = QEventLoop()
+        result = {}
 
-            if len(chunk) < IPConnection.PLUGIN_CHUNK_SIZE:
-                chunk += [0] * (IPConnection.PLUGIN_CHUNK_SIZE - len(chunk))
+        def progress_changed(value, maximum):
+            progress.setMaximum(maximum)
+            progress.setValue(value)
 
-            plugin_chunks.append(chunk)
-            offset += IPConnection.PLUGIN_CHUNK_SIZE
+        def finished(error):
+            result['error'] = error
+            loop.quit()
 
-        progress.setMaximum(len(plugin_chunks))
+        transfer.progress_changed.connect(progress_changed)
+        transfer.finished.connect(finished)
+        transfer.start()
+        loop.exec_()
 
-        position = 0
-
-        for chunk in plugin_chunks:
-            try:
-                self.parent.ipcon.write_bricklet_plugin(device, port, position, chunk)
-            except Error as e:
-                progress.cancel()
-                if popup:
-                    self.popup_fail('Bricklet', 'Could not write Bricklet plugin: ' + error_to_name(e))
-                return False
-
-            position += 1
-            progress.setValue(position)
-
-            time.sleep(0.015)
-            QApplication.processEvents()
+        error = result['error']
 
-        time.sleep(0.1)
-
-        # Verify
-        progress.setLabelText('Verifying written plugin: ' + name)
-        progress.setMaximum(len(plugin_chunks))
-        progress.setValue(0)
-        progress.show()
-
-        time.sleep(0.1)
-        position = 0
-
-        for chunk in plugin_chunks:
-            try:
-                read_chunk = list(self.parent.ipcon.read_bricklet_plugin(device, port, position))
-            except Error as e:
-                progress.cancel()
-                if popup:
-                    self.popup_fail('Bricklet', 'Could not read Bricklet plugin back for verification: ' + error_to_name(e))
-                return False
-
-            if read_chunk != chunk:
-                progress.cancel()
-                if popup:
-                    self.popup_fail('Bricklet', 'Could not flash Bricklet plugin: Verification error')
-                return False
+        if error != None:
+            progress.cancel()
 
-            position += 1
-            progress.setValue(position)
+            if popup:
+                self.popup_fail('Bricklet', plugin_transfer_error_to_text(error))
 
-            time.sleep(0.015)
-            QApplication.processEvents()
+            return False
 
         return True
 
@@ -915,73 +917,101 @@ class FlashingWindow(QDialog, Ui_Flashing):
             self.edit_custom_plugin.setText(filename)
 
     def auto_update_bricklets_clicked(self):
-        def brick_for_bricklet(bricklet):
-            for device_info in infos.get_brick_infos():
-                if bricklet.position in device_info.bricklets and \
-                   device_info.bricklets[bricklet.position] == bricklet:
-                    return device_info
-
         progress = self.create_progress_bar('Auto-Updating Bricklets')
+        progress.setMaximum(0)
+        progress.show()
 
-        bricks_to_reset = set()
+        updater = BrickletUpdater(self.parent.ipcon, plan_bricklet_updates())
+        loop = QEventLoop()
+        result = {}
 
-        for device_info in infos.get_device_infos():
-            if device_info.type == 'bricklet':
-                if device_info.protocol_version == 2 and device_info.firmware_version_installed < device_info.firmware_version_latest:
-                    plugin = self.download_bricklet_plugin(progress, device_info.url_part, device_info.name, device_info.firmware_version_latest)
+        def progress_changed(label, value, maximum):
+            progress.setLabelText(label)
+            progress.setMaximum(maximum)
+            progress.setValue(value)
 
-                    if not plugin:
-                        progress.cancel()
-                        self.refresh_updates_clicked()
-                        return
+        def finished(error):
+            result['error'] = error
+            loop.quit()
 
-                    brick = brick_for_bricklet(device_info)
-                    if self.write_bricklet_plugin(plugin, brick.plugin.device, device_info.position, device_info.name, progress):
-                        bricks_to_reset.add(brick)
-                    else:
-                        progress.cancel()
-                        self.refresh_updates_clicked()
-                        return
-            elif device_info.type == 'brick':
-                for port in device_info.bricklets:
-                    if not device_info.bricklets[port]:
-                        continue
+        updater.progress_changed.connect(progress_changed)
+        updater.finished.connect(finished)
+        updater.start()
 
-                    if device_info.bricklets[port].protocol_version == 1 and \
-                       device_info.bricklets[port].firmware_version_installed < device_info.bricklets[port].firmware_version_latest:
-                        plugin = self.download_bricklet_plugin(progress, device_info.bricklets[port].url_part,
-                                                               device_info.bricklets[port].name,
-                                                               device_info.bricklets[port].firmware_version_latest)
+        if 'error' not in result:
+            loop.exec_()
 
-                        if not plugin:
-                            progress.cancel()
-                            self.refresh_updates_clicked()
-                            return
+        progress.cancel()
 
-                        brick = brick_for_bricklet(device_info.bricklets[port])
-                        if self.write_bricklet_plugin(plugin, brick.plugin.device, port, device_info.bricklets[port].name, progress):
-                            bricks_to_reset.add(brick)
-                        else:
-                            progress.cancel()
-                            self.refresh_updates_clicked()
-                            return
+        error = result['error']
 
-        for brick in bricks_to_reset:
-            try:
-                brick.plugin.device.reset()
-            except:
-                pass
+        if error != None:
+            self.popup_fail('Bricklet', plugin_transfer_error_to_text(error))
+            self.refresh_updates_clicked()
+
+    def export_bundle_clicked(self):
+        if len(self.firmware_infos) == 0 and len(self.plugin_infos) == 0:
+            self.popup_fail('Offline Bundle', 'No version information available, please refresh the updates first')
+            return
+
+        filename = get_save_file_name(get_main_window(), 'Save Offline Bundle',
+                                      os.path.join(get_home_path(), 'brickv_offline_bundle.zip'), '*.zip')
+
+        if len(filename) == 0:
+            return
+
+        items = [('bricks', info) for info in self.firmware_infos.values()] + \
+                [('bricklets', info) for info in self.plugin_infos.values()]
+        failed = []
 
-        progress.setLabelText('Waiting for Bricks to reset')
-        progress.setMaximum(400)
+        progress = self.create_progress_bar('Offline Bundle')
+        progress.setLabelText('Downloading firmwares and plugins')
+        progress.setMaximum(len(items))
         progress.setValue(0)
+        progress.show()
 
-        for i in range(400):
-            time.sleep(0.03)
-            progress.setValue(i)
+        for i, (kind, info) in enumerate(items):
+            if download_firmware(kind, info.url_part, info.firmware_version_latest) is None:
+                failed.append(info.name)
+
+            progress.setValue(i + 1)
+            QApplication.processEvents()
+
+        progress.setLabelText('Saving offline bundle')
+        progress.setMaximum(0)
+        QApplication.processEvents()
+
+        try:
+            count = get_download_cache().export_bundle(filename)
+        except (IOError, OSError) as e:
+            progress.cancel()
+            self.popup_fail('Offline Bundle', 'Could not save offline bundle: {0}'.format(e))
+            return
 
         progress.cancel()
 
+        message = 'Saved {0} files to offline bundle.'.format(count)
+
+        if len(failed) > 0:
+            message += '\n\nCould not download: ' + ', '.join(sorted(failed))
+
+        self.popup_ok('Offline Bundle', message)
+
+    def import_bundle_clicked(self):
+        filename = get_open_file_name(get_main_window(), 'Open Offline Bundle', get_home_path(), '*.zip')
+
+        if len(filename) == 0:
+            return
+
+        try:
+            count = get_download_cache().import_bundle(filename)
+        except Exception as e:
+            self.popup_fail('Offline Bundle', 'Could not import offline bundle: {0}'.format(e))
+            return
+
+        self.popup_ok('Offline Bundle', 'Imported {0} files from offline bundle.'.format(count))
+        self.refresh_updates_clicked()
+
     def tab_changed(self, i):
         if i == 0 and self.refresh_updates_pending:
             self.refresh_updates_clicked()
@@ -1034,10 +1064,16 @@ class FlashingWindow(QDialog, Ui_Flashing):
             urllib2.urlopen(FIRMWARE_URL, timeout=10).read()
             self.no_connection_label.hide()
         except urllib2.URLError:
-            okay = False
-            progress.cancel()
-            self.no_connection_label.show()
-            return
+            # without internet access the cached version information is shown
+            if get_download_cache().has(LATEST_VERSIONS_KEY):
+                self.no_connection_label.setText('Could not connect to tinkerforge.com, showing cached versions')
+                self.no_connection_label.show()
+            else:
+                okay = False
+                progress.cancel()
+                self.no_connection_label.setText('Could not connect to tinkerforge.com')
+                self.no_connection_label.show()
+                return
 
         if okay:
             self.refresh_latest_version_info(progress)
@@ -22,6 +22,8 @@ Free Software Foundation, Inc., 59 Temple Place - Suite 330,
 Boston, MA 02111-1307, USA.
 """
 
+import bisect
+
 from brickv import config
 from PyQt4.QtGui import QApplication
 
@@ -154,18 +156,110 @@ class BrickREDInfo(BrickInfo):
 def get_version_string(version_tuple):
     return '.'.join(map(str, version_tuple))
 
+class SortedInfos(object):
+    """
+    Infos sorted by name, kept in order by bisect on insert and remove
+    instead of sorting on every query.
+    """
+
+    def __init__(self):
+        self.keys = []
+        self.infos = []
+
+    def insert(self, key, info):
+        i = bisect.bisect_left(self.keys, key)
+
+        self.keys.insert(i, key)
+        self.infos.insert(i, info)
+
+    def remove(self, key):
+        i = bisect.bisect_left(self.keys, key)
+
+        if i < len(self.keys) and self.keys[i] == key:
+            del self.keys[i]
+            del self.infos[i]
+
+# the groups an info type is listed in
+GROUPS = {
+    'tool': ['all'],
+    'firmware': ['all'],
+    'plugin': ['all'],
+    'brick': ['all', 'device', 'brick'],
+    'bricklet': ['all', 'device', 'bricklet']
+}
+
 if not '_infos' in globals():
-    _infos = {UID_BRICKV: ToolInfo(), UID_BRICKD: ToolInfo()}
-    _infos[UID_BRICKV].name = 'Brick Viewer'
-    _infos[UID_BRICKV].firmware_version_installed = tuple(map(int, config.BRICKV_VERSION.split('.')))
-    _infos[UID_BRICKD].name = 'Brick Daemon'
+    _infos = {} # uid -> info
+    _sorted_infos = dict((group, SortedInfos()) for group in ['all', 'device', 'brick', 'bricklet'])
+    _children = {} # connected_uid -> {uid -> info}
+    _index_keys = {} # uid -> (sort key, connected_uid) the info is indexed with
+
+# internal
+def index_info(info):
+    sort_key = (info.name, info.uid)
+    connected_uid = getattr(info, 'connected_uid', None)
+
+    for group in GROUPS.get(info.type, ['all']):
+        _sorted_infos[group].insert(sort_key, info)
+
+    if connected_uid != None:
+        _children.setdefault(connected_uid, {})[info.uid] = info
+
+    _index_keys[info.uid] = (sort_key, connected_uid)
+
+    # link Bricklets and the Brick they are connected to, in whatever
+    # order they got enumerated
+    if info.type == 'bricklet':
+        parent = _infos.get(connected_uid)
+
+        if parent != None and parent.type == 'brick':
+            parent.bricklets[info.position] = info
+    elif info.type == 'brick':
+        for child in _children.get(info.uid, {}).values():
+            if child.type == 'bricklet':
+                info.bricklets[child.position] = child
+
+# internal
+def unindex_info(info):
+    sort_key, connected_uid = _index_keys.pop(info.uid)
+
+    for group in GROUPS.get(info.type, ['all']):
+        _sorted_infos[group].remove(sort_key)
+
+    if connected_uid != None:
+        children = _children.get(connected_uid)
+
+        if children != None:
+            children.pop(info.uid, None)
+
+            if len(children) == 0:
+                del _children[connected_uid]
+
+        parent = _infos.get(connected_uid)
+
+        if parent != None and parent.type == 'brick':
+            for port, bricklet in parent.bricklets.items():
+                if bricklet is info:
+                    parent.bricklets[port] = None
 
 def add_info(info):
+    if info.uid in _infos:
+        unindex_info(_infos[info.uid])
+
     _infos[info.uid] = info
+    index_info(info)
+
     get_infos_changed_signal().emit(info.uid, True)
 
+# has to be called if name, connected_uid or position of an added info changed
+def update_info(info):
+    unindex_info(info)
+    index_info(info)
+
 def remove_info(uid):
-    _infos.pop(uid)
+    info = _infos.pop(uid)
+    unindex_info(info)
+
     get_infos_changed_signal().emit(uid, False)
 
 def get_info(uid):
@@ -175,16 +269,34 @@ def get_info(uid):
         return None
 
 def get_infos():
-    return sorted(_infos.values(), key=lambda x: x.name)
+    return list(_sorted_infos['all'].infos)
 
 def get_device_infos():
-    return sorted([info for info in _infos.values() if info.type == 'brick' or info.type == 'bricklet'], key=lambda x: x.name)
+    return list(_sorted_infos['device'].infos)
 
 def get_brick_infos():
-    return sorted([info for info in _infos.values() if info.type == 'brick'], key=lambda x: x.name)
+    return list(_sorted_infos['brick'].infos)
 
 def get_bricklet_infos():
-    return sorted([info for info in _infos.values() if info.type == 'bricklet'], key=lambda x: x.name)
+    return list(_sorted_infos['bricklet'].infos)
+
+# returns the infos that report uid as their connected UID, sorted by name
+def get_child_infos(uid):
+    return sorted(_children.get(uid, {}).values(), key=lambda x: (x.name, x.uid))
+
+def get_parent_info(info):
+    return _infos.get(getattr(info, 'connected_uid', None))
 
 def get_infos_changed_signal():
     return QApplication.instance().infos_changed_signal
+
+if len(_infos) == 0:
+    for uid, name in [(UID_BRICKV, 'Brick Viewer'), (UID_BRICKD, 'Brick Daemon')]:
+        tool_info = ToolInfo()
+        tool_info.uid = uid
+        tool_info.name = name
+
+        _infos[uid] = tool_info
+        index_info(tool_info)
+
+    _infos[UID_BRICKV].firmware_version_installed = tuple(map(int, config.BRICKV_VERSION.split('.')))
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+brickv (Brick Viewer)
+
+log_viewer.py: Viewer for indexed time series logs
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public
+License along with this program; if not, write to the
+Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+Boston, MA 02111-1307, USA.
+"""
+
+import os
+
+from PyQt4.QtCore import Qt, QDateTime
+from PyQt4.QtGui import QDialog, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, \
+                        QListWidget, QListWidgetItem, QDateTimeEdit, QMessageBox, \
+                        QColor, QApplication
+
+from brickv.plot_widget import PlotWidget, HISTORY_SPANS
+from brickv.plot_data_writer import escape_csv
+from brickv.time_series_log import TimeSeriesLogReader
+from brickv.utils import get_main_window, get_home_path, get_open_file_name, get_save_file_name
+
+CURVE_COLORS = [Qt.red, Qt.darkGreen, Qt.blue, Qt.magenta, Qt.darkCyan, Qt.darkYellow, Qt.black]
+
+# long ranges are thinned block-wise to keep loading them responsive
+MAX_PLOT_BLOCK_COUNT = 500 # per channel
+
+class LogViewerWindow(QDialog):
+    def __init__(self, parent):
+        QDialog.__init__(self, parent)
+
+        self.setWindowTitle('Log Viewer')
+        self.resize(800, 600)
+
+        self.reader = None
+        self.plot_widget = None
+        self.last_filename = None
+
+        self.button_open = QPushButton('Open Log...', self)
+        self.label_filename = QLabel('No log opened', self)
+        self.list_channels = QListWidget(self)
+        self.edit_start = QDateTimeEdit(self)
+        self.edit_end = QDateTimeEdit(self)
+        self.button_show = QPushButton('Show', self)
+        self.button_export = QPushButton('Export CSV...', self)
+
+        for edit in [self.edit_start, self.edit_end]:
+            edit.setDisplayFormat('yyyy-MM-dd hh:mm:ss')
+            edit.setCalendarPopup(True)
+
+        self.list_channels.setMaximumHeight(120)
+
+        self.button_open.clicked.connect(self.open_clicked)
+        self.button_show.clicked.connect(self.show_clicked)
+        self.button_export.clicked.connect(self.export_clicked)
+
+        file_layout = QHBoxLayout()
+        file_layout.addWidget(self.button_open)
+        file_layout.addWidget(self.label_filename, 1)
+
+        range_layout = QHBoxLayout()
+        range_layout.addWidget(QLabel('From:', self))
+        range_layout.addWidget(self.edit_start)
+        range_layout.addWidget(QLabel('To:', self))
+        range_layout.addWidget(self.edit_end)
+        range_layout.addStretch(1)
+        range_layout.addWidget(self.button_show)
+        range_layout.addWidget(self.button_export)
+
+        self.plot_layout = QVBoxLayout()
+
+        layout = QVBoxLayout(self)
+        layout.addLayout(file_layout)
+        layout.addWidget(self.list_channels)
+        layout.addLayout(range_layout)
+        layout.addLayout(self.plot_layout, 1)
+
+        self.update_ui_state()
+
+    def update_ui_state(self):
+        has_log = self.reader != None
+
+        self.list_channels.setEnabled(has_log)
+        self.edit_start.setEnabled(has_log)
+        self.edit_end.setEnabled(has_log)
+        self.button_show.setEnabled(has_log)
+        self.button_export.setEnabled(has_log)
+
+    # overrides QDialog.closeEvent
+    def closeEvent(self, event):
+        self.close_log()
+        QDialog.closeEvent(self, event)
+
+    def close_log(self):
+        if self.reader != None:
+            self.reader.close()
+            self.reader = None
+
+        if self.plot_widget != None:
+            self.plot_widget.setParent(None)
+            self.plot_widget = None
+
+        self.list_channels.clear()
+        self.label_filename.setText('No log opened')
+        self.update_ui_state()
+
+    def open_clicked(self):
+        if self.last_filename != None:
+            last_dir = os.path.dirname(self.last_filename)
+        else:
+            last_dir = get_home_path()
+
+        filename = get_open_file_name(self, 'Open Log', last_dir, 'Time Series Logs (*.tslog);;All Files (*)')
+
+        if len(filename) == 0:
+            return
+
+        self.close_log()
+
+        try:
+            self.reader = TimeSeriesLogReader(filename)
+        except Exception as e:
+            QMessageBox.critical(get_main_window(), 'Log Viewer Error',
+                                 u'Could not open log {0}:\n\n{1}'.format(filename, e))
+            return
+
+        self.last_filename = filename
+        self.label_filename.setText(filename)
+
+        for channel in self.reader.channels:
+            item = QListWidgetItem(channel.name)
+            item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+            item.setCheckState(Qt.Unchecked)
+
+            self.list_channels.addItem(item)
+
+        first, last = self.reader.get_time_range()
+
+        if first != None:
+            self.edit_start.setDateTime(QDateTime.fromMSecsSinceEpoch(int(first * 1000)))
+            self.edit_end.setDateTime(QDateTime.fromMSecsSinceEpoch(int(last * 1000) + 1000))
+
+        self.update_ui_state()
+
+    def get_selected_channels(self):
+        channels = []
+
+        for i in range(self.list_channels.count()):
+            if self.list_channels.item(i).checkState() == Qt.Checked:
+                channels.append(self.reader.channels[i])
+
+        return channels
+
+    def get_range(self):
+        return self.edit_start.dateTime().toMSecsSinceEpoch() / 1000.0, \
+               self.edit_end.dateTime().toMSecsSinceEpoch() / 1000.0
+
+    def show_clicked(self):
+        channels = self.get_selected_channels()
+        start, end = self.get_range()
+
+        if len(channels) == 0 or end <= start:
+            return
+
+        if self.plot_widget != None:
+            self.plot_widget.setParent(None)
+            self.plot_widget = None
+
+        units = sorted(set([channel.unit for channel in channels]))
+        plots = []
+
+        for i, channel in enumerate(channels):
+            plots.append([channel.name, QColor(CURVE_COLORS[i % len(CURVE_COLORS)]), None])
+
+        self.plot_widget = PlotWidget(', '.join(units), plots, parent=self)
+        self.plot_layout.addWidget(self.plot_widget)
+
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+
+        try:
+            for c, channel in enumerate(channels):
+                xs, ys = self.reader.get_samples(channel, start, end, MAX_PLOT_BLOCK_COUNT)
+
+                self.plot_widget.load_samples(c, [x - start for x in xs], ys)
+        finally:
+            QApplication.restoreOverrideCursor()
+
+        # select the shortest time span that shows the whole range
+        span_index = len(HISTORY_SPANS) - 1
+
+        for i, (label, span) in enumerate(HISTORY_SPANS):
+            if span >= end - start:
+                span_index = i
+                break
+
+        self.plot_widget.span_combo.setCurrentIndex(span_index)
+        self.plot_widget.span_changed(span_index)
+
+    def export_clicked(self):
+        channels = self.get_selected_channels()
+        start, end = self.get_range()
+
+        if len(channels) == 0 or end <= start:
+            return
+
+        filename = get_save_file_name(self, 'Export Log', os.path.splitext(self.last_filename)[0] + '.csv',
+                                      'CSV Files (*.csv);;All Files (*)')
+
+        if len(filename) == 0:
+            return
+
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+
+        # the samples are streamed block by block, the selected range is
+        # never loaded completely
+        try:
+            with open(filename, 'wb') as f:
+                f.write('Time [s],Curve,Value\n')
+
+                for channel in channels:
+                    name = escape_csv(channel.name.encode('utf-8'))
+
+                    for xs, ys in self.reader.iter_samples(channel, start, end):
+                        f.write(''.join(['{0:.6f},{1},{2!r}\n'.format(xs[i], name, ys[i]) for i in xrange(len(xs))]))
+        except Exception as e:
+            QMessageBox.critical(get_main_window(), 'Log Viewer Error',
+                                 u'Could not export log to {0}:\n\n{1}'.format(filename, e))
+        finally:
+            QApplication.restoreOverrideCursor()
@@ -23,9 +23,8 @@ Free Software Foundation, Inc., 59 Temple Place - Suite 330,
 Boston, MA 02111-1307, USA.
 """
 
-import sip
-sip.setapi('QString', 2)
-sip.setapi('QVariant', 2)
+import time
+startup_time = time.time()
 
 import os
 import sys
@@ -59,11 +58,34 @@ if not 'brickv' in sys.modules:
         # directory named differently than 'brickv'
         sys.modules['brickv'] = __import__(tail, globals(), locals(), [], -1)
 
+if '--headless-log' in sys.argv:
+    # log the plotted values without GUI. this is checked before PyQt4, the
+    # main window and the plugins are imported, so they are not needed and
+    # don't take up memory of the long-running logger. the brickv script
+    # imports this module, therefore this is not limited to __main__
+    from brickv import config
+    from brickv import data_logger
+
+    logging.basicConfig(level=config.LOGGING_LEVEL,
+                        format=config.LOGGING_FORMAT,
+                        datefmt=config.LOGGING_DATEFMT)
+
+    sys.exit(data_logger.main(sys.argv[1:]))
+
+import sip
+sip.setapi('QString', 2)
+sip.setapi('QVariant', 2)
+
+# has to be started before the imports that it measures
+from brickv import startup_profiler
+startup_profiler.start(sys.argv, startup_time)
+
 from PyQt4.QtGui import QApplication, QIcon, QFont
 from PyQt4.QtCore import QEvent, pyqtSignal
 
 from brickv import config
 from brickv.mainwindow import MainWindow
+from brickv.ui_mainwindow import Ui_MainWindow
 from brickv.async_call import ASYNC_EVENT, async_event_handler
 from brickv.load_pixmap import load_pixmap
 
@@ -81,6 +103,8 @@ class BrickViewer(QApplication):
         self.object_creator_signal.connect(self.object_creator_slot)
         self.setWindowIcon(QIcon(load_pixmap('brickv-icon.png')))
 
+        self.first_paint_pending = startup_profiler.get_startup_profiler() != None
+
     def object_creator_slot(self, object_creator):
         object_creator.create()
 
@@ -88,6 +112,10 @@ class BrickViewer(QApplication):
         if event.type() > QEvent.User and event.type() == ASYNC_EVENT:
             async_event_handler()
 
+        if self.first_paint_pending and event.type() == QEvent.Paint:
+            self.first_paint_pending = False
+            startup_profiler.get_startup_profiler().first_paint(self)
+
         return QApplication.notify(self, receiver, event)
 
 def main():
@@ -105,10 +133,29 @@ def main():
         # https://bugreports.qt-project.org/browse/QTBUG-40833
         QFont.insertSubstitution('.Helvetica Neue DeskInterface', 'Helvetica Neue')
 
+    profiler = startup_profiler.get_startup_profiler()
+
+    if profiler != None:
+        profiler.imports_done()
+        profiler.wrap_config(config)
+        profiler.wrap(BrickViewer, '__init__', 'QApplication.__init__')
+        profiler.wrap(MainWindow, '__init__', 'MainWindow.__init__')
+        profiler.wrap(Ui_MainWindow, 'setupUi', 'MainWindow.setupUi (UI loading)')
+        profiler.wrap(MainWindow, 'cb_enumerate', 'MainWindow.cb_enumerate', 'first enumerate')
+
     brick_viewer = BrickViewer(argv)
     main_window = MainWindow()
     main_window.show()
-    sys.exit(brick_viewer.exec_())
+
+    if profiler != None:
+        profiler.add_event('main window shown')
+
+    exit_code = brick_viewer.exec_()
+
+    if profiler != None:
+        profiler.report()
+
+    sys.exit(exit_code)
 
 if __name__ == "__main__":
     main()
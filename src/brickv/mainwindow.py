@@ -33,6 +33,8 @@ from brickv.plugin_system.plugin_manager import PluginManager
 from brickv.bindings.ip_connection import IPConnection
 from brickv.flashing import FlashingWindow
 from brickv.advanced import AdvancedWindow
+from brickv.log_viewer import LogViewerWindow
+from brickv.dashboard import DashboardWindow
 from brickv.async_call import async_start_thread, async_next_session
 from brickv.bindings.brick_master import BrickMaster
 from brickv.bindings.brick_red import BrickRED
@@ -45,6 +47,14 @@ import sys
 import time
 import gc
 
+TREE_VIEW_UPDATE_DELAY = 50 # ms, collects the changes of an enumeration burst
+
+class TreeViewRow(object):
+    def __init__(self, parent_uid, items):
+        self.parent_uid = parent_uid # '' for top level rows
+        self.items = items
+        self.child_uids = set()
+
 class MainWindow(QMainWindow, Ui_MainWindow):
     qtcb_enumerate = pyqtSignal(str, str, 'char', type((0,)), type((0,)), int, int)
     qtcb_connected = pyqtSignal(int)
@@ -68,6 +78,15 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         self.tree_view.doubleClicked.connect(self.item_double_clicked)
         self.set_tree_view_defaults()
 
+        # the tree view is updated per UID, changes of an enumeration burst
+        # are collected and applied together
+        self.tree_view_rows = {} # uid -> TreeViewRow
+        self.tree_view_dirty_uids = set()
+        self.tree_view_update_timer = QTimer(self)
+        self.tree_view_update_timer.setSingleShot(True)
+        self.tree_view_update_timer.setInterval(TREE_VIEW_UPDATE_DELAY)
+        self.tree_view_update_timer.timeout.connect(self.apply_tree_view_updates)
+
         # Remove dummy tab
         self.tab_widget.removeTab(1)
 
@@ -92,6 +111,8 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         self.current_device_info = None
         self.flashing_window = None
         self.advanced_window = None
+        self.log_viewer_window = None
+        self.dashboard_window = None
         self.delayed_refresh_updates_timer = QTimer()
         self.delayed_refresh_updates_timer.timeout.connect(self.delayed_refresh_updates)
         self.delayed_refresh_updates_timer.setInterval(500)
@@ -105,6 +126,8 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         self.button_connect.clicked.connect(self.connect_clicked)
         self.button_flashing.clicked.connect(self.flashing_clicked)
         self.button_advanced.clicked.connect(self.advanced_clicked)
+        self.button_log_viewer.clicked.connect(self.log_viewer_clicked)
+        self.button_dashboard.clicked.connect(self.dashboard_clicked)
         self.plugin_manager = PluginManager()
 
         # host info
@@ -158,6 +181,7 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 
         self.update_current_host_info()
         config.set_host_infos(self.host_infos)
+        config.save_config_values()
 
         self.do_disconnect()
 
@@ -344,6 +368,18 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 
         self.advanced_window.show()
 
+    def log_viewer_clicked(self):
+        if self.log_viewer_window is None:
+            self.log_viewer_window = LogViewerWindow(self)
+
+        self.log_viewer_window.show()
+
+    def dashboard_clicked(self):
+        if self.dashboard_window is None:
+            self.dashboard_window = DashboardWindow(self, self.ipcon)
+
+        self.dashboard_window.show()
+
     def connect_clicked(self):
         if self.ipcon.get_connection_state() == IPConnection.CONNECTION_STATE_DISCONNECTED:
             try:
@@ -526,11 +562,13 @@ class MainWindow(QMainWindow, Ui_MainWindow):
                 elif device_identifier == BrickRED.DEVICE_IDENTIFIER:
                     device_info = infos.BrickREDInfo()
                 elif position in ('a', 'b', 'c', 'd', 'A', 'B', 'C', 'D'):
-                    position = position.lower()
                     device_info = infos.BrickletInfo()
                 else:
                     device_info = infos.BrickInfo()
 
+            if device_info.type == 'bricklet':
+                position = position.lower()
+
             device_info.uid = uid
             device_info.connected_uid = connected_uid
             device_info.position = position
@@ -540,15 +578,7 @@ class MainWindow(QMainWindow, Ui_MainWindow):
             device_info.protocol_version = 2
             device_info.enumeration_type = enumeration_type
 
-            if device_info.type == 'bricklet':
-                for brick_info in infos.get_brick_infos():
-                    if brick_info.uid == device_info.connected_uid:
-                        brick_info.bricklets[position] = device_info
-            elif device_info.type == 'brick':
-                for bricklet_info in infos.get_bricklet_infos():
-                    if bricklet_info.connected_uid == device_info.uid:
-                        device_info.bricklets[bricklet_info.position] = bricklet_info
-
+            # the infos store links Bricklets and Bricks by connected UID
             if device_info.plugin == None:
                 plugin = self.plugin_manager.get_plugin(device_identifier, self.ipcon,
                                                         uid, hardware_version, firmware_version)
@@ -562,32 +592,30 @@ class MainWindow(QMainWindow, Ui_MainWindow):
                 device_info.tab_window = self.create_tab_window(device_info, connected_uid, position)
                 device_info.tab_window.setWindowFlags(Qt.Widget)
                 device_info.tab_window.tab()
+            else:
+                infos.update_info(device_info)
         elif enumeration_type == IPConnection.ENUMERATION_TYPE_DISCONNECTED:
-            for device_info in infos.get_device_infos():
-                if device_info.uid == uid:
-                    self.tab_widget.setCurrentIndex(0)
-                    self.remove_device_info(device_info.uid)
+            device_info = infos.get_info(uid)
 
-                if device_info.type == 'brick':
-                    for port in device_info.bricklets:
-                        if device_info.bricklets[port] and device_info.bricklets[port].uid == uid:
-                            device_info.bricklets[port] = None
+            # removing the info also unlinks it from its Brick
+            if device_info != None and device_info.type in ['brick', 'bricklet']:
+                self.tab_widget.setCurrentIndex(0)
+                self.remove_device_info(uid)
 
-        self.update_tree_view()
+        self.update_tree_view(uid)
 
     def hack_to_remove_red_brick_tab(self, red_brick_uid):
-        for device_info in infos.get_device_infos():
-            if device_info.uid == red_brick_uid:
-                self.tab_widget.setCurrentIndex(0)
-                self.remove_device_info(device_info.uid)
+        device_info = infos.get_info(red_brick_uid)
 
-                self.red_session_losts += 1
-                self.label_red_session_losts.setText('RED Brick Session Loss Count: {0}'.format(self.red_session_losts))
-                self.label_red_session_losts.show()
+        if device_info != None and device_info.type == 'brick':
+            self.tab_widget.setCurrentIndex(0)
+            self.remove_device_info(device_info.uid)
 
-                break
+            self.red_session_losts += 1
+            self.label_red_session_losts.setText('RED Brick Session Loss Count: {0}'.format(self.red_session_losts))
+            self.label_red_session_losts.show()
 
-        self.update_tree_view()
+        self.update_tree_view(red_brick_uid)
 
     def cb_connected(self, connect_reason):
         self.disconnect_times = []
@@ -735,29 +763,122 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 
         QApplication.processEvents()
 
-    def update_tree_view(self):
-        self.tree_view_model.clear()
+    # marks the rows of the given UID (or of all devices) to be updated
+    def update_tree_view(self, uid=None):
+        if uid == None:
+            self.tree_view_dirty_uids.update(self.tree_view_rows.keys())
+            self.tree_view_dirty_uids.update([info.uid for info in infos.get_device_infos()])
+        else:
+            self.tree_view_dirty_uids.add(uid)
 
-        for info in infos.get_brick_infos():
-            parent = [QStandardItem(info.name),
-                      QStandardItem(info.uid),
-                      QStandardItem('.'.join(map(str, info.firmware_version_installed)))]
+        if not self.tree_view_update_timer.isActive():
+            self.tree_view_update_timer.start()
 
-            for item in parent:
-                item.setFlags(item.flags() & ~Qt.ItemIsEditable)
+    # internal
+    def get_tree_view_row_texts(self, info):
+        if info.type == 'bricklet':
+            name = info.position.upper() + ': ' + info.name
+        else:
+            name = info.name
 
-            self.tree_view_model.appendRow(parent)
+        return [name, info.uid, '.'.join(map(str, info.firmware_version_installed))]
 
-            for port in sorted(info.bricklets):
-                if info.bricklets[port] and info.bricklets[port].protocol_version == 2:
-                    child = [QStandardItem(port.upper() + ': ' + info.bricklets[port].name),
-                             QStandardItem(info.bricklets[port].uid),
-                             QStandardItem('.'.join(map(str, info.bricklets[port].firmware_version_installed)))]
-                    for item in child:
-                        item.setFlags(item.flags() & ~Qt.ItemIsEditable)
-                    parent[0].appendRow(child)
+    # internal, returns the UID of the Brick row the row of the given info
+    # belongs to, '' for top level rows and None if the info has no row
+    def get_tree_view_parent_uid(self, info):
+        if info == None:
+            return None
+
+        if info.type == 'brick':
+            return ''
+
+        if info.type == 'bricklet' and info.protocol_version == 2:
+            parent = infos.get_parent_info(info)
+
+            if parent != None and parent.type == 'brick' and \
+               parent.bricklets.get(info.position) is info:
+                return parent.uid
+
+        return None
+
+    # internal
+    def remove_tree_view_row(self, uid):
+        row = self.tree_view_rows.pop(uid)
+
+        # rows of Bricklets are removed along with the row of their Brick
+        for child_uid in row.child_uids:
+            self.tree_view_rows.pop(child_uid, None)
+
+        if row.parent_uid == '':
+            parent_item = self.tree_view_model.invisibleRootItem()
+        else:
+            parent_row = self.tree_view_rows[row.parent_uid]
+            parent_item = parent_row.items[0]
+
+            parent_row.child_uids.discard(uid)
+
+        parent_item.removeRow(row.items[0].row())
+
+    # internal
+    def insert_tree_view_row(self, info, parent_uid):
+        items = [QStandardItem(text) for text in self.get_tree_view_row_texts(info)]
+
+        for item in items:
+            item.setFlags(item.flags() & ~Qt.ItemIsEditable)
+
+        if parent_uid == '':
+            self.tree_view_model.appendRow(items)
+        else:
+            parent_row = self.tree_view_rows[parent_uid]
+            parent_row.items[0].appendRow(items)
+            parent_row.child_uids.add(info.uid)
+
+        self.tree_view_rows[info.uid] = TreeViewRow(parent_uid, items)
+
+        if parent_uid == '':
+            self.tree_view.setExpanded(items[0].index(), True)
+
+    def apply_tree_view_updates(self):
+        dirty_uids = self.tree_view_dirty_uids
+        self.tree_view_dirty_uids = set()
+
+        # a new Brick row has to pick up the Bricklets connected to it
+        for uid in list(dirty_uids):
+            if uid not in self.tree_view_rows:
+                dirty_uids.update([info.uid for info in infos.get_child_infos(uid)])
+
+        self.tree_view.setUpdatesEnabled(False)
+        self.tree_view.setSortingEnabled(False)
+
+        # Bricks first, so that their rows exist before the Bricklet rows
+        # get inserted below them
+        def order(uid):
+            info = infos.get_info(uid)
+            return 0 if info != None and info.type == 'brick' else 1
+
+        for uid in sorted(dirty_uids, key=order):
+            info = infos.get_info(uid)
+            parent_uid = self.get_tree_view_parent_uid(info)
+            row = self.tree_view_rows.get(uid)
+
+            if row != None and row.parent_uid != parent_uid:
+                self.remove_tree_view_row(uid)
+                row = None
+
+            if parent_uid == None:
+                continue
+
+            if row == None:
+                self.insert_tree_view_row(info, parent_uid)
+            else:
+                for item, text in zip(row.items, self.get_tree_view_row_texts(info)):
+                    if item.text() != text:
+                        item.setText(text)
+
+        # restores the sort order once for the whole batch
+        self.tree_view.setSortingEnabled(True)
+        self.tree_view.setUpdatesEnabled(True)
 
-        self.set_tree_view_defaults()
         self.update_advanced_window()
         self.delayed_refresh_updates_timer.start()
 
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+brickv (Brick Viewer)
+
+plot_data_writer.py: Background CSV and binary writer for plot data
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public
+License along with this program; if not, write to the
+Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+Boston, MA 02111-1307, USA.
+"""
+
+import os
+import time
+import struct
+import logging
+import threading
+from array import array
+
+try:
+    from queue import Queue, Empty
+except:
+    from Queue import Queue, Empty # Python 2 fallback
+
+# binary format, all values are little endian:
+#
+# header: magic 'BVPD', u8 version, u16 title length, title (UTF-8),
+#         u16 curve count, per curve: u16 name length, name (UTF-8)
+# block:  u16 curve index, u32 sample count, sample count f64 timestamps,
+#         sample count f64 values
+BINARY_MAGIC = 'BVPD'
+BINARY_VERSION = 1
+
+FORMAT_CSV = 'csv'
+FORMAT_BINARY = 'binary'
+
+WRITE_BUFFER_SIZE = 64 * 1024 # bytes
+FSYNC_INTERVAL = 5.0 # seconds
+
+# titles are often byte strings with a latin-1 degree sign, like
+# 'Temperature [%cC]' % 0xB0, that cannot be encoded directly
+def to_unicode(s):
+    if isinstance(s, unicode):
+        return s
+
+    return s.decode('latin-1')
+
+def pack_string(s):
+    s = s.encode('utf-8')
+
+    return struct.pack('<H', len(s)) + s
+
+def escape_csv(s):
+    if ',' in s or '"' in s or '\n' in s:
+        return '"' + s.replace('"', '""') + '"'
+
+    return s
+
+class PlotDataWriter(threading.Thread):
+    """
+    Writes plot samples to a file in a background thread. The file is opened
+    in the constructor so that errors can be reported right away, all writes
+    are done by the thread with buffered appends and a periodic fsync.
+    """
+
+    def __init__(self, filename, format_, title, curve_names):
+        threading.Thread.__init__(self)
+
+        self.daemon = True
+        self.filename = filename
+        self.format = format_
+        self.title = to_unicode(title)
+        self.curve_names = [to_unicode(curve_name) for curve_name in curve_names]
+        self.queue = Queue()
+        self.error = None # set if writing failed, the thread stops then
+        self.f = open(filename, 'wb', WRITE_BUFFER_SIZE)
+
+        self.start()
+
+    # can be called from any thread, xs and ys must not be modified afterwards
+    def write(self, c, xs, ys):
+        if len(xs) > 0:
+            self.queue.put((c, xs, ys))
+
+    # flushes and closes the file after all pending samples are written
+    def close(self):
+        self.queue.put(None)
+
+    def run(self):
+        try:
+            self.write_header()
+
+            last_sync = time.time()
+
+            while True:
+                try:
+                    item = self.queue.get(True, FSYNC_INTERVAL)
+                except Empty:
+                    item = False
+
+                if item == None:
+                    break
+
+                if item:
+                    self.write_samples(*item)
+
+                now = time.time()
+
+                if now - last_sync >= FSYNC_INTERVAL:
+                    self.f.flush()
+                    os.fsync(self.f.fileno())
+
+                    last_sync = now
+
+            self.f.flush()
+            os.fsync(self.f.fileno())
+        except Exception as e:
+            logging.exception('Error while writing plot data to {0}'.format(self.filename))
+
+            self.error = e
+        finally:
+            self.f.close()
+
+    def write_header(self):
+        if self.format == FORMAT_CSV:
+            self.f.write('Time [s],Curve,Value\n')
+        else:
+            header = BINARY_MAGIC + struct.pack('<B', BINARY_VERSION) + pack_string(self.title)
+            header += struct.pack('<H', len(self.curve_names))
+
+            for curve_name in self.curve_names:
+                header += pack_string(curve_name)
+
+            self.f.write(header)
+
+    def write_samples(self, c, xs, ys):
+        if self.format == FORMAT_CSV:
+            curve_name = escape_csv(self.curve_names[c].encode('utf-8'))
+            lines = []
+
+            for i in xrange(len(xs)):
+                lines.append('{0:.3f},{1},{2!r}\n'.format(xs[i], curve_name, ys[i]))
+
+            self.f.write(''.join(lines))
+        else:
+            timestamps = array('d', xs)
+            values = array('d', ys)
+
+            if struct.pack('=H', 1) != struct.pack('<H', 1):
+                timestamps.byteswap()
+                values.byteswap()
+
+            self.f.write(struct.pack('<HI', c, len(xs)))
+            self.f.write(timestamps.tostring())
+            self.f.write(values.tostring())
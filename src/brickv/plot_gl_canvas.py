@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+"""
+brickv (Brick Viewer)
+
+plot_gl_canvas.py: OpenGL curve canvas for the Plot widget
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public
+License along with this program; if not, write to the
+Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+Boston, MA 02111-1307, USA.
+"""
+
+import logging
+from array import array
+
+from PyQt4.QtGui import QColor
+from PyQt4.QtOpenGL import QGLWidget, QGLFormat
+
+from OpenGL.GL import GL_COLOR_BUFFER_BIT, GL_PROJECTION, GL_MODELVIEW, \
+                      GL_ARRAY_BUFFER, GL_DYNAMIC_DRAW, GL_FLOAT, GL_VERTEX_ARRAY, \
+                      GL_LINE_STRIP, GL_LINE_LOOP, GL_LINES, GL_UNSIGNED_INT, \
+                      glClearColor, glClear, glViewport, glMatrixMode, glLoadIdentity, \
+                      glOrtho, glColor3f, glBegin, glEnd, glVertex2f, \
+                      glGenBuffers, glDeleteBuffers, glBindBuffer, glBufferData, \
+                      glBufferSubData, glEnableClientState, glDisableClientState, \
+                      glVertexPointer, glDrawArrays, glDrawElements
+
+VERTEX_SIZE = 2 * 4 # bytes, x and y as float
+MIN_CAPACITY = 1024 # vertices
+ORIGIN_REBASE_DISTANCE = 1000.0 # seconds
+
+def gl_plots_available():
+    return QGLFormat.hasOpenGL()
+
+class CurveBuffer(object):
+    """
+    Ring buffer of curve vertices in a vertex buffer object. New samples are
+    appended with glBufferSubData, old samples are dropped implicitly by
+    drawing only the last count vertices.
+    """
+
+    def __init__(self):
+        self.vbo = None
+        self.capacity = 0 # vertices
+        self.write_index = 0 # next vertex to be written
+        self.count = 0 # valid vertices before write_index
+        self.origin_x = None # x values are stored relative to this
+
+    def release(self):
+        if self.vbo != None:
+            glDeleteBuffers(1, [self.vbo])
+            self.vbo = None
+
+    def allocate(self, capacity):
+        if self.vbo == None:
+            self.vbo = glGenBuffers(1)
+
+        self.capacity = capacity
+        self.write_index = 0
+        self.count = 0
+
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBufferData(GL_ARRAY_BUFFER, self.capacity * VERTEX_SIZE, None, GL_DYNAMIC_DRAW)
+
+    def upload(self, curve_x, curve_y, new_count):
+        length = len(curve_x)
+        new_count = min(new_count, length)
+
+        # float precision is limited, therefore the x values are stored
+        # relative to an origin that moves along with the curve. if the
+        # origin has to move or the buffer is too small then everything
+        # is uploaded again
+        if length > 0 and (self.origin_x == None or
+                           curve_x[-1] - self.origin_x > ORIGIN_REBASE_DISTANCE):
+            self.origin_x = curve_x[0]
+            new_count = length
+
+        if length > self.capacity:
+            self.allocate(max(MIN_CAPACITY, length * 2))
+            new_count = length
+
+        if new_count == 0:
+            self.count = min(self.count, length)
+            return
+
+        if new_count == length:
+            self.write_index = 0
+
+        vertices = array('f')
+        origin_x = self.origin_x
+
+        for i in xrange(length - new_count, length):
+            vertices.append(curve_x[i] - origin_x)
+            vertices.append(curve_y[i])
+
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+
+        # split the upload if it wraps around the end of the buffer
+        first_count = min(new_count, self.capacity - self.write_index)
+        first_data = vertices[:first_count * 2].tostring()
+
+        glBufferSubData(GL_ARRAY_BUFFER, self.write_index * VERTEX_SIZE, len(first_data), first_data)
+
+        if first_count < new_count:
+            second_data = vertices[first_count * 2:].tostring()
+
+            glBufferSubData(GL_ARRAY_BUFFER, 0, len(second_data), second_data)
+
+        self.write_index = (self.write_index + new_count) % self.capacity
+
+        # the Plot trims its curve lists from the front, the valid vertices
+        # are always the last len(curve_x) ones that were written
+        self.count = length
+
+    def draw(self):
+        if self.vbo == None or self.count < 2:
+            return
+
+        start = (self.write_index - self.count) % self.capacity
+
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glVertexPointer(2, GL_FLOAT, 0, None)
+
+        if start + self.count <= self.capacity:
+            glDrawArrays(GL_LINE_STRIP, start, self.count)
+        else:
+            glDrawArrays(GL_LINE_STRIP, start, self.capacity - start)
+            glDrawArrays(GL_LINE_STRIP, 0, self.write_index)
+
+            # connect the last vertex of the buffer with the first one
+            glDrawElements(GL_LINES, 2, GL_UNSIGNED_INT, [self.capacity - 1, 0])
+
+class PlotGLCanvas(QGLWidget):
+    """
+    Draws the canvas and the curves of a Plot with OpenGL. The Plot keeps
+    drawing its scales with QPainter and falls back to QPainter for the
+    curves if this canvas failed to initialize.
+    """
+
+    def __init__(self, plot, canvas_color):
+        QGLWidget.__init__(self, plot)
+
+        self.plot = plot
+        self.canvas_color = canvas_color
+        self.curve_outer_border = 0
+        self.failed = False
+        self.curve_buffers = []
+        self.curves_synced = [] # per curve number of samples uploaded
+        self.x_min = 0.0
+        self.y_min = 0.0
+        self.y_max = 1.0
+        self.view_span = 1.0
+
+        self.setAutoFillBackground(False)
+
+    def set_view(self, curve_outer_border, x_min, view_span, y_min, y_max):
+        self.curve_outer_border = curve_outer_border
+        self.x_min = x_min
+        self.view_span = view_span
+        self.y_min = y_min
+        self.y_max = y_max
+
+    def clear(self):
+        self.makeCurrent()
+
+        for curve_buffer in self.curve_buffers:
+            curve_buffer.release()
+
+        self.curve_buffers = []
+        self.curves_synced = []
+
+    # override QGLWidget.initializeGL
+    def initializeGL(self):
+        try:
+            if not bool(glGenBuffers):
+                raise RuntimeError('Vertex buffer objects are not supported')
+
+            glClearColor(self.canvas_color.redF(), self.canvas_color.greenF(),
+                         self.canvas_color.blueF(), 1.0)
+        except:
+            logging.exception('Could not initialize OpenGL plot canvas, falling back to QPainter')
+            self.failed = True
+
+    # override QGLWidget.resizeGL
+    def resizeGL(self, width, height):
+        glViewport(0, 0, width, height)
+
+    # override QGLWidget.paintGL
+    def paintGL(self):
+        if self.failed:
+            return
+
+        try:
+            self.paint_canvas()
+        except:
+            logging.exception('Could not paint OpenGL plot canvas, falling back to QPainter')
+            self.failed = True
+            self.plot.update()
+
+    def paint_canvas(self):
+        width = self.width()
+        height = self.height()
+        border = self.curve_outer_border
+
+        glClear(GL_COLOR_BUFFER_BIT)
+
+        # draw canvas border in pixel coordinates
+        glViewport(0, 0, width, height)
+        glMatrixMode(GL_PROJECTION)
+        glLoadIdentity()
+        glOrtho(0, width, height, 0, -1, 1)
+        glMatrixMode(GL_MODELVIEW)
+        glLoadIdentity()
+
+        if border > 0:
+            glColor3f(190 / 255.0, 190 / 255.0, 190 / 255.0)
+            glBegin(GL_LINE_LOOP)
+            glVertex2f(0.5, 0.5)
+            glVertex2f(width - 0.5, 0.5)
+            glVertex2f(width - 0.5, height - 0.5)
+            glVertex2f(0.5, height - 0.5)
+            glEnd()
+
+        # stream new samples into the vertex buffers
+        plot = self.plot
+
+        while len(self.curve_buffers) < len(plot.curves_x):
+            self.curve_buffers.append(CurveBuffer())
+            self.curves_synced.append(0)
+
+        for c, curve_buffer in enumerate(self.curve_buffers):
+            new_count = plot.curves_appended[c] - self.curves_synced[c]
+
+            if curve_buffer.vbo == None:
+                curve_buffer.allocate(MIN_CAPACITY)
+                new_count = len(plot.curves_x[c])
+
+            curve_buffer.upload(plot.curves_x[c], plot.curves_y[c], new_count)
+
+            self.curves_synced[c] = plot.curves_appended[c]
+
+        # draw curves in data coordinates inside the border
+        glViewport(border, border, max(width - 2 * border, 1), max(height - 2 * border, 1))
+        glEnableClientState(GL_VERTEX_ARRAY)
+
+        for c, curve_buffer in enumerate(self.curve_buffers):
+            if not plot.curves_visible[c] or curve_buffer.origin_x == None:
+                continue
+
+            x_min = self.x_min - curve_buffer.origin_x
+
+            glMatrixMode(GL_PROJECTION)
+            glLoadIdentity()
+            glOrtho(x_min, x_min + self.view_span, self.y_min, self.y_max, -1, 1)
+
+            color = QColor(plot.plots[c][1])
+
+            glColor3f(color.redF(), color.greenF(), color.blueF())
+            curve_buffer.draw()
+
+        glDisableClientState(GL_VERTEX_ARRAY)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
@@ -22,18 +22,58 @@ Free Software Foundation, Inc., 59 Temple Place - Suite 330,
 Boston, MA 02111-1307, USA.
 """
 
+import os
 import sys
 import math
+import bisect
+import weakref
 import functools
+from array import array
+from collections import deque
 
 from PyQt4.QtGui import QVBoxLayout, QHBoxLayout, QWidget, QToolButton, \
                         QPushButton, QPainter, QSizePolicy, QFontMetrics, \
-                        QPixmap, QIcon, QColor, QCursor, QPen, QPainterPath
-from PyQt4.QtCore import QTimer, Qt, QSize, QPointF
+                        QPixmap, QIcon, QColor, QCursor, QPen, QPainterPath, \
+                        QComboBox, QScrollBar, QLabel, QMenu, QMessageBox
+from PyQt4.QtCore import QObject, QTimer, Qt, QSize, QPointF, QRect
+
+from brickv import config
+from brickv.plot_data_writer import PlotDataWriter, FORMAT_CSV, FORMAT_BINARY
+from brickv.utils import get_main_window, get_save_file_name, get_home_path
+
+try:
+    from brickv.plot_gl_canvas import PlotGLCanvas, gl_plots_available
+except ImportError:
+    # PyOpenGL or QtOpenGL is not available, use QPainter only
+    PlotGLCanvas = None
 
 EPSILON = 0.000001
 DEBUG = False
 
+# (resolution [s], bucket count) per history tier, from fine to coarse
+HISTORY_TIERS = [(1, 2 * 60 * 60),    # 1s buckets for 2 hours
+                 (60, 2 * 24 * 60),   # 1min buckets for 2 days
+                 (60 * 60, 62 * 24)]  # 1h buckets for 62 days
+
+# (label, length [s]) of the selectable time spans, the first one is the raw view
+HISTORY_SPANS = [('20 s', 20),
+                 ('1 min', 60),
+                 ('10 min', 10 * 60),
+                 ('1 h', 60 * 60),
+                 ('6 h', 6 * 60 * 60),
+                 ('1 d', 24 * 60 * 60),
+                 ('7 d', 7 * 24 * 60 * 60)]
+
+# x-axis tick steps [s], the smallest one that results in at most
+# X_SCALE_MAX_TICK_COUNT ticks for the current time span is used
+X_SCALE_TICK_STEPS = [1, 2, 5, 10, 30, 60, 2 * 60, 5 * 60, 10 * 60, 30 * 60,
+                      60 * 60, 2 * 60 * 60, 6 * 60 * 60, 12 * 60 * 60, 24 * 60 * 60]
+X_SCALE_MAX_TICK_COUNT = 30
+
+PLOT_SAMPLE_INTERVAL = 100 # ms
+PLOT_FRAME_INTERVAL = 33 # ms, repaint at most ~30 times per second
+PUSHED_SAMPLES_MAX_COUNT = 100000 # per curve, older samples are dropped
+
 def istr(i):
     return str(int(i))
 
@@ -93,12 +133,24 @@ class XScale(Scale):
                             self.title_text_height + \
                             self.title_text_to_border # px, fixed
 
-    def draw(self, painter, factor, tick_value_min, tick_count):
-        factor_int = int(math.floor(factor))
+    def update_tick_step(self, tick_step):
+        if tick_step < 60:
+            self.tick_value_to_str = istr
+            self.title_text = 'Time [s]'
+        elif tick_step < 60 * 60:
+            self.tick_value_to_str = lambda value: istr(value / 60)
+            self.title_text = 'Time [min]'
+        else:
+            self.tick_value_to_str = lambda value: istr(value / (60 * 60))
+            self.title_text = 'Time [h]'
+
+    def draw(self, painter, factor, value_min, value_length, tick_step=1):
+        tick_factor = factor * tick_step
+        tick_factor_int = int(math.floor(tick_factor))
         text_flags = Qt.TextDontClip | Qt.AlignHCenter | Qt.AlignBottom
 
         # axis line
-        axis_line_length = int(math.floor(factor * tick_count))
+        axis_line_length = int(math.floor(factor * value_length))
 
         painter.drawLine(0, 0, axis_line_length - 1, 0)
 
@@ -106,18 +158,24 @@ class XScale(Scale):
         tick_text_y = self.axis_line_thickness + \
                       self.tick_mark_size_large + \
                       self.tick_mark_to_tick_text
-        tick_text_width = factor_int + self.tick_mark_thickness + factor_int
+        tick_text_width = tick_factor_int + self.tick_mark_thickness + tick_factor_int
         tick_text_height = self.tick_text_height
 
         painter.setFont(self.tick_text_font)
 
-        for i in range(tick_count):
-            x = round(factor * i)
-            tick_value = int(tick_value_min + i)
+        # ticks are placed on multiples of the tick step
+        tick_index = int(math.ceil(value_min / tick_step - EPSILON))
+
+        while True:
+            tick_value = tick_index * tick_step
+            x = round(factor * (tick_value - value_min))
 
-            if (tick_value % 5) == 0:
+            if x >= axis_line_length:
+                break
+
+            if (tick_index % 5) == 0:
                 tick_mark_size = self.tick_mark_size_large
-                tick_text_x = x - factor_int
+                tick_text_x = x - tick_factor_int
 
                 if DEBUG:
                     painter.fillRect(tick_text_x, tick_text_y,
@@ -133,6 +191,8 @@ class XScale(Scale):
 
             painter.drawLine(x, 0, x, tick_mark_size)
 
+            tick_index += 1
+
         # title
         title_text_x = 0
         title_text_y = self.axis_line_thickness + \
@@ -301,10 +361,236 @@ class YScale(Scale):
 
         painter.restore()
 
+class PlotScheduler(QObject):
+    def __init__(self):
+        QObject.__init__(self)
+
+        self.plot_widgets = weakref.WeakSet()
+        self.dirty_plots = set()
+
+        # one timer samples the update functions of all plot widgets
+        self.sample_timer = QTimer(self)
+        self.sample_timer.timeout.connect(self.sample)
+        self.sample_timer.start(PLOT_SAMPLE_INTERVAL)
+
+        # repaints are collected and done at most once per frame
+        self.frame_timer = QTimer(self)
+        self.frame_timer.setSingleShot(True)
+        self.frame_timer.timeout.connect(self.repaint)
+
+    def add_plot_widget(self, plot_widget):
+        self.plot_widgets.add(plot_widget)
+
+    def request_repaint(self, plot):
+        self.dirty_plots.add(plot)
+
+        if not self.frame_timer.isActive():
+            self.frame_timer.start(PLOT_FRAME_INTERVAL)
+
+    def sample(self):
+        for plot_widget in list(self.plot_widgets):
+            try:
+                # widgets on hidden tabs or windows are skipped entirely
+                if plot_widget.stop or not plot_widget.isVisible():
+                    continue
+
+                plot_widget.add_new_data()
+            except RuntimeError:
+                # underlying C/C++ object has been deleted
+                self.plot_widgets.discard(plot_widget)
+
+    def repaint(self):
+        dirty_plots = self.dirty_plots
+        self.dirty_plots = set()
+
+        for plot in dirty_plots:
+            try:
+                plot.update()
+            except RuntimeError:
+                # underlying C/C++ object has been deleted
+                pass
+
+_plot_scheduler = None
+
+def get_plot_scheduler():
+    global _plot_scheduler
+
+    if _plot_scheduler == None:
+        _plot_scheduler = PlotScheduler()
+
+    return _plot_scheduler
+
+class HistoryTier(object):
+    def __init__(self, resolution, length):
+        self.resolution = float(resolution) # seconds per bucket
+        self.length = length # maximum number of completed buckets
+        self.trim_granularity = max(length // 20, 1)
+
+        self.clear()
+
+    def clear(self):
+        self.x = array('d') # per bucket start time
+        self.y_min = array('d') # per bucket minimum value
+        self.y_max = array('d') # per bucket maximum value
+        self.y_mean = array('d') # per bucket mean value
+        self.trimmed = False # True if old buckets were discarded
+
+        # bucket that is currently being filled
+        self.bucket_x = None
+        self.bucket_y_min = None
+        self.bucket_y_max = None
+        self.bucket_y_sum = 0.0
+        self.bucket_count = 0
+
+    # NOTE: assumes that x is a timestamp in seconds that constantly grows.
+    #       returns the bucket that got completed by this sample as
+    #       (x, y_min, y_max, y_sum, count) tuple or None
+    def add(self, x, y_min, y_max, y_sum, count):
+        bucket_x = math.floor(x / self.resolution) * self.resolution
+        completed = None
+
+        if self.bucket_x != None and bucket_x != self.bucket_x:
+            completed = (self.bucket_x, self.bucket_y_min, self.bucket_y_max,
+                         self.bucket_y_sum, self.bucket_count)
+
+            self.x.append(self.bucket_x)
+            self.y_min.append(self.bucket_y_min)
+            self.y_max.append(self.bucket_y_max)
+            self.y_mean.append(self.bucket_y_sum / self.bucket_count)
+
+            if len(self.x) > self.length:
+                del self.x[:self.trim_granularity]
+                del self.y_min[:self.trim_granularity]
+                del self.y_max[:self.trim_granularity]
+                del self.y_mean[:self.trim_granularity]
+
+                self.trimmed = True
+
+            self.bucket_x = None
+
+        if self.bucket_x == None:
+            self.bucket_x = bucket_x
+            self.bucket_y_min = y_min
+            self.bucket_y_max = y_max
+            self.bucket_y_sum = y_sum
+            self.bucket_count = count
+        else:
+            self.bucket_y_min = min(self.bucket_y_min, y_min)
+            self.bucket_y_max = max(self.bucket_y_max, y_max)
+            self.bucket_y_sum += y_sum
+            self.bucket_count += count
+
+        return completed
+
+    def covers(self, x):
+        if not self.trimmed:
+            return True
+
+        return len(self.x) > 0 and self.x[0] <= x
+
+    def get_first_x(self):
+        if len(self.x) > 0:
+            return self.x[0]
+
+        return self.bucket_x
+
+    # returns (x, y_min, y_max, y_mean) lists for all buckets that overlap
+    # the given time range, including the bucket that is currently being
+    # filled. the x values are bucket centers
+    def get_buckets(self, x_min, x_max):
+        start = bisect.bisect_left(self.x, x_min - self.resolution)
+        end = bisect.bisect_right(self.x, x_max)
+        half_resolution = self.resolution / 2
+
+        xs = [x + half_resolution for x in self.x[start:end]]
+        y_mins = self.y_min[start:end].tolist()
+        y_maxs = self.y_max[start:end].tolist()
+        y_means = self.y_mean[start:end].tolist()
+
+        if self.bucket_x != None and self.bucket_x <= x_max and \
+           self.bucket_x + self.resolution >= x_min:
+            xs.append(self.bucket_x + half_resolution)
+            y_mins.append(self.bucket_y_min)
+            y_maxs.append(self.bucket_y_max)
+            y_means.append(self.bucket_y_sum / self.bucket_count)
+
+        return xs, y_mins, y_maxs, y_means
+
+class CurveHistory(object):
+    def __init__(self):
+        self.tiers = [HistoryTier(resolution, length) for resolution, length in HISTORY_TIERS]
+
+        self.clear()
+
+    def clear(self):
+        self.first_x = None
+        self.last_x = None
+
+        for tier in self.tiers:
+            tier.clear()
+
+    # NOTE: assumes that x is a timestamp in seconds that constantly grows
+    def add(self, x, y):
+        if self.first_x == None:
+            self.first_x = x
+
+        self.last_x = x
+
+        # feed the raw sample into the finest tier and every completed
+        # bucket into the next coarser tier
+        bucket = (x, y, y, y, 1)
+
+        for tier in self.tiers:
+            bucket = tier.add(*bucket)
+
+            if bucket == None:
+                break
+
+        coarsest = self.tiers[-1]
+
+        if coarsest.trimmed:
+            self.first_x = max(self.first_x, coarsest.x[0])
+
+    # returns the buckets of the finest tier that covers the given time range
+    # with at most max_points buckets
+    def get_buckets(self, x_min, x_max, max_points):
+        tier = self.tiers[-1]
+
+        for candidate in self.tiers:
+            if (x_max - x_min) / candidate.resolution <= max_points and candidate.covers(x_min):
+                tier = candidate
+                break
+
+        return tier.get_buckets(x_min, x_max)
+
+    # returns (xs, ys) of the bucket means older than x_max. coarser tiers
+    # are only used where the finer tiers already discarded their buckets
+    def get_samples(self, x_max):
+        segments = []
+
+        for tier in self.tiers:
+            half_resolution = tier.resolution / 2
+            end = bisect.bisect_left(tier.x, x_max - half_resolution)
+
+            if end > 0:
+                segments.append(([x + half_resolution for x in tier.x[:end]],
+                                 tier.y_mean[:end].tolist()))
+
+                x_max = tier.x[0]
+
+        xs = []
+        ys = []
+
+        for segment_xs, segment_ys in reversed(segments):
+            xs.extend(segment_xs)
+            ys.extend(segment_ys)
+
+        return xs, ys
+
 class Plot(QWidget):
     def __init__(self, parent, y_scale_title_text, plots, scales_visible=True,
                  curve_outer_border_visible=True, curve_motion_granularity=10,
-                 canvas_color=QColor(245, 245, 245)):
+                 canvas_color=QColor(245, 245, 245), history_enabled=False):
         QWidget.__init__(self, parent)
 
         self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
@@ -312,6 +598,10 @@ class Plot(QWidget):
         self.plots = plots
         self.scales_visible = scales_visible
         self.history_length_x = 20 # seconds
+        self.history_enabled = history_enabled
+        self.view_span = self.history_length_x # seconds
+        self.view_end = None # seconds, None means follow the newest data
+        self.data_writer = None # gets all added values, if set
 
         if curve_outer_border_visible:
             self.curve_outer_border = 5 # px, fixed
@@ -342,6 +632,12 @@ class Plot(QWidget):
         self.y_scale_fixed = False
         self.y_scale_height_offset = max(self.curve_outer_border, self.y_scale.tick_text_height_half) # px, from top
 
+        if PlotGLCanvas != None and config.get_use_opengl_plots() and gl_plots_available():
+            self.gl_canvas = PlotGLCanvas(self, self.canvas_color)
+            self.gl_canvas.hide()
+        else:
+            self.gl_canvas = None
+
         self.clear_graph()
 
     # override QWidget.sizeHint
@@ -363,6 +659,13 @@ class Plot(QWidget):
         width = self.width()
         height = self.height()
 
+        # the history view has to be determined first, because it might
+        # change the y-scale and therefore the y-scale width
+        if self.is_history_view():
+            history_view = self.get_history_view(width)
+        else:
+            history_view = None
+
         if self.scales_visible:
             curve_width = width - self.y_scale.total_width - self.curve_to_scale - self.curve_outer_border
             curve_height = height - self.y_scale_height_offset - self.x_scale.total_height - self.curve_to_scale
@@ -384,6 +687,13 @@ class Plot(QWidget):
         canvas_width = self.curve_outer_border + curve_width + self.curve_outer_border
         canvas_height = self.curve_outer_border + curve_height + self.curve_outer_border
 
+        # the OpenGL canvas draws the raw view only, the history view and
+        # the fallback case are drawn with QPainter
+        use_gl_canvas = self.gl_canvas != None and not self.gl_canvas.failed and history_view == None
+
+        if self.gl_canvas != None and not use_gl_canvas and self.gl_canvas.isVisible():
+            self.gl_canvas.hide()
+
         painter.fillRect(canvas_x, canvas_y, canvas_width, canvas_height, self.canvas_color)
 
         # draw cross hair at cursor position
@@ -415,15 +725,47 @@ class Plot(QWidget):
         y_min_scale = self.y_scale.value_min
         y_max_scale = self.y_scale.value_max
 
-        factor_x = float(curve_width) / self.history_length_x
+        factor_x = float(curve_width) / self.view_span
         factor_y = float(curve_height - 1) / max(y_max_scale - y_min_scale, EPSILON) # -1 to accommodate the 1px width of the curve
 
         if self.scales_visible:
-            self.draw_x_scale(painter, factor_x)
+            if history_view != None:
+                self.draw_x_scale(painter, factor_x, history_view[0])
+            else:
+                self.draw_x_scale(painter, factor_x, self.x_min)
+
             self.draw_y_scale(painter, curve_height, factor_y)
 
         # draw curves
-        if self.x_min != None and self.x_max != None:
+        if history_view != None:
+            painter.save()
+            painter.translate(canvas_x + self.curve_outer_border,
+                              canvas_y + self.curve_outer_border + curve_height - 1 + self.curve_y_offset) # -1 to accommodate the 1px width of the curve
+            painter.scale(factor_x, -factor_y)
+            painter.translate(-history_view[0], -y_min_scale)
+
+            self.draw_history_curves(painter, history_view[2])
+
+            painter.restore()
+        elif use_gl_canvas:
+            if self.x_min == None or self.x_max == None:
+                view_x_min = 0.0
+            elif self.scales_visible:
+                view_x_min = self.x_min
+            else:
+                view_x_min = self.x_max - self.history_length_x
+
+            if self.gl_canvas.geometry() != QRect(canvas_x, canvas_y, canvas_width, canvas_height):
+                self.gl_canvas.setGeometry(canvas_x, canvas_y, canvas_width, canvas_height)
+
+            self.gl_canvas.set_view(self.curve_outer_border, view_x_min, self.view_span,
+                                    y_min_scale, y_max_scale)
+
+            if not self.gl_canvas.isVisible():
+                self.gl_canvas.show()
+
+            self.gl_canvas.update()
+        elif self.x_min != None and self.x_max != None:
             x_min = self.x_min
             x_max = self.x_max
 
@@ -464,22 +806,65 @@ class Plot(QWidget):
     def get_legend_offset_y(self): # px, from top
         return max(self.y_scale.tick_text_height_half - self.curve_outer_border, 0)
 
-    def draw_x_scale(self, painter, factor):
+    def draw_x_scale(self, painter, factor, x_min):
         offset_x = self.y_scale.total_width + self.curve_to_scale
         offset_y = self.height() - self.x_scale.total_height
 
-        if self.x_min != None:
-            x_min = self.x_min
-        else:
+        if x_min == None:
             x_min = 0
 
+        tick_step = X_SCALE_TICK_STEPS[-1]
+
+        for step in X_SCALE_TICK_STEPS:
+            if self.view_span / step <= X_SCALE_MAX_TICK_COUNT:
+                tick_step = step
+                break
+
+        self.x_scale.update_tick_step(tick_step)
+
         painter.save()
         painter.translate(offset_x, offset_y)
 
-        self.x_scale.draw(painter, factor, x_min, self.history_length_x)
+        self.x_scale.draw(painter, factor, x_min, self.view_span, tick_step)
 
         painter.restore()
 
+    def draw_history_curves(self, painter, curves):
+        for c, buckets in enumerate(curves):
+            if buckets == None or len(buckets[0]) == 0:
+                continue
+
+            xs, y_mins, y_maxs, y_means = buckets
+
+            # min/max envelope
+            envelope = QPainterPath()
+            envelope.moveTo(xs[0], y_maxs[0])
+
+            for i in xrange(1, len(xs)):
+                envelope.lineTo(xs[i], y_maxs[i])
+
+            for i in xrange(len(xs) - 1, -1, -1):
+                envelope.lineTo(xs[i], y_mins[i])
+
+            envelope.closeSubpath()
+
+            envelope_color = QColor(self.plots[c][1])
+            envelope_color.setAlpha(60)
+
+            painter.fillPath(envelope, envelope_color)
+
+            # mean curve
+            path = QPainterPath()
+            lineTo = path.lineTo
+
+            path.moveTo(xs[0], y_means[0])
+
+            for i in xrange(1, len(xs)):
+                lineTo(xs[i], y_means[i])
+
+            painter.setPen(self.plots[c][1])
+            painter.drawPath(path)
+
     def draw_y_scale(self, painter, height, factor):
         offset_x = self.y_scale.total_width
         offset_y = self.height() - self.x_scale.total_height - self.curve_to_scale - 1
@@ -493,78 +878,105 @@ class Plot(QWidget):
 
     # NOTE: assumes that x is a timestamp in seconds that constantly grows
     def add_data(self, c, x, y):
+        self.add_data_batch(c, [x], [y])
+
+    # NOTE: assumes that xs are timestamps in seconds that constantly grow
+    def add_data_batch(self, c, xs, ys):
+        if len(xs) == 0:
+            return
+
         if self.y_type == None:
-            self.y_type = type(y)
+            self.y_type = type(ys[0])
+
+        xs = map(float, xs)
+        ys = map(float, ys)
+
+        if self.data_writer != None:
+            self.data_writer.write(c, xs, ys)
 
-        x = float(x)
-        y = float(y)
+        batch_y_min = min(ys)
+        batch_y_max = max(ys)
 
         last_y_min = self.y_min
         last_y_max = self.y_max
 
         if self.x_min == None:
-            self.x_min = x
+            self.x_min = xs[0]
 
         if self.x_max == None:
-            self.x_max = x
+            self.x_max = xs[0]
 
         if self.curves_visible[c]:
             if self.y_min == None:
-                self.y_min = y
+                self.y_min = batch_y_min
             else:
-                self.y_min = min(self.y_min, y)
+                self.y_min = min(self.y_min, batch_y_min)
 
             if self.y_max == None:
-                self.y_max = y
+                self.y_max = batch_y_max
             else:
-                self.y_max = max(self.y_max, y)
+                self.y_max = max(self.y_max, batch_y_max)
 
-        self.curves_x[c].append(x)
-        self.curves_y[c].append(y)
+        curve_x = self.curves_x[c]
+        curve_y = self.curves_y[c]
+
+        curve_x.extend(xs)
+        curve_y.extend(ys)
+        self.curves_appended[c] += len(xs)
+
+        if self.history_enabled:
+            add = self.curves_history[c].add
+
+            for i in xrange(len(xs)):
+                add(xs[i], ys[i])
 
         if self.curves_x_min[c] == None:
-            self.curves_x_min[c] = x
+            self.curves_x_min[c] = xs[0]
 
         if self.curves_x_max[c] == None:
-            self.curves_x_max[c] = x
+            self.curves_x_max[c] = xs[0]
 
         if self.curves_y_min[c] == None:
-            self.curves_y_min[c] = y
+            self.curves_y_min[c] = batch_y_min
         else:
-            self.curves_y_min[c] = min(self.curves_y_min[c], y)
+            self.curves_y_min[c] = min(self.curves_y_min[c], batch_y_min)
 
         if self.curves_y_max[c] == None:
-            self.curves_y_max[c] = y
+            self.curves_y_max[c] = batch_y_max
         else:
-            self.curves_y_max[c] = max(self.curves_y_max[c], y)
-
-        if len(self.curves_x[c]) > 0:
-            if (self.curves_x[c][-1] - self.curves_x[c][0]) >= self.history_length_x:
-                self.curves_x[c] = self.curves_x[c][self.curve_motion_granularity:]
-                self.curves_y[c] = self.curves_y[c][self.curve_motion_granularity:]
-
-                if len(self.curves_x[c]) > 0:
-                    self.curves_x_min[c] = self.curves_x[c][0]
-                else:
-                    self.curves_x_min[c] = None
-
-                if len(self.curves_x[c]) > 0:
-                    self.curves_x_max[c] = self.curves_x[c][-1]
-                else:
-                    self.curves_x_max[c] = None
-
-                self.curves_y_min[c] = min(self.curves_y[c])
-                self.curves_y_max[c] = max(self.curves_y[c])
-
-                self.update_x_min_max_y_min_max()
+            self.curves_y_max[c] = max(self.curves_y_max[c], batch_y_max)
+
+        if (curve_x[-1] - curve_x[0]) >= self.history_length_x:
+            # drop the values that are out of the history in multiples of
+            # the motion granularity
+            outdated = bisect.bisect_right(curve_x, curve_x[-1] - self.history_length_x)
+            granularity = self.curve_motion_granularity
+            outdated = max(int(math.ceil(float(outdated) / granularity)) * granularity, granularity)
+
+            del curve_x[:outdated]
+            del curve_y[:outdated]
+
+            if len(curve_x) > 0:
+                self.curves_x_min[c] = curve_x[0]
+                self.curves_x_max[c] = curve_x[-1]
+                self.curves_y_min[c] = min(curve_y)
+                self.curves_y_max[c] = max(curve_y)
             else:
-                self.curves_x_max[c] = self.curves_x[c][-1]
-                self.x_max = min(self.curves_x_max)
+                self.curves_x_min[c] = None
+                self.curves_x_max[c] = None
+                self.curves_y_min[c] = None
+                self.curves_y_max[c] = None
 
-        if self.curves_visible[c] and (last_y_min != self.y_min or last_y_max != self.y_max):
+            self.update_x_min_max_y_min_max()
+        else:
+            self.curves_x_max[c] = curve_x[-1]
+            self.x_max = min(self.curves_x_max)
+
+        if self.curves_visible[c] and (last_y_min != self.y_min or last_y_max != self.y_max) and \
+           not self.is_history_view():
             self.update_y_min_max_scale()
 
-        self.update()
+        get_plot_scheduler().request_repaint(self)
 
     def update_x_min_max_y_min_max(self):
         self.x_min = min(self.curves_x_min)
@@ -578,15 +990,15 @@ class Plot(QWidget):
             self.y_max = None
 
     def update_y_min_max_scale(self):
+        self.update_y_scale(self.y_min, self.y_max)
+
+    def update_y_scale(self, y_min, y_max):
         if self.y_scale_fixed:
             return
 
-        if self.y_min == None or self.y_max == None:
+        if y_min == None or y_max == None:
             y_min = -1.0
             y_max = 1.0
-        else:
-            y_min = self.y_min
-            y_max = self.y_max
 
         delta_y = abs(y_max - y_min)
 
@@ -659,11 +1071,101 @@ class Plot(QWidget):
 
         self.update_x_min_max_y_min_max()
 
-        if last_y_min != self.y_min or last_y_max != self.y_max:
+        if (last_y_min != self.y_min or last_y_max != self.y_max) and not self.is_history_view():
+            self.update_y_min_max_scale()
+
+        self.update()
+
+    # returns (xs, ys) of all values of a curve that are still in memory,
+    # aggregated history values are followed by the raw values
+    def get_export_data(self, c):
+        xs = []
+        ys = []
+
+        if self.history_enabled:
+            if len(self.curves_x[c]) > 0:
+                x_max = self.curves_x[c][0]
+            else:
+                x_max = float('inf')
+
+            xs, ys = self.curves_history[c].get_samples(x_max)
+
+        return xs + self.curves_x[c], ys + self.curves_y[c]
+
+    def is_history_view(self):
+        return self.view_end != None or self.view_span != self.history_length_x
+
+    # returns (first, last) timestamp of the available history
+    def get_history_range(self):
+        first_xs = [history.first_x for history in self.curves_history if history.first_x != None]
+        last_xs = [history.last_x for history in self.curves_history if history.last_x != None]
+
+        if len(first_xs) == 0 or len(last_xs) == 0:
+            return None, None
+
+        return min(first_xs), max(last_xs)
+
+    def set_view(self, span, end):
+        if not self.history_enabled:
+            return
+
+        self.view_span = span
+        self.view_end = end
+        self.history_y_min_max = None
+
+        if not self.is_history_view():
             self.update_y_min_max_scale()
 
         self.update()
 
+    # returns (x_min, x_max, curves) with curves being a per curve list of
+    # buckets or None for invisible curves
+    def get_history_view(self, max_points):
+        first_x, last_x = self.get_history_range()
+
+        if first_x == None:
+            return None
+
+        if self.view_end == None:
+            x_max = last_x
+        else:
+            x_max = min(self.view_end, last_x)
+
+        x_min = x_max - self.view_span
+
+        # if there is not enough history to fill the view then let the
+        # curves grow from the left, as in the raw view
+        if x_min < first_x:
+            x_min = first_x
+            x_max = first_x + self.view_span
+
+        curves = []
+        y_min = None
+        y_max = None
+
+        for c, history in enumerate(self.curves_history):
+            if not self.curves_visible[c]:
+                curves.append(None)
+                continue
+
+            buckets = history.get_buckets(x_min, x_max, max(max_points, 1))
+
+            curves.append(buckets)
+
+            if len(buckets[0]) > 0:
+                if y_min == None:
+                    y_min = min(buckets[1])
+                    y_max = max(buckets[2])
+                else:
+                    y_min = min(y_min, min(buckets[1]))
+                    y_max = max(y_max, max(buckets[2]))
+
+        if self.history_y_min_max != (y_min, y_max):
+            self.history_y_min_max = (y_min, y_max)
+            self.update_y_scale(y_min, y_max)
+
+        return x_min, x_max, curves
+
     def clear_graph(self):
         self.curves_visible = [] # per curve visibility
         self.curves_x = [] # per curve x values
@@ -677,9 +1179,16 @@ class Plot(QWidget):
         self.y_min = None # minimum y value over all curves
         self.y_max = None # maximum y value over all curves
         self.y_type = None
+        self.curves_appended = [] # per curve number of values added since last clear
+        self.curves_history = [] # per curve aggregated history, if enabled
+        self.history_y_min_max = None # y value range of the last history view
 
         for plot in self.plots:
+            if self.history_enabled:
+                self.curves_history.append(CurveHistory())
+
             self.curves_visible.append(True)
+            self.curves_appended.append(0)
             self.curves_x.append([])
             self.curves_y.append([])
             self.curves_x_min.append(None)
@@ -687,20 +1196,26 @@ class Plot(QWidget):
             self.curves_y_min.append(None)
             self.curves_y_max.append(None)
 
+        if self.gl_canvas != None:
+            self.gl_canvas.clear()
+
         self.update()
 
 class PlotWidget(QWidget):
     def __init__(self, y_scale_title_text, plots, clear_button=None, parent=None,
                  scales_visible=True, curve_outer_border_visible=True,
-                 curve_motion_granularity=10, canvas_color=QColor(245, 245, 245),
-                 external_timer=None):
+                 curve_motion_granularity=10, canvas_color=QColor(245, 245, 245)):
         QWidget.__init__(self, parent)
 
         self.setMinimumSize(300, 250)
 
+        self.y_scale_title_text = y_scale_title_text
+        self.last_export_filename = None
         self.stop = True
+        # the history can only be navigated if the scales are visible
         self.plot = Plot(self, y_scale_title_text, plots, scales_visible,
-                         curve_outer_border_visible, curve_motion_granularity, canvas_color)
+                         curve_outer_border_visible, curve_motion_granularity, canvas_color,
+                         history_enabled=scales_visible)
         self.set_fixed_y_scale = self.plot.set_fixed_y_scale
         self.plot_buttons = []
         self.first_show = True
@@ -748,22 +1263,63 @@ class PlotWidget(QWidget):
         else:
             vlayout.addWidget(self.plot)
 
+        if self.plot.history_enabled:
+            self.span_combo = QComboBox(self)
+
+            for label, span in HISTORY_SPANS:
+                self.span_combo.addItem(label, span)
+
+            self.span_combo.currentIndexChanged.connect(self.span_changed)
+
+            # the scroll bar value is the end of the view in seconds, the
+            # maximum value means that the view follows the newest data
+            self.pan_scroll_bar = QScrollBar(Qt.Horizontal, self)
+            self.pan_scroll_bar.setRange(0, 0)
+            self.pan_scroll_bar.valueChanged.connect(self.pan_changed)
+
+            export_menu = QMenu(self)
+            export_menu.addAction('Save Data as CSV...').triggered.connect(lambda: self.save_data(FORMAT_CSV))
+            export_menu.addAction('Save Data as Binary...').triggered.connect(lambda: self.save_data(FORMAT_BINARY))
+            export_menu.addSeparator()
+            export_menu.addAction('Log Data to CSV...').triggered.connect(lambda: self.start_logging(FORMAT_CSV))
+            export_menu.addAction('Log Data to Binary...').triggered.connect(lambda: self.start_logging(FORMAT_BINARY))
+            self.stop_logging_action = export_menu.addAction('Stop Logging')
+            self.stop_logging_action.triggered.connect(self.stop_logging)
+            self.stop_logging_action.setEnabled(False)
+
+            self.export_button = QToolButton(self)
+            self.export_button.setText('Export')
+            self.export_button.setPopupMode(QToolButton.InstantPopup)
+            self.export_button.setMenu(export_menu)
+
+            history_layout = QHBoxLayout()
+            history_layout.setContentsMargins(0, 0, 0, 0)
+            history_layout.addWidget(QLabel('Time Span:', self))
+            history_layout.addWidget(self.span_combo)
+            history_layout.addWidget(self.pan_scroll_bar, 1)
+            history_layout.addWidget(self.export_button)
+
+            vlayout.addLayout(history_layout)
+        else:
+            self.span_combo = None
+            self.pan_scroll_bar = None
+
         if clear_button == None:
             vlayout.addWidget(self.clear_button)
 
         self.counter = 0
         self.update_funcs = []
+        self.pushed_samples = [] # per curve queue of (timestamp, value) tuples
+        self.pushed_time_offset = None # seconds, maps timestamps to plot time
 
         for plot in plots:
+            # curves without update function are fed through push_samples
             self.update_funcs.append(plot[2])
+            self.pushed_samples.append(deque(maxlen=PUSHED_SAMPLES_MAX_COUNT))
 
-        if external_timer == None:
-            self.timer = QTimer(self)
-            self.timer.timeout.connect(self.add_new_data)
-            self.timer.start(100)
-        else:
-            # assuming that the external timer runs with 100ms interval
-            external_timer.timeout.connect(self.add_new_data)
+        # the scheduler calls add_new_data every 100ms, all plot widgets
+        # are sampled in the same tick
+        get_plot_scheduler().add_plot_widget(self)
 
     # overrides QWidget.showEvent
     def showEvent(self, event):
@@ -787,20 +1343,200 @@ class PlotWidget(QWidget):
 
                     plot_button.setMinimumSize(size)
 
+    # can be called from any thread with timestamps in seconds (e.g. from
+    # time.time()) that constantly grow. the samples are queued and added
+    # to the plot in bulk on the next scheduler tick
+    def push_samples(self, c, timestamps, values):
+        if self.stop:
+            return
+
+        self.pushed_samples[c].extend(zip(timestamps, values))
+
+    # internal
+    def get_curve_names(self):
+        curve_names = []
+
+        for plot in self.plot.plots:
+            if len(plot[0]) > 0:
+                curve_names.append(plot[0])
+            else:
+                curve_names.append(self.y_scale_title_text)
+
+        return curve_names
+
+    # internal
+    def get_export_filename(self, title, format_):
+        if format_ == FORMAT_CSV:
+            extension = '.csv'
+        else:
+            extension = '.bvpd'
+
+        if self.last_export_filename != None:
+            directory = os.path.dirname(self.last_export_filename)
+        else:
+            directory = get_home_path()
+
+        filename = get_save_file_name(get_main_window(), title, directory, '*' + extension)
+
+        if len(filename) == 0:
+            return None
+
+        if not filename.endswith(extension):
+            filename += extension
+
+        self.last_export_filename = filename
+
+        return filename
+
+    # internal
+    def create_data_writer(self, title, format_):
+        filename = self.get_export_filename(title, format_)
+
+        if filename == None:
+            return None
+
+        try:
+            return PlotDataWriter(filename, format_, self.y_scale_title_text, self.get_curve_names())
+        except Exception as e:
+            QMessageBox.critical(get_main_window(), title + ' Error',
+                                 u'Could not open {0} for writing:\n\n{1}'.format(filename, e))
+            return None
+
+    # internal
+    def save_data(self, format_):
+        data_writer = self.create_data_writer('Save Plot Data', format_)
+
+        if data_writer == None:
+            return
+
+        for c in range(len(self.plot.plots)):
+            xs, ys = self.plot.get_export_data(c)
+
+            data_writer.write(c, xs, ys)
+
+        data_writer.close()
+        data_writer.join()
+
+        if data_writer.error != None:
+            QMessageBox.critical(get_main_window(), 'Save Plot Data Error',
+                                 u'Could not write to {0}:\n\n{1}'.format(data_writer.filename, data_writer.error))
+
+    # internal
+    def start_logging(self, format_):
+        self.stop_logging()
+
+        self.plot.data_writer = self.create_data_writer('Log Plot Data', format_)
+
+        self.stop_logging_action.setEnabled(self.plot.data_writer != None)
+
+    # internal
+    def stop_logging(self):
+        if self.plot.data_writer != None:
+            self.plot.data_writer.close()
+            self.plot.data_writer = None
+
+        self.stop_logging_action.setEnabled(False)
+
     # internal
     def add_new_data(self):
         if self.stop:
             return
 
+        data_writer = self.plot.data_writer
+
+        if data_writer != None and data_writer.error != None:
+            self.stop_logging()
+
+            QMessageBox.critical(get_main_window(), 'Log Plot Data Error',
+                                 u'Could not write to {0}:\n\n{1}'.format(data_writer.filename, data_writer.error))
+
+        time = self.counter * PLOT_SAMPLE_INTERVAL / 1000.0
+
         for i, update_func in enumerate(self.update_funcs):
+            if update_func == None:
+                continue
+
             value = update_func()
 
             if value != None:
-                self.plot.add_data(i, self.counter / 10.0, value)
+                self.plot.add_data(i, time, value)
+
+        for i, pushed_samples in enumerate(self.pushed_samples):
+            if len(pushed_samples) == 0:
+                continue
+
+            xs = []
+            ys = []
+
+            # deque.popleft is thread-safe, push_samples might add more
+            # samples concurrently. those will be added on the next tick
+            for k in xrange(len(pushed_samples)):
+                timestamp, value = pushed_samples.popleft()
+
+                if self.pushed_time_offset == None:
+                    self.pushed_time_offset = timestamp - time
+
+                xs.append(timestamp - self.pushed_time_offset)
+                ys.append(value)
+
+            self.plot.add_data_batch(i, xs, ys)
 
         self.counter += 1
 
+        self.update_pan_scroll_bar()
+
+    # adds recorded samples with timestamps in seconds relative to the start
+    # of the recording (e.g. from a time series log) to a stopped widget
+    def load_samples(self, c, timestamps, values):
+        self.plot.add_data_batch(c, timestamps, values)
+        self.update_pan_scroll_bar()
+
+    # internal
+    def update_pan_scroll_bar(self):
+        if self.pan_scroll_bar == None:
+            return
+
+        first_x, last_x = self.plot.get_history_range()
+
+        if first_x == None:
+            first_x = 0
+            last_x = 0
+
+        span = self.plot.view_span
+        maximum = int(math.ceil(last_x))
+        minimum = min(int(math.ceil(first_x + span)), maximum)
+
+        self.pan_scroll_bar.blockSignals(True)
+        self.pan_scroll_bar.setRange(minimum, maximum)
+        self.pan_scroll_bar.setPageStep(span)
+        self.pan_scroll_bar.setSingleStep(max(span // 10, 1))
+
+        if self.plot.view_end == None:
+            self.pan_scroll_bar.setValue(maximum)
+
+        self.pan_scroll_bar.blockSignals(False)
+
+    # internal
+    def span_changed(self, index):
+        self.plot.set_view(HISTORY_SPANS[index][1], self.plot.view_end)
+        self.update_pan_scroll_bar()
+
+    # internal
+    def pan_changed(self, value):
+        if value >= self.pan_scroll_bar.maximum():
+            self.plot.set_view(self.plot.view_span, None)
+        else:
+            self.plot.set_view(self.plot.view_span, value)
+
     # internal
     def clear_clicked(self):
         self.plot.clear_graph()
         self.counter = 0
+        self.pushed_time_offset = None
+
+        for pushed_samples in self.pushed_samples:
+            pushed_samples.clear()
+
+        if self.pan_scroll_bar != None:
+            self.plot.set_view(self.plot.view_span, None)
+            self.update_pan_scroll_bar()
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+brickv (Brick Viewer)
+
+lazy_plugin.py: Placeholder that constructs a plugin on first use
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public
+License along with this program; if not, write to the
+Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+Boston, MA 02111-1307, USA.
+"""
+
+import sys
+import traceback
+
+from PyQt4.QtGui import QWidget, QVBoxLayout
+
+from brickv.plugin_system.error import Error
+from brickv.plugin_system.plugin_base import PluginBase
+
+def get_device_class(plugin_class, device_identifier):
+    # every plugin module imports the binding class its has_device_identifier
+    # compares against
+    module = sys.modules[plugin_class.__module__]
+
+    for value in vars(module).values():
+        if getattr(value, 'DEVICE_IDENTIFIER', None) == device_identifier and \
+           hasattr(value, 'DEVICE_DISPLAY_NAME'):
+            return value
+
+    return None
+
+class LazyPlugin(QWidget):
+    """
+    Stands in for a plugin in the device info and its tab. Name, URL part
+    and the other metadata are available right away, the actual plugin and
+    its widgets are constructed when the plugin is started for the first
+    time, i.e. when its tab or window is shown.
+
+    The metadata methods of the plugin class only depend on the firmware
+    and hardware version, they are called with the placeholder as self
+    until the plugin exists.
+    """
+
+    def __init__(self, plugin_class, device_class, ipcon, uid, hardware_version, firmware_version):
+        QWidget.__init__(self)
+
+        self.plugin_class = plugin_class
+        self.ipcon = ipcon
+        self.uid = uid
+        self.hardware_version = hardware_version
+        self.firmware_version = firmware_version
+        self.plugin = None
+        self.label_timeouts_ = None
+        self.version_labels = None
+
+        # Bricks need a device object before their plugin exists, e.g. for
+        # flashing Bricklet plugins. the plugin adopts it once it is created,
+        # so references to it stay valid
+        self.stub_device = device_class(uid, ipcon)
+        self.base_name = device_class.DEVICE_DISPLAY_NAME
+
+        if self.is_hardware_version_relevant():
+            self.name = '{0} {1}.{2}'.format(self.base_name,
+                                             self.hardware_version[0],
+                                             self.hardware_version[1])
+        else:
+            self.name = self.base_name
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+
+    @property
+    def device(self):
+        if self.plugin != None and self.plugin.device != None:
+            return self.plugin.device
+
+        return self.stub_device
+
+    @property
+    def label_timeouts(self):
+        return self.label_timeouts_
+
+    @label_timeouts.setter
+    def label_timeouts(self, label_timeouts):
+        self.label_timeouts_ = label_timeouts
+
+        if self.plugin != None:
+            self.plugin.label_timeouts = label_timeouts
+
+    def get_plugin(self):
+        if self.plugin == None:
+            args = (self.ipcon, self.uid, self.hardware_version, self.firmware_version)
+
+            PluginBase.adopted_devices[self.uid] = self.stub_device
+
+            try:
+                self.plugin = self.plugin_class(*args)
+            except:
+                traceback.print_exc()
+                self.plugin = Error(*args)
+            finally:
+                del PluginBase.adopted_devices[self.uid]
+
+            self.plugin.label_timeouts = self.label_timeouts_
+            self.plugin.layout().setContentsMargins(0, 0, 0, 0)
+
+            if self.version_labels != None:
+                self.plugin.has_custom_version(*self.version_labels)
+
+            self.layout().addWidget(self.plugin)
+
+        return self.plugin
+
+    # internal
+    def call_metadata(self, name, *args):
+        if self.plugin != None:
+            return getattr(self.plugin, name)(*args)
+
+        return getattr(self.plugin_class, name).__func__(self, *args)
+
+    def start_plugin(self):
+        self.get_plugin().start_plugin()
+
+    def stop_plugin(self):
+        if self.plugin != None:
+            self.plugin.stop_plugin()
+
+    def pause_plugin(self):
+        if self.plugin != None:
+            self.plugin.pause_plugin()
+
+    def resume_plugin(self):
+        if self.plugin != None:
+            self.plugin.resume_plugin()
+
+    def destroy_plugin(self):
+        if self.plugin != None:
+            self.plugin.destroy_plugin()
+        else:
+            self.stub_device.registered_callbacks = {}
+
+    def has_reset_device(self):
+        return self.call_metadata('has_reset_device')
+
+    def has_drop_down(self):
+        return self.call_metadata('has_drop_down')
+
+    def drop_down_triggered(self, action):
+        self.get_plugin().drop_down_triggered(action)
+
+    # the labels are passed on to the plugin once it exists, until then the
+    # regular firmware version is shown
+    def has_custom_version(self, label_version_name, label_version):
+        if self.plugin != None:
+            return self.plugin.has_custom_version(label_version_name, label_version)
+
+        self.version_labels = (label_version_name, label_version)
+
+        return False
+
+    def reset_device(self):
+        self.get_plugin().reset_device()
+
+    def is_brick(self):
+        return self.call_metadata('is_brick')
+
+    def is_hardware_version_relevant(self):
+        return self.call_metadata('is_hardware_version_relevant')
+
+    def get_url_part(self):
+        return self.call_metadata('get_url_part')
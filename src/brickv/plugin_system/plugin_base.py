@@ -30,6 +30,11 @@ class PluginBase(QWidget, object):
     PLUGIN_STATE_RUNNING = 1
     PLUGIN_STATE_PAUSED = 2
 
+    # UID -> device object that a plugin constructed for that UID uses instead
+    # of creating a second one. set by LazyPlugin for the device it already
+    # handed out before the plugin existed
+    adopted_devices = {}
+
     def __init__(self, device_class, ipcon, uid, hardware_version, firmware_version, override_base_name=None):
         QWidget.__init__(self)
 
@@ -43,7 +48,15 @@ class PluginBase(QWidget, object):
 
         if device_class is not None:
             self.base_name = device_class.DEVICE_DISPLAY_NAME
-            self.device = device_class(uid, ipcon)
+            device = PluginBase.adopted_devices.get(uid)
+
+            if device != None and isinstance(device, device_class):
+                # there is only one device object per UID, otherwise the
+                # newer one gets all the responses in ipcon.devices
+                ipcon.devices[uid] = device
+                self.device = device
+            else:
+                self.device = device_class(uid, ipcon)
         else:
             self.base_name = 'Unnamed'
             self.device = None
@@ -24,6 +24,7 @@ Boston, MA 02111-1307, USA.
 
 from brickv.plugin_system.error import Error
 from brickv.plugin_system.unknown import Unknown
+from brickv.plugin_system.lazy_plugin import LazyPlugin, get_device_class
 from brickv.plugin_system.plugins import device_classes
 import traceback
 
@@ -34,7 +35,14 @@ class PluginManager(object):
     def get_plugin(self, device_identifier, ipcon, uid, hardware_version, firmware_version):
         for plugin in self.plugins:
             if plugin.has_device_identifier(device_identifier):
+                # the plugin widgets are only constructed when they are
+                # shown for the first time
+                device_class = get_device_class(plugin, device_identifier)
+
                 try:
+                    if device_class != None:
+                        return LazyPlugin(plugin, device_class, ipcon, uid, hardware_version, firmware_version)
+
                     return plugin(ipcon, uid, hardware_version, firmware_version)
                 except:
                     traceback.print_exc()
@@ -21,7 +21,7 @@ Free Software Foundation, Inc., 59 Temple Place - Suite 330,
 Boston, MA 02111-1307, USA.
 """
 
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
 import functools
 import weakref
 import threading
@@ -32,6 +32,10 @@ from brickv.bindings.brick_red import BrickRED
 from brickv.object_creator import create_object_in_qt_main_thread
 from brickv.utils import get_main_window
 
+# number of requests that are in flight while fetching or storing the chunks
+# of strings or the items of lists
+PIPELINE_WINDOW = 8
+
 class REDError(Exception):
     E_SUCCESS                  = 0
     E_UNKNOWN_ERROR            = 1
@@ -188,6 +192,9 @@ class REDSession(QtCore.QObject):
     KEEP_ALIVE_INTERVAL = 5 # seconds
     LIFETIME            = 60 # seconds
 
+    INTERNED_STRINGS_MAX_COUNT = 128
+    INTERNED_STRING_MAX_LENGTH = 1024 # characters, longer strings are not interned
+
     _qtcb_lost = QtCore.pyqtSignal(str)
 
     def __init__(self, brick, increase_error_count):
@@ -201,6 +208,18 @@ class REDSession(QtCore.QObject):
         self._last_keep_alive     = 0
         self.increase_error_count = increase_error_count
 
+        # maps the content of a string to its REDString in least recently used
+        # order. the string object is released by the RED Brick as soon as the
+        # last REDString reference to it is gone, the cache holds one of them
+        self._interned_strings      = OrderedDict()
+        self._interned_strings_lock = threading.Lock()
+
+        # the burst windows of the async file reads and writes, learned from
+        # the transfers over this session's link. each transfer starts with a
+        # copy and hands the window it learned back when it is done
+        self._async_read_flow_control  = REDAsyncFlowControl(REDFileBase.ASYNC_BURST_CHUNKS)
+        self._async_write_flow_control = REDAsyncFlowControl(REDFileBase.ASYNC_BURST_CHUNKS)
+
     def __del__(self):
         self.expire()
 
@@ -225,6 +244,8 @@ class REDSession(QtCore.QObject):
 
         # FIXME: use time.monotonic() in Python 3
         if abs(time.time() - self._last_keep_alive) > (REDSession.LIFETIME - REDSession.KEEP_ALIVE_INTERVAL * 2):
+            # the session and all its objects might be gone on the RED Brick
+            self._clear_interned_strings()
             self._qtcb_lost.emit(self._brick._uid_str)
             return
 
@@ -263,17 +284,63 @@ class REDSession(QtCore.QObject):
         session_id       = self._session_id
         self._session_id = None
 
+        self._clear_interned_strings()
+
         try:
             self._brick.expire_session_unchecked(session_id)
         except:
             # just report IPConnection-level error, but don't re-raise it
             self.increase_error_count()
 
+    def _clear_interned_strings(self):
+        with self._interned_strings_lock:
+            self._interned_strings = OrderedDict()
+
+    # returns an allocated REDString per value. strings with the same content
+    # as a recently used one share its string object instead of allocating a
+    # new one. the returned strings must not be modified
+    def intern_strings(self, values):
+        values_unicode = [unicode(value) for value in values]
+        strings        = {} # value -> REDString
+        missing        = []
+
+        with self._interned_strings_lock:
+            for value in values_unicode:
+                if value in strings:
+                    continue
+
+                string = self._interned_strings.pop(value, None)
+
+                if string != None and string.object_id is not None:
+                    self._interned_strings[value] = string # mark as most recently used
+                    strings[value] = string
+                elif value not in missing:
+                    missing.append(value)
+
+        missing_strings = [REDString(self) for value in missing]
+
+        _allocate_strings(self, missing_strings, missing)
+
+        with self._interned_strings_lock:
+            for value, string in zip(missing, missing_strings):
+                strings[value] = string
+
+                if len(value) <= REDSession.INTERNED_STRING_MAX_LENGTH:
+                    self._interned_strings[value] = string
+
+            while len(self._interned_strings) > REDSession.INTERNED_STRINGS_MAX_COUNT:
+                self._interned_strings.popitem(last=False)
+
+        return [strings[value] for value in values_unicode]
+
+    def intern_string(self, value):
+        return self.intern_strings([value])[0]
+
     @property
     def session_id(self): return self._session_id
 
 
-def _attach_or_release(session, object_class, object_id, extra_object_ids_to_release_on_error=None, extra_parameters=None):
+def _attach_or_release(session, object_class, object_id, extra_object_ids_to_release_on_error=None, extra_parameters=None, update=True):
     if extra_object_ids_to_release_on_error == None:
         extra_object_ids_to_release_on_error = []
 
@@ -283,7 +350,7 @@ def _attach_or_release(session, object_class, object_id, extra_object_ids_to_rel
         parameters += extra_parameters
 
     try:
-        obj = create_object_in_qt_main_thread(object_class, parameters).attach(object_id)
+        obj = create_object_in_qt_main_thread(object_class, parameters).attach(object_id, update)
     except:
         try:
             session._brick.release_object_unchecked(object_id, session._session_id)
@@ -303,6 +370,106 @@ def _attach_or_release(session, object_class, object_id, extra_object_ids_to_rel
     return obj
 
 
+# sends the requests, given as (function_id, data, form, form_ret) tuples, with
+# PIPELINE_WINDOW of them in flight and returns the results in order
+def _call_pipelined(session, requests):
+    if len(requests) == 0:
+        return []
+
+    brick = session._brick
+
+    try:
+        return brick.ipcon.send_pipelined_requests(brick, requests, PIPELINE_WINDOW)
+    except Error:
+        session.increase_error_count()
+        raise
+
+
+def _release_unchecked(session, object_ids):
+    for object_id in object_ids:
+        try:
+            session._brick.release_object_unchecked(object_id, session._session_id)
+        except:
+            # just report IPConnection-level error, but don't re-raise it
+            session.increase_error_count()
+
+
+# fetches the data of the attached string objects, the lengths of all strings
+# are fetched together first and then all chunks of all strings
+def _update_strings(session, strings):
+    for string in strings:
+        if string.object_id is None:
+            raise RuntimeError('Cannot update unattached string object')
+
+    results = _call_pipelined(session, [(BrickRED.FUNCTION_GET_STRING_LENGTH, (string.object_id,), 'H', 'B I')
+                                        for string in strings])
+    requests      = []
+    chunk_indices = [] # (index of string, offset)
+
+    for i, (error_code, length) in enumerate(results):
+        if error_code != REDError.E_SUCCESS:
+            raise REDError('Could not get length of string object {0}'.format(strings[i].object_id), error_code)
+
+        for offset in range(0, length, REDString.MAX_GET_CHUNK_BUFFER_LENGTH):
+            requests.append((BrickRED.FUNCTION_GET_STRING_CHUNK, (strings[i].object_id, offset), 'H I', 'B 63s'))
+            chunk_indices.append((i, offset))
+
+    chunks = [[] for string in strings]
+
+    for (i, offset), (error_code, chunk) in zip(chunk_indices, _call_pipelined(session, requests)):
+        if error_code != REDError.E_SUCCESS:
+            raise REDError('Could not get chunk of string object {0} at offset {1}'.format(strings[i].object_id, offset), error_code)
+
+        chunks[i].append(chunk)
+
+    for string, string_chunks in zip(strings, chunks):
+        string._data = ''.join(string_chunks).decode('utf-8')
+
+
+# allocates the string objects with the given data, all strings are allocated
+# together first and then the remaining chunks of all strings are set
+def _allocate_strings(session, strings, values):
+    for string in strings:
+        string.release()
+
+    values_unicode = [unicode(value) for value in values]
+    values_utf8    = [value.encode('utf-8') for value in values_unicode]
+    results        = _call_pipelined(session, [(BrickRED.FUNCTION_ALLOCATE_STRING,
+                                                (len(value_utf8), value_utf8[:REDString.MAX_ALLOCATE_BUFFER_LENGTH], session._session_id),
+                                                'I 58s H', 'B H')
+                                               for value_utf8 in values_utf8])
+    error          = None
+
+    # attach all allocated strings before raising an error, so they get
+    # released again
+    for string, (error_code, object_id) in zip(strings, results):
+        if error_code != REDError.E_SUCCESS:
+            if error == None:
+                error = REDError('Could not allocate string object', error_code)
+        else:
+            string.attach(object_id, False)
+
+    if error != None:
+        raise error
+
+    requests      = []
+    chunk_indices = [] # (index of string, offset)
+
+    for i, value_utf8 in enumerate(values_utf8):
+        for offset in range(REDString.MAX_ALLOCATE_BUFFER_LENGTH, len(value_utf8), REDString.MAX_SET_CHUNK_BUFFER_LENGTH):
+            chunk = value_utf8[offset:offset + REDString.MAX_SET_CHUNK_BUFFER_LENGTH]
+
+            requests.append((BrickRED.FUNCTION_SET_STRING_CHUNK, (strings[i].object_id, offset, chunk), 'H I 58s', 'B'))
+            chunk_indices.append((i, offset))
+
+    for (i, offset), error_code in zip(chunk_indices, _call_pipelined(session, requests)):
+        if error_code != REDError.E_SUCCESS:
+            raise REDError('Could not set chunk of string object {0} at offset {1}'.format(strings[i].object_id, offset), error_code)
+
+    for string, value_unicode in zip(strings, values_unicode):
+        string._data = value_unicode
+
+
 class REDObjectReleaser(object):
     def __init__(self, obj, object_id, session):
         self._object_ref  = weakref.ref(obj, self.release)
@@ -432,71 +599,10 @@ class REDString(REDObject):
         pass
 
     def update(self):
-        if self.object_id is None:
-            raise RuntimeError('Cannot update unattached string object')
-
-        try:
-            error_code, length = self._session._brick.get_string_length(self.object_id)
-        except Error:
-            self._session.increase_error_count()
-            raise
-
-        if error_code != REDError.E_SUCCESS:
-            raise REDError('Could not get length of string object {0}'.format(self.object_id), error_code)
-
-        data_utf8 = ''
-
-        while len(data_utf8) < length:
-            try:
-                error_code, chunk = self._session._brick.get_string_chunk(self.object_id, len(data_utf8))
-            except Error:
-                self._session.increase_error_count()
-                raise
-
-            if error_code != REDError.E_SUCCESS:
-                raise REDError('Could not get chunk of string object {0} at offset {1}'.format(self.object_id, len(data_utf8)), error_code)
-
-            data_utf8 += chunk
-
-        self._data = data_utf8.decode('utf-8')
+        _update_strings(self._session, [self])
 
     def allocate(self, data):
-        self.release()
-
-        data_unicode   = unicode(data)
-        data_utf8      = data_unicode.encode('utf-8')
-        chunk          = data_utf8[:REDString.MAX_ALLOCATE_BUFFER_LENGTH]
-        remaining_data = data_utf8[REDString.MAX_ALLOCATE_BUFFER_LENGTH:]
-
-        try:
-            error_code, object_id = self._session._brick.allocate_string(len(data_utf8), chunk, self._session._session_id)
-        except Error:
-            self._session.increase_error_count()
-            raise
-
-        if error_code != REDError.E_SUCCESS:
-            raise REDError('Could not allocate string object', error_code)
-
-        self.attach(object_id, False)
-
-        offset = len(chunk)
-
-        while len(remaining_data) > 0:
-            chunk          = remaining_data[:REDString.MAX_SET_CHUNK_BUFFER_LENGTH]
-            remaining_data = remaining_data[REDString.MAX_SET_CHUNK_BUFFER_LENGTH:]
-
-            try:
-                error_code = self._session._brick.set_string_chunk(self.object_id, offset, chunk)
-            except Error:
-                self._session.increase_error_count()
-                raise
-
-            if error_code != REDError.E_SUCCESS:
-                raise REDError('Could not set chunk of string object {0} at offset {1}'.format(self.object_id, offset), error_code)
-
-            offset += len(chunk)
-
-        self._data = data_unicode
+        _allocate_strings(self._session, [self], [data])
 
         return self
 
@@ -541,27 +647,43 @@ class REDList(REDObject):
         if error_code != REDError.E_SUCCESS:
             raise REDError('Could not get length of list object {0}'.format(self.object_id), error_code)
 
-        items = []
-
-        for i in range(length):
-            try:
-                error_code, item_object_id, type_ = self._session._brick.get_list_item(self.object_id, i, self._session._session_id)
-            except Error:
-                self._session.increase_error_count()
-                raise
+        results = _call_pipelined(self._session, [(BrickRED.FUNCTION_GET_LIST_ITEM, (self.object_id, i, self._session._session_id), 'H H H', 'B H B')
+                                                  for i in range(length)])
 
+        # release all items that were got before raising an error, otherwise
+        # they stay referenced until the session expires
+        for i, (error_code, item_object_id, type_) in enumerate(results):
             if error_code != REDError.E_SUCCESS:
+                _release_unchecked(self._session, [result[1] for result in results if result[0] == REDError.E_SUCCESS])
+
                 raise REDError('Could not get item at index {0} of list object {1}'.format(i, self.object_id), error_code)
 
+            if self._forced_wrapper_class == None and type_ not in REDObject._subclasses:
+                _release_unchecked(self._session, [result[1] for result in results])
+
+                raise TypeError('List object {0} contains item with unknown type {1} at index {2}'.format(self.object_id, type_, i))
+
+        items   = []
+        strings = []
+
+        for i, (error_code, item_object_id, type_) in enumerate(results):
             if self._forced_wrapper_class != None:
                 wrapper_class = self._forced_wrapper_class
             else:
-                try:
-                    wrapper_class = REDObject._subclasses[type_]
-                except KeyError:
-                    raise TypeError('List object {0} contains item with unknown type {1} at index {2}'.format(self.object_id, type_, i))
+                wrapper_class = REDObject._subclasses[type_]
+
+            # the strings are updated together afterwards. the items attached
+            # so far are released by their releasers on error
+            item = _attach_or_release(self._session, wrapper_class, item_object_id,
+                                      [result[1] for result in results[i + 1:]],
+                                      update=wrapper_class != REDString)
 
-            items.append(_attach_or_release(self._session, wrapper_class, item_object_id))
+            if wrapper_class == REDString:
+                strings.append(item)
+
+            items.append(item)
+
+        _update_strings(self._session, strings)
 
         self._items = items
 
@@ -579,20 +701,27 @@ class REDList(REDObject):
 
         self.attach(object_id, False)
 
+        objects = []
+        values  = []
+
         for item in items:
             if isinstance(item, str) or isinstance(item, unicode):
-                item = REDString(self._session).allocate(item)
-            elif not isinstance(item, REDObject):
+                values.append(item)
+                objects.append(None)
+            elif isinstance(item, REDObject):
+                objects.append(item)
+            else:
                 raise TypeError('Cannot append {0} item to list object {1}'.format(type(item), self.object_id))
 
-            try:
-                error_code = self._session._brick.append_to_list(self.object_id, item.object_id)
-            except Error:
-                self._session.increase_error_count()
-                raise
+        strings = iter(self._session.intern_strings(values))
+        objects = [obj if obj != None else next(strings) for obj in objects]
+
+        results = _call_pipelined(self._session, [(BrickRED.FUNCTION_APPEND_TO_LIST, (self.object_id, obj.object_id), 'H H', 'B')
+                                                  for obj in objects])
 
+        for obj, error_code in zip(objects, results):
             if error_code != REDError.E_SUCCESS:
-                raise REDError('Could not append item {0} to list object {1}'.format(item.object_id, self.object_id), error_code)
+                raise REDError('Could not append item {0} to list object {1}'.format(obj.object_id, self.object_id), error_code)
 
         self._items = items
 
@@ -611,6 +740,19 @@ class REDList(REDObject):
         return items
 
 
+# stores the first length bytes of chunk at offset of the preallocated buffer,
+# the buffer grows if it is too short. returns the offset after the chunk
+def _store_chunk(buffer_, offset, chunk, length):
+    end = offset + length
+
+    if end <= len(buffer_):
+        buffer_[offset:end] = chunk[:length]
+    else:
+        buffer_[offset:] = chunk[:length]
+
+    return end
+
+
 def _get_zero_padded_chunk(data, max_chunk_length, start = 0):
     chunk        = data[start:start + max_chunk_length]
     chunk_length = len(chunk)
@@ -619,18 +761,147 @@ def _get_zero_padded_chunk(data, max_chunk_length, start = 0):
     return chunk, chunk_length
 
 
+class REDAsyncFlowControl(object):
+    """
+    Number of chunks per async read or write burst, adapted to the link like
+    the congestion window of TCP. In the slow start the window doubles while
+    that still increases the throughput noticeably. After that it is moved
+    up or down in steps, depending on whether the last step paid off in
+    throughput, so it settles where a bigger window stops helping. A burst
+    that is much slower than the best throughput so far halves the window,
+    an error sets it back to the minimum. The session keeps one instance per
+    direction, so a transfer starts with what the previous ones learned.
+    Every transfer adapts its own copy, otherwise concurrent transfers would
+    take their shares of the link for a slowdown of each other.
+    """
+
+    MIN_WINDOW = 4
+    MAX_WINDOW = 200
+
+    SLOW_START_GAIN      = 1.25 # throughput increase per doubling that keeps the slow start going
+    MIN_ELASTICITY       = 0.1 # part of a relative window change that has to show up in the throughput
+    DELAY_FACTOR         = 2.0
+    THROUGHPUT_SMOOTHING = 0.25
+
+    def __init__(self, initial_window):
+        self._lock             = threading.Lock()
+        self._window           = initial_window
+        self._slow_start_limit = REDAsyncFlowControl.MAX_WINDOW
+        self._best_throughput  = 0.0
+        self._last_sample      = None # (window, throughput) of the previous burst
+        self._throughput       = 0.0
+
+    def __repr__(self):
+        return '<REDAsyncFlowControl window: {0}, throughput: {1:.0f} B/s>'.format(self._window, self._throughput)
+
+    # a burst of chunk_count chunks containing length bytes took duration
+    # seconds from its first request to its last callback
+    def add_burst(self, chunk_count, length, duration):
+        with self._lock:
+            # only full bursts with the current window are comparable, the
+            # last burst of a transfer is typically shorter
+            if chunk_count != self._window or duration <= 0:
+                return
+
+            window     = self._window
+            throughput = length / duration
+
+            if self._throughput == 0:
+                self._throughput = throughput
+            else:
+                self._throughput += (throughput - self._throughput) * REDAsyncFlowControl.THROUGHPUT_SMOOTHING
+
+            if throughput * REDAsyncFlowControl.DELAY_FACTOR < self._best_throughput:
+                # the link got slower, start over from its current throughput
+                self._window           = max(window // 2, REDAsyncFlowControl.MIN_WINDOW)
+                self._slow_start_limit = self._window
+                self._best_throughput  = throughput
+                self._last_sample      = None
+                return
+
+            if window < self._slow_start_limit:
+                if throughput >= self._best_throughput * REDAsyncFlowControl.SLOW_START_GAIN:
+                    self._window = min(window * 2, self._slow_start_limit)
+                else:
+                    # bigger bursts don't help much anymore
+                    self._slow_start_limit = window
+            else:
+                step = max(window // 8, REDAsyncFlowControl.MIN_WINDOW)
+
+                if self._is_bigger_window_better(window, throughput):
+                    self._window = min(window + step, REDAsyncFlowControl.MAX_WINDOW)
+                else:
+                    self._window = max(window - step, REDAsyncFlowControl.MIN_WINDOW)
+
+            self._best_throughput = max(self._best_throughput, throughput)
+            self._last_sample     = (window, throughput)
+
+    # internal
+    def _is_bigger_window_better(self, window, throughput):
+        if self._last_sample == None or self._last_sample[0] == window:
+            return True
+
+        last_window, last_throughput = self._last_sample
+        elasticity = (throughput / last_throughput - 1) / (float(window) / last_window - 1)
+
+        # a smaller window that did not cost throughput or a bigger one that
+        # did not gain any means the window is beyond what the link needs
+        return elasticity >= REDAsyncFlowControl.MIN_ELASTICITY
+
+    def add_error(self):
+        with self._lock:
+            self._slow_start_limit = max(self._window // 2, REDAsyncFlowControl.MIN_WINDOW)
+            self._window           = REDAsyncFlowControl.MIN_WINDOW
+            self._best_throughput  = 0.0
+            self._last_sample      = None
+
+    # returns an instance for a single transfer that starts with the window
+    # learned so far, but only compares the throughput of its own bursts
+    def copy(self):
+        with self._lock:
+            flow_control                   = REDAsyncFlowControl(self._window)
+            flow_control._slow_start_limit = self._slow_start_limit
+
+        return flow_control
+
+    # takes over the window learned by a finished transfer
+    def adopt(self, flow_control):
+        with flow_control._lock:
+            window           = flow_control._window
+            slow_start_limit = flow_control._slow_start_limit
+            throughput       = flow_control._throughput
+
+        with self._lock:
+            self._window           = window
+            self._slow_start_limit = slow_start_limit
+            self._best_throughput  = 0.0
+            self._last_sample      = None
+
+            if throughput > 0:
+                self._throughput = throughput
+
+    @property
+    def window(self):     return self._window
+    @property
+    def throughput(self): return self._throughput # bytes per second, smoothed over the recent bursts
+
+
 class REDFileBase(REDObject):
     class WriteAsyncData(QtCore.QObject):
         _qtcb_result = QtCore.pyqtSignal(object)
         _qtcb_status = QtCore.pyqtSignal(int, int)
 
-        def __init__(self, data, result_callback, status_callback):
+        def __init__(self, data, flow_control, result_callback, status_callback):
             QtCore.QObject.__init__(self)
 
-            self.data    = data
-            self.length  = len(data)
-            self.written = 0
-            self.abort   = False
+            self.data         = data
+            self.length       = len(data)
+            self.written      = 0
+            self.abort        = False
+            self.flow_control = flow_control
+            self.burst_start  = 0
+            self.burst_chunks = 0
+            self.burst_length = 0
 
             if result_callback != None:
                 self._qtcb_result.connect(result_callback, QtCore.Qt.QueuedConnection)
@@ -642,15 +913,24 @@ class REDFileBase(REDObject):
         _qtcb_result = QtCore.pyqtSignal(object)
         _qtcb_status = QtCore.pyqtSignal(int, int)
 
-        def __init__(self, max_length, result_callback, status_callback):
+        def __init__(self, max_length, capacity, target, flow_control, result_callback, status_callback):
             QtCore.QObject.__init__(self)
 
             self.max_length   = max_length
+            self.flow_control = flow_control
+            self.burst_start  = 0
+            self.burst_chunks = 0
+            self.burst_target = 0
             self.burst_length = 0
             self.data_length  = 0
-            self.data_chunks  = []
+            self.target       = target
             self.abort        = False
 
+            if target == None:
+                self.data = bytearray(capacity)
+            else:
+                self.data = None
+
             if result_callback != None:
                 self._qtcb_result.connect(result_callback, QtCore.Qt.QueuedConnection)
 
@@ -676,13 +956,14 @@ class REDFileBase(REDObject):
     EVENT_READABLE = BrickRED.FILE_EVENT_READABLE
     EVENT_WRITABLE = BrickRED.FILE_EVENT_WRITABLE
 
-    # data is always a bytearray containing the read data.
+    # data is a bytearray containing the read data or None if the data was
+    # written to a target file. length is the number of bytes read in both cases.
     # on success error is None, on failure error is an Exception object
-    AsyncReadResult = namedtuple('AsyncReadResult', 'data error')
+    AsyncReadResult = namedtuple('AsyncReadResult', 'data error length')
 
-    # Number of chunks written in one async read/write burst
-    ASYNC_BURST_CHUNKS      = 50
-    ASYNC_READ_BURST_LENGTH = ASYNC_BURST_CHUNKS * MAX_READ_ASYNC_BUFFER_LENGTH
+    # Number of chunks in one async read/write burst of a pipe and the initial
+    # window of the flow control of a file
+    ASYNC_BURST_CHUNKS = 50
 
     _qtcb_events_occurred = QtCore.pyqtSignal(int)
 
@@ -734,10 +1015,47 @@ class REDFileBase(REDObject):
     def _report_write_async_status(self):
         self._write_async_data._qtcb_status.emit(self._write_async_data.written, self._write_async_data.length)
 
+    # returns the REDAsyncFlowControl of the session for the given direction
+    # or None if the burst window is fixed
+    def _get_async_flow_control(self, write):
+        if write:
+            return self._session._async_write_flow_control
+        else:
+            return self._session._async_read_flow_control
+
+    # returns the REDAsyncFlowControl for a new transfer or None
+    def _create_async_flow_control(self, write):
+        flow_control = self._get_async_flow_control(write)
+
+        if flow_control == None:
+            return None
+        else:
+            return flow_control.copy()
+
+    def _get_async_burst_chunks(self, flow_control):
+        if flow_control == None:
+            return REDFileBase.ASYNC_BURST_CHUNKS
+        else:
+            return flow_control.window
+
+    # hands the window learned by a finished transfer back to the session
+    def _finish_async_flow_control(self, write, flow_control, error):
+        if flow_control == None:
+            return
+
+        # an aborted transfer says nothing about the link
+        if isinstance(error, Error) or \
+           (isinstance(error, REDError) and error.error_code != REDError.E_OPERATION_ABORTED):
+            flow_control.add_error()
+
+        self._get_async_flow_control(write).adopt(flow_control)
+
     def _report_write_async_result(self, error):
         if error != None and isinstance(error, Error):
             self._session.increase_error_count()
 
+        self._finish_async_flow_control(True, self._write_async_data.flow_control, error)
+
         self._write_async_data._qtcb_result.emit(error)
         self._write_async_data = None
 
@@ -753,6 +1071,13 @@ class REDFileBase(REDObject):
             self._report_write_async_result(REDError('Could not write to file object {0}'.format(self.object_id), error_code))
             return
 
+        flow_control = self._write_async_data.flow_control
+
+        if flow_control != None:
+            flow_control.add_burst(self._write_async_data.burst_chunks,
+                                   self._write_async_data.burst_length + length_written,
+                                   time.time() - self._write_async_data.burst_start) # FIXME: use time.monotonic() in Python 3
+
         # Remove data of async call. Data of unchecked writes has been removed already.
         self._write_async_data.written += length_written
         self._report_write_async_status()
@@ -769,10 +1094,14 @@ class REDFileBase(REDObject):
             self._report_write_async_result(REDError('Could not write to file object {0}'.format(self.object_id), REDError.E_OPERATION_ABORTED))
             return
 
+        burst_chunks     = self._get_async_burst_chunks(self._write_async_data.flow_control)
         unchecked_writes = 0
+        written          = self._write_async_data.written
+
+        self._write_async_data.burst_start = time.time() # FIXME: use time.monotonic() in Python 3
 
-        # do at most ASYNC_BURST_CHUNKS - 1 unchecked writes before the final async write per burst
-        while unchecked_writes < REDFileBase.ASYNC_BURST_CHUNKS - 1 and \
+        # do at most burst_chunks - 1 unchecked writes before the final async write per burst
+        while unchecked_writes < burst_chunks - 1 and \
               (self._write_async_data.length - self._write_async_data.written) > REDFileBase.MAX_WRITE_ASYNC_BUFFER_LENGTH:
             chunk, length_to_write = _get_zero_padded_chunk(self._write_async_data.data,
                                                             REDFileBase.MAX_WRITE_UNCHECKED_BUFFER_LENGTH,
@@ -787,6 +1116,9 @@ class REDFileBase(REDObject):
             self._write_async_data.written += length_to_write
             unchecked_writes               += 1
 
+        self._write_async_data.burst_chunks = unchecked_writes + 1
+        self._write_async_data.burst_length = self._write_async_data.written - written
+
         chunk, length_to_write = _get_zero_padded_chunk(self._write_async_data.data,
                                                         REDFileBase.MAX_WRITE_ASYNC_BUFFER_LENGTH,
                                                         self._write_async_data.written)
@@ -804,9 +1136,16 @@ class REDFileBase(REDObject):
         if error != None and isinstance(error, Error):
             self._session.increase_error_count()
 
-        data = bytearray().join(self._read_async_data.data_chunks)
+        self._finish_async_flow_control(False, self._read_async_data.flow_control, error)
+
+        data = self._read_async_data.data
 
-        self._read_async_data._qtcb_result.emit(REDFileBase.AsyncReadResult(data, error))
+        if data != None:
+            # drop the unused part of the preallocated buffer in place
+            del data[self._read_async_data.data_length:]
+
+        self._read_async_data._qtcb_result.emit(REDFileBase.AsyncReadResult(data, error,
+                                                                            self._read_async_data.data_length))
         self._read_async_data = None
 
     def _cb_async_read(self, file_id, error_code, buf, length_read):
@@ -828,17 +1167,37 @@ class REDFileBase(REDObject):
             self._report_read_async_result(None)
             return
 
+        if self._read_async_data.target != None:
+            try:
+                self._read_async_data.target.write(bytearray(buf[:length_read]))
+            except Exception as e:
+                try:
+                    self._session._brick.abort_async_file_read(self.object_id)
+                except:
+                    # just report IPConnection-level error, but don't re-raise it
+                    self._session.increase_error_count()
+
+                self._report_read_async_result(e)
+                return
+        else:
+            _store_chunk(self._read_async_data.data, self._read_async_data.data_length, buf, length_read)
+
         self._read_async_data.burst_length += length_read
         self._read_async_data.data_length  += length_read
 
-        self._read_async_data.data_chunks.append(bytearray(buf[:length_read]))
-
         if self._read_async_data.data_length >= self._read_async_data.max_length:
             # read max_length data, report the result
             self._report_read_async_status()
             self._report_read_async_result(None)
-        elif self._read_async_data.burst_length == REDFileBase.ASYNC_READ_BURST_LENGTH:
+        elif self._read_async_data.burst_length == self._read_async_data.burst_target:
             # burst finished, start next one
+            flow_control = self._read_async_data.flow_control
+
+            if flow_control != None:
+                flow_control.add_burst(self._read_async_data.burst_chunks,
+                                       self._read_async_data.burst_length,
+                                       time.time() - self._read_async_data.burst_start) # FIXME: use time.monotonic() in Python 3
+
             self._report_read_async_status()
             self._next_read_async_burst()
 
@@ -848,7 +1207,12 @@ class REDFileBase(REDObject):
         if remaining_length < 0:
             return
 
-        length_to_read                     = min(remaining_length, REDFileBase.ASYNC_READ_BURST_LENGTH)
+        burst_chunks   = self._get_async_burst_chunks(self._read_async_data.flow_control)
+        length_to_read = min(remaining_length, burst_chunks * REDFileBase.MAX_READ_ASYNC_BUFFER_LENGTH)
+
+        self._read_async_data.burst_start  = time.time() # FIXME: use time.monotonic() in Python 3
+        self._read_async_data.burst_chunks = -(-length_to_read // REDFileBase.MAX_READ_ASYNC_BUFFER_LENGTH)
+        self._read_async_data.burst_target = length_to_read
         self._read_async_data.burst_length = 0
 
         try:
@@ -932,16 +1296,27 @@ class REDFileBase(REDObject):
             raise RuntimeError('Another asynchronous write is already in progress')
 
         self._write_async_data = create_object_in_qt_main_thread(REDFileBase.WriteAsyncData,
-                                                                 (bytearray(data), result_callback, status_callback))
+                                                                 (bytearray(data), self._create_async_flow_control(True),
+                                                                  result_callback, status_callback))
 
         self._report_write_async_status()
         self._next_write_async_burst()
 
+    # returns how many bytes to preallocate for reading up to length bytes
+    def _get_read_capacity(self, length):
+        # the length of a regular file is known since the last update. if it
+        # grew since then the buffer grows as well
+        if self._type == REDFileBase.TYPE_REGULAR and self._length != None:
+            return max(min(length, self._length), 0)
+        else:
+            return 0
+
     def read(self, length):
         if self.object_id is None:
             raise RuntimeError('Cannot read from unattached file object')
 
-        data = bytearray()
+        data        = bytearray(self._get_read_capacity(length))
+        data_length = 0
 
         while length > 0:
             length_to_read = min(length, REDFileBase.MAX_READ_BUFFER_LENGTH)
@@ -959,20 +1334,32 @@ class REDFileBase(REDObject):
             if length_read == 0:
                 break
 
-            data   += bytearray(chunk[:length_read])
-            length -= length_read
+            data_length  = _store_chunk(data, data_length, chunk, length_read)
+            length      -= length_read
+
+        del data[data_length:]
 
         return data
 
-    def read_async(self, max_length, result_callback, status_callback=None):
+    # if target is given the data is written to it chunk by chunk instead of
+    # being collected in memory. target needs a write method, like a file, that
+    # is called from the callback thread
+    def read_async(self, max_length, result_callback, status_callback=None, target=None):
         if self.object_id is None:
             raise RuntimeError('Cannot read from unattached file object')
 
         if self._read_async_data != None:
             raise RuntimeError('Another asynchronous read is already in progress')
 
+        if target == None:
+            capacity = self._get_read_capacity(max_length)
+        else:
+            capacity = 0
+
         self._read_async_data = create_object_in_qt_main_thread(REDFileBase.ReadAsyncData,
-                                                                (max_length, result_callback, status_callback))
+                                                                (max_length, capacity, target,
+                                                                 self._create_async_flow_control(False),
+                                                                 result_callback, status_callback))
 
         self._report_read_async_status()
         self._next_read_async_burst()
@@ -1051,7 +1438,7 @@ class REDFile(REDFileBase):
         self.release()
 
         if not isinstance(name, REDString):
-            name = REDString(self._session).allocate(name)
+            name = self._session.intern_string(name)
 
         try:
             error_code, object_id = self._session._brick.open_file(name.object_id, flags, permissions, uid, gid, self._session._session_id)
@@ -1074,6 +1461,11 @@ class REDPipe(REDFileBase):
     def __repr__(self):
         return '<REDPipe object_id: {0}>'.format(self.object_id)
 
+    # the time until a pipe has data depends on the process at the other end,
+    # not on the link, so its bursts don't feed the flow control
+    def _get_async_flow_control(self, write):
+        return None
+
     def create(self, flags, length):
         self.release()
 
@@ -1427,7 +1819,7 @@ class REDProcess(REDObject):
         self.release()
 
         if not isinstance(executable, REDString):
-            executable = REDString(self._session).allocate(executable)
+            executable = self._session.intern_string(executable)
 
         if not isinstance(arguments, REDList):
             arguments = REDList(self._session).allocate(arguments)
@@ -1436,7 +1828,7 @@ class REDProcess(REDObject):
             environment = REDList(self._session).allocate(environment)
 
         if not isinstance(working_directory, REDString):
-            working_directory = REDString(self._session).allocate(working_directory)
+            working_directory = self._session.intern_string(working_directory)
 
         try:
             error_code, object_id = self._session._brick.spawn_process(executable.object_id,
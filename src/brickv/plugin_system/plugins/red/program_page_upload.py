@@ -28,18 +28,26 @@ from brickv.plugin_system.plugins.red.api import *
 from brickv.plugin_system.plugins.red.program_page import ProgramPage
 from brickv.plugin_system.plugins.red.program_utils import *
 from brickv.plugin_system.plugins.red.ui_program_page_upload import Ui_ProgramPageUpload
+from brickv.plugin_system.plugins.red.script_manager import check_script_result
 from brickv.load_pixmap import load_pixmap
 import os
 import posixpath
-import stat
 import time
+import json
+import zlib
 
-class ChunkedUploader(ChunkedUploaderBase):
-    def __init__(self, page):
-        ChunkedUploaderBase.__init__(self, page.wizard().session)
+class ProgramUploadScheduler(UploadScheduler):
+    def __init__(self, page, jobs):
+        UploadScheduler.__init__(self, page.wizard().session, jobs)
 
         self.page = page
 
+    def upload_started(self, job):
+        self.page.next_step(u'Uploading {0}...'.format(job.source), increase=0)
+
+    def upload_finished(self, job):
+        self.page.next_step(u'...uploaded {0}'.format(job.source))
+
     def report_error(self, message, *args):
         self.page.upload_error(u'...error: ' + message, *args)
 
@@ -51,10 +59,10 @@ class ChunkedUploader(ChunkedUploaderBase):
         self.page.progress_file.setFormat(message)
 
     def done(self):
-        self.page.chunked_uploader = None
+        self.page.upload_scheduler = None
 
-        self.page.log('...done')
-        self.page.upload_next_file()
+        self.page.progress_file.setVisible(False)
+        self.page.set_configuration()
 
 class ProgramPageUpload(ProgramPage, Ui_ProgramPageUpload):
     CONFLICT_RESOLUTION_REPLACE = 1
@@ -78,8 +86,9 @@ class ProgramPageUpload(ProgramPage, Ui_ProgramPageUpload):
         self.upload                          = None
         self.command                         = None
         self.created_directories             = set()
-        self.target_path                     = None # abolsute path on RED Brick in POSIX format
-        self.chunked_uploader                = None
+        self.existing_files                  = {} # path relative to bin directory -> walk entry
+        self.upload_jobs                     = []
+        self.upload_scheduler                = None
         self.replace_help_template           = self.label_replace_help.text()
         self.warnings                        = 0
         self.canceled                        = False
@@ -143,10 +152,10 @@ class ProgramPageUpload(ProgramPage, Ui_ProgramPageUpload):
 
     def cancel_upload(self):
         self.canceled    = True
-        chunked_uploader = self.chunked_uploader
+        upload_scheduler = self.upload_scheduler
 
-        if chunked_uploader != None:
-            chunked_uploader.canceled = True
+        if upload_scheduler != None:
+            upload_scheduler.cancel()
 
         if not self.edit_mode and self.program_defined:
             try:
@@ -337,125 +346,150 @@ class ProgramPageUpload(ProgramPage, Ui_ProgramPageUpload):
         else:
             self.root_directory = self.program.root_directory
 
-        self.progress_file.setRange(0, len(self.remaining_uploads))
+        self.check_existing_files()
+
+    def get_upload_permissions(self, upload):
+        # FIXME: workaround permission problem were this really matters (C/C++
+        #        and Delphi/Lazarus with cross-compiled executables)
+        if not self.edit_mode and \
+           self.language_api_name in ['c', 'delphi'] and \
+           posixpath.normpath(self.command[0]) == posixpath.normpath(upload.target):
+            return 0o755
 
-        self.upload_next_file()
+        return None # deduce from source file
 
-    def upload_next_file(self):
+    def check_existing_files(self):
         if self.canceled:
             return
 
-        if len(self.remaining_uploads) == 0:
-            self.progress_file.setVisible(False)
-            self.set_configuration()
+        # the bin directory of a new program is empty, there are no conflicts
+        if not self.edit_mode:
+            self.resolve_next_conflict()
             return
 
-        self.upload            = self.remaining_uploads[0]
-        self.remaining_uploads = self.remaining_uploads[1:]
-        source_path            = self.upload.source
+        def cb_walk(result):
+            if self.canceled:
+                return
 
-        self.next_step(u'Uploading {0}...'.format(source_path))
+            okay, message = check_script_result(result, decode_stderr=True)
 
-        try:
-            self.source_stat = os.stat(source_path)
-            self.source_file = open(source_path, 'rb')
-        except Exception as e:
-            self.upload_error('...error: Could not open source file {0}: {1}', source_path, e)
-            return
+            if not okay:
+                self.upload_error('...error: Could not check for existing files: {0}', message)
+                return
 
-        self.chunked_uploader = ChunkedUploader(self)
+            try:
+                walk = json.loads(zlib.decompress(buffer(result.stdout)).decode('utf-8'))
+            except:
+                walk = None
 
-        if not self.chunked_uploader.prepare(source_path):
-            return
+            if walk == None or not isinstance(walk, dict):
+                self.upload_error('...error: Could not check for existing files: Received invalid data')
+                return
 
-        self.target_path = posixpath.join(self.root_directory, 'bin', self.upload.target)
+            def expand(root, dw):
+                for child_name, child_dw in dw.get('c', {}).iteritems():
+                    child_path = posixpath.join(root, child_name)
 
-        # create target directory, if necessary
-        if len(posixpath.split(self.upload.target)[0]) > 0:
-            target_directory = posixpath.split(self.target_path)[0]
+                    if 'c' in child_dw:
+                        expand(child_path, child_dw)
+                    else:
+                        self.existing_files[child_path] = child_dw
 
-            if target_directory not in self.created_directories:
-                try:
-                    create_directory(self.wizard().session, target_directory, DIRECTORY_FLAG_RECURSIVE, 0o755, 1000, 1000)
-                except (Error, REDError) as e:
-                    self.upload_error('...error: Could not create target directory {0}: {1}', target_directory, e)
-                    return
+            expand('', walk)
 
-                self.created_directories.add(target_directory)
+            self.log('...done')
+            self.resolve_next_conflict()
 
-        self.continue_upload_file()
+        self.next_step('Checking for existing files...', increase=0)
 
-    def continue_upload_file(self, replace_existing=False):
-        flags = REDFile.FLAG_WRITE_ONLY | REDFile.FLAG_CREATE | REDFile.FLAG_NON_BLOCKING | REDFile.FLAG_EXCLUSIVE
+        self.wizard().script_manager.execute_script('walk', cb_walk,
+                                                    [posixpath.join(self.root_directory, 'bin')],
+                                                    max_length=1024*1024, decode_output_as_utf8=False)
 
-        if replace_existing:
-            flags |= REDFile.FLAG_REPLACE
+    # goes through the remaining uploads and stops at the first conflict that
+    # needs a decision by the user. starts the file uploads when all
+    # conflicts are resolved
+    def resolve_next_conflict(self):
+        if self.canceled:
+            return
 
-        # FIXME: preserving the executable bit this way only works well on
-        #        Linux and Mac OS X hosts. on Windows Python deduces this from
-        #        the file extension. this does not work if the executable is
-        #        cross-compiled and doesn't have the typical Windows file
-        #        extensions for executables
-        if (self.source_stat.st_mode & (stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)) != 0:
-            permissions = 0o755
-        else:
-            permissions = 0o644
+        while len(self.remaining_uploads) > 0:
+            self.upload            = self.remaining_uploads[0]
+            self.remaining_uploads = self.remaining_uploads[1:]
 
-        # FIXME: workaround permission problem were this really matters (C/C++
-        #        and Delphi/Lazarus with cross-compiled executables)
-        if not self.edit_mode and \
-           self.language_api_name in ['c', 'delphi'] and \
-           posixpath.normpath(self.command[0]) == posixpath.normpath(self.upload.target):
-            permissions = 0o755
+            if posixpath.normpath(self.upload.target) not in self.existing_files:
+                self.add_upload_job(False)
+                continue
 
-        try:
-            self.target_file = REDFile(self.wizard().session).open(self.target_path, flags,
-                                                                   permissions, 1000, 1000) # FIXME: async_call
-        except (Error, REDError) as e:
-            if e.error_code == REDError.E_ALREADY_EXISTS:
-                self.start_conflict_resolution()
+            self.log(u'Target file {0} already exists'.format(self.upload.target))
+
+            if self.auto_conflict_resolution == ProgramPageUpload.CONFLICT_RESOLUTION_REPLACE:
+                self.log(u'...replacing {0}'.format(self.upload.target))
+                self.add_upload_job(True)
+            elif self.auto_conflict_resolution == ProgramPageUpload.CONFLICT_RESOLUTION_SKIP:
+                self.log('...skipped')
+                self.next_step(u'Skipped {0}'.format(self.upload.source), log=False)
             else:
-                self.upload_error('...error: Could not open target file {0}: {1}', self.target_path, e)
+                self.start_conflict_resolution()
+                return
+
+        self.start_file_uploads()
+
+    def add_upload_job(self, replace_existing):
+        self.upload_jobs.append(UploadJob(self.upload.source,
+                                          posixpath.join(self.root_directory, 'bin', self.upload.target),
+                                          self.get_upload_permissions(self.upload),
+                                          replace_existing))
 
+    def start_file_uploads(self):
+        bin_directory = posixpath.join(self.root_directory, 'bin')
+
+        # create target directories, if necessary
+        for job in self.upload_jobs:
+            target_directory = posixpath.split(job.target)[0]
+
+            if target_directory != bin_directory and target_directory not in self.created_directories:
+                try:
+                    create_directory(self.wizard().session, target_directory, DIRECTORY_FLAG_RECURSIVE, 0o755, 1000, 1000)
+                except (Error, REDError) as e:
+                    self.upload_error('...error: Could not create target directory {0}: {1}', target_directory, e)
+                    return
+
+                self.created_directories.add(target_directory)
+
+        if len(self.upload_jobs) == 0:
+            self.set_configuration()
             return
 
         self.progress_file.setVisible(True)
-        self.chunked_uploader.start(self.target_path, self.target_file)
 
-    def start_conflict_resolution(self):
-        self.log(u'...target file {0} already exists'.format(self.upload.target))
-
-        if self.auto_conflict_resolution == ProgramPageUpload.CONFLICT_RESOLUTION_REPLACE:
-            self.log(u'...replacing {0}'.format(self.upload.target))
-            self.continue_upload_file(True)
-        elif self.auto_conflict_resolution == ProgramPageUpload.CONFLICT_RESOLUTION_SKIP:
-            self.log('...skipped')
-            self.upload_next_file()
-        else:
-            self.progress_file.setVisible(False)
+        self.upload_scheduler = ProgramUploadScheduler(self, self.upload_jobs)
+        self.upload_scheduler.start()
 
-            try:
-                target_file = REDFile(self.wizard().session).open(self.target_path, REDFile.FLAG_READ_ONLY, 0, 1000, 1000) # FIXME: async_call
+    def start_conflict_resolution(self):
+        try:
+            source_stat = os.stat(self.upload.source)
+        except Exception as e:
+            self.upload_error('...error: Could not open source file {0}: {1}', self.upload.source, e)
+            return
 
-                self.label_existing_stats.setText('{0}, last modified on {1}'
-                                                  .format(get_file_display_size(target_file.length),
-                                                          timestamp_to_date_at_time(int(target_file.modification_time))))
+        existing_file = self.existing_files[posixpath.normpath(self.upload.target)]
 
-                target_file.release()
-            except (Error, REDError) as e:
-                self.label_existing_stats.setText(u'<b>Error</b>: Could not open target file: {0}', Qt.escape(unicode(e)))
+        self.label_existing_stats.setText('{0}, last modified on {1}'
+                                          .format(get_file_display_size(existing_file['s']),
+                                                  timestamp_to_date_at_time(existing_file['l'])))
 
-            self.label_new_stats.setText('{0}, last modified on {1}'
-                                         .format(self.chunked_uploader.source_display_size,
-                                                 timestamp_to_date_at_time(int(self.chunked_uploader.source_stat.st_mtime))))
+        self.label_new_stats.setText('{0}, last modified on {1}'
+                                     .format(get_file_display_size(source_stat.st_size),
+                                             timestamp_to_date_at_time(int(source_stat.st_mtime))))
 
-            self.label_replace_help.setText(self.replace_help_template.replace('<FILE>', Qt.escape(self.upload.target)))
-            self.check_rename_new_file.setChecked(self.auto_conflict_resolution == ProgramPageUpload.CONFLICT_RESOLUTION_RENAME)
-            self.edit_new_name.setText('') # force a new-name check
-            self.edit_new_name.setText(posixpath.split(self.upload.target)[1])
+        self.label_replace_help.setText(self.replace_help_template.replace('<FILE>', Qt.escape(self.upload.target)))
+        self.check_rename_new_file.setChecked(self.auto_conflict_resolution == ProgramPageUpload.CONFLICT_RESOLUTION_RENAME)
+        self.edit_new_name.setText('') # force a new-name check
+        self.edit_new_name.setText(posixpath.split(self.upload.target)[1])
 
-            self.conflict_resolution_in_progress = True
-            self.update_ui_state()
+        self.conflict_resolution_in_progress = True
+        self.update_ui_state()
 
     def resolve_conflict_by_replace(self):
         if not self.conflict_resolution_in_progress or self.check_rename_new_file.isChecked():
@@ -471,14 +505,14 @@ class ProgramPageUpload(ProgramPage, Ui_ProgramPageUpload):
         self.conflict_resolution_in_progress = False
         self.update_ui_state()
 
-        self.continue_upload_file(True)
+        self.add_upload_job(True)
+        self.resolve_next_conflict()
 
     def rename_upload_target(self, new_name):
         if not self.conflict_resolution_in_progress:
             return
 
-        self.upload      = Upload(self.upload.source, posixpath.join(posixpath.split(self.upload.target)[0], new_name))
-        self.target_path = posixpath.join(self.root_directory, 'bin', self.upload.target)
+        self.upload = Upload(self.upload.source, posixpath.join(posixpath.split(self.upload.target)[0], new_name))
 
     def resolve_conflict_by_rename(self):
         if not self.conflict_resolution_in_progress or not self.check_rename_new_file.isChecked():
@@ -495,7 +529,9 @@ class ProgramPageUpload(ProgramPage, Ui_ProgramPageUpload):
         self.conflict_resolution_in_progress = False
         self.update_ui_state()
 
-        self.continue_upload_file(False)
+        # the new name might exist as well
+        self.remaining_uploads = [self.upload] + self.remaining_uploads
+        self.resolve_next_conflict()
 
     def skip_conflict(self):
         if not self.conflict_resolution_in_progress:
@@ -510,7 +546,8 @@ class ProgramPageUpload(ProgramPage, Ui_ProgramPageUpload):
         self.update_ui_state()
 
         self.log('...skipped')
-        self.upload_next_file()
+        self.next_step(u'Skipped {0}'.format(self.upload.source), log=False)
+        self.resolve_next_conflict()
 
     def set_configuration(self):
         # set command
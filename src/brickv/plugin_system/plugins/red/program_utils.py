@@ -42,6 +42,12 @@ Upload = namedtuple('Upload', 'source target')
 # target: path relative to download directory on host in host format
 Download = namedtuple('Download', 'source target')
 
+# source: absolute path on host in host format
+# target: absolute path on RED Brick in POSIX format
+# permissions: of the target file, None to deduce them from the source file
+# replace_existing: replace the target file if it exists, otherwise that's an error
+UploadJob = namedtuple('UploadJob', 'source target permissions replace_existing')
+
 
 class Constants(object):
     PAGE_GENERAL    = 1001
@@ -1128,18 +1134,19 @@ class ChunkedDownloaderBase(object):
             return
 
         if result.error != None:
-            self.report_error('Could not read from source file {0}: {1}', self.source_path, result.error)
-            return
+            # the data is written to the target file while it is read, so
+            # any other exception comes from writing to the target file
+            if isinstance(result.error, (Error, REDError)):
+                self.report_error('Could not read from source file {0}: {1}', self.source_path, result.error)
+            else:
+                self.report_error('Could not write to target file {0}: {1}', self.target_path, result.error)
 
-        try:
-            self.target_file.write(result.data)
-        except Exception as e:
-            self.report_error('Could not write to target file {0}: {1}', self.target_path, e)
             return
 
-        self.remaining_source_size -= len(result.data)
+        self.remaining_source_size -= result.length
 
-        if self.remaining_source_size > 0:
+        # stop if the source file got shorter since it was opened
+        if self.remaining_source_size > 0 and result.length > 0:
             self.download_read_async()
         else:
             self.download_read_async_done()
@@ -1170,9 +1177,10 @@ class ChunkedDownloaderBase(object):
         self.last_download_size = 0
 
         try:
-            self.source_file.read_async(min(self.remaining_source_size, 1000*1000*10), # Read 10mb at a time
+            self.source_file.read_async(self.remaining_source_size,
                                         self.download_read_async_cb_result,
-                                        self.download_read_async_cb_status)
+                                        self.download_read_async_cb_status,
+                                        self.target_file)
         except (Error, REDError) as e:
             self.report_error('Could not read from source file {0}: {1}', self.source_path, e)
 
@@ -1374,6 +1382,170 @@ class ChunkedUploaderBase(object):
         pass
 
 
+class ScheduledUploader(ChunkedUploaderBase):
+    def __init__(self, scheduler, job):
+        ChunkedUploaderBase.__init__(self, scheduler.session)
+
+        self.scheduler = scheduler
+        self.job       = job
+        self.progress  = 0
+
+    def report_error(self, message, *args):
+        self.scheduler.upload_failed(message, *args)
+
+    def set_progress_value(self, value, message):
+        self.progress = value
+
+        self.scheduler.report_progress()
+
+    def done(self):
+        self.scheduler.upload_done(self)
+
+
+class UploadScheduler(object):
+    """
+    Uploads a list of UploadJobs with up to MAX_PARALLEL_UPLOADS files in
+    flight. Opening the source and target files of the next uploads overlaps
+    with the data transfer of the running ones, which matters if there are
+    many small files. Conflicts have to be resolved before, the progress is
+    reported in bytes over all files.
+    """
+
+    MAX_PARALLEL_UPLOADS = 4
+
+    def __init__(self, session, jobs):
+        self.session            = session
+        self.remaining_jobs     = list(jobs)
+        self.uploaders          = [] # running uploads
+        self.total_size         = 0
+        self.total_display_size = None
+        self.finished_size      = 0 # of the finished uploads
+        self.canceled           = False
+        self.failed             = False
+
+    def start(self):
+        try:
+            self.total_size = sum(os.stat(job.source).st_size for job in self.remaining_jobs)
+        except Exception as e:
+            self.report_error('Could not open source file {0}: {1}', e.filename, e)
+            return
+
+        self.total_display_size = get_file_display_size(self.total_size)
+
+        self.set_progress_maximum(self.total_size)
+        self.set_progress_value(0, get_file_display_size(0) + ' of ' + self.total_display_size)
+
+        self.start_next_uploads()
+
+    def cancel(self):
+        self.canceled = True
+
+        for uploader in self.uploaders:
+            uploader.canceled = True
+
+    # internal
+    def start_next_uploads(self):
+        while not self.canceled and not self.failed and \
+              len(self.remaining_jobs) > 0 and len(self.uploaders) < UploadScheduler.MAX_PARALLEL_UPLOADS:
+            job      = self.remaining_jobs.pop(0)
+            uploader = ScheduledUploader(self, job)
+
+            self.uploaders.append(uploader)
+
+            if not uploader.prepare(job.source):
+                return
+
+            self.upload_started(job)
+            self.open_target_file(uploader)
+
+    # internal
+    def open_target_file(self, uploader):
+        job   = uploader.job
+        flags = REDFile.FLAG_WRITE_ONLY | REDFile.FLAG_CREATE | REDFile.FLAG_NON_BLOCKING | REDFile.FLAG_EXCLUSIVE
+
+        if job.replace_existing:
+            flags |= REDFile.FLAG_REPLACE
+
+        # FIXME: preserving the executable bit this way only works well on
+        #        Linux and Mac OS X hosts. on Windows Python deduces this from
+        #        the file extension. this does not work if the executable is
+        #        cross-compiled and doesn't have the typical Windows file
+        #        extensions for executables
+        if job.permissions != None:
+            permissions = job.permissions
+        elif (uploader.source_stat.st_mode & (stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)) != 0:
+            permissions = 0o755
+        else:
+            permissions = 0o644
+
+        def cb_open(target_file):
+            if self.canceled or self.failed:
+                target_file.release()
+                uploader.source_file.close()
+                return
+
+            uploader.start(job.target, target_file)
+
+        def cb_open_error(error):
+            self.upload_failed('Could not open target file {0}: {1}', job.target, error)
+
+        async_call(REDFile(self.session).open, (job.target, flags, permissions, 1000, 1000),
+                   cb_open, cb_open_error, report_exception=True)
+
+    # internal
+    def report_progress(self):
+        progress = self.finished_size + sum(uploader.progress for uploader in self.uploaders)
+
+        self.set_progress_value(progress, get_file_display_size(progress) + ' of ' + self.total_display_size)
+
+    # internal
+    def upload_done(self, uploader):
+        self.uploaders.remove(uploader)
+
+        self.finished_size += uploader.source_stat.st_size
+
+        self.upload_finished(uploader.job)
+
+        if self.canceled or self.failed:
+            return
+
+        if len(self.remaining_jobs) == 0 and len(self.uploaders) == 0:
+            self.done()
+        else:
+            self.start_next_uploads()
+
+    # internal
+    def upload_failed(self, message, *args):
+        if self.failed:
+            return
+
+        self.failed = True
+
+        # stop the other uploads, only the first error is reported
+        for uploader in self.uploaders:
+            uploader.canceled = True
+
+        self.report_error(message, *args)
+
+    def upload_started(self, job):
+        pass
+
+    def upload_finished(self, job):
+        pass
+
+    def report_error(self, message, *args):
+        pass
+
+    def set_progress_maximum(self, maximum):
+        pass
+
+    def set_progress_value(self, value, message):
+        pass
+
+    def done(self):
+        pass
+
+
 class TextFile(object):
     ERROR_KIND_OPEN = 1
     ERROR_KIND_READ = 2
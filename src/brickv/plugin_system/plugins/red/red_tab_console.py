@@ -28,7 +28,7 @@ from brickv.plugin_system.plugins.red.red_tab import REDTab
 from brickv.plugin_system.plugins.red.ui_red_tab_console import Ui_REDTabConsole
 from brickv.plugin_system.plugins.red.api import *
 from brickv.plugin_system.plugins.red.pyqterm import TerminalWidget
-from brickv.samba import get_serial_ports
+from brickv.serial_port_monitor import SerialPortMonitor
 from brickv.utils import get_main_window
 
 class REDTabConsole(REDTab, Ui_REDTabConsole):
@@ -42,6 +42,10 @@ class REDTabConsole(REDTab, Ui_REDTabConsole):
         self.console = TerminalWidget()
         self.console_layout.insertWidget(1, self.console)
 
+        # discovering the serial ports can block, it's done in the background
+        self.serial_port_monitor = SerialPortMonitor()
+        self.serial_port_monitor.ports_changed.connect(self.serial_ports_changed)
+
         self.refresh_button.clicked.connect(self.refresh_ports)
         self.connect_button.clicked.connect(self.connect_clicked)
         self.copy_button.clicked.connect(self.console.copy_selection_to_clipboard)
@@ -54,15 +58,19 @@ class REDTabConsole(REDTab, Ui_REDTabConsole):
         self.copy_button.setFocusPolicy(QtCore.Qt.NoFocus)
         self.setFocusPolicy(QtCore.Qt.NoFocus)
 
-        self.refresh_ports()
+        self.serial_ports_changed([])
 
     def refresh_ports(self):
+        self.serial_port_monitor.rescan()
+
+    def serial_ports_changed(self, ports):
+        # don't change the port of an open console, the current ports are
+        # shown when it gets closed
+        if self.console._session != None:
+            return
+
         current_text = self.combo_serial_port.currentText()
         self.combo_serial_port.clear()
-        try:
-            ports = get_serial_ports()
-        except:
-            ports = []
 
         preferred_index = None
 
@@ -81,17 +89,21 @@ class REDTabConsole(REDTab, Ui_REDTabConsole):
 
         self.combo_serial_port.setEnabled(self.combo_serial_port.count() > 0)
 
+        # the ports are updated automatically, keep the selection if the
+        # selected port is still there
+        current_index = self.combo_serial_port.findText(current_text)
+
         if self.combo_serial_port.count() == 0:
             self.combo_serial_port.addItem('No serial port found')
             self.connect_button.setEnabled(False)
+        elif current_index >= 0:
+            self.combo_serial_port.setCurrentIndex(current_index)
+            self.connect_button.setEnabled(True)
         elif preferred_index is not None:
             self.combo_serial_port.setCurrentIndex(preferred_index)
             self.connect_button.setEnabled(True)
         else:
             self.connect_button.setEnabled(True)
-            index = self.combo_serial_port.findText(current_text)
-            if index >= 0:
-                self.combo_serial_port.setCurrentIndex(index)
 
     def connect_clicked(self):
         text = self.connect_button.text()
@@ -148,11 +160,18 @@ class REDTabConsole(REDTab, Ui_REDTabConsole):
         self.console.setEnabled(False)
         self.connect_button.setText("Connect")
 
+        ports = self.serial_port_monitor.get_ports()
+
+        if ports != None:
+            self.serial_ports_changed(ports)
+
     def tab_on_focus(self):
         self.console._reset()
+        self.serial_port_monitor.start()
 
     def tab_off_focus(self):
-        pass
+        self.serial_port_monitor.stop()
 
     def tab_destroy(self):
+        self.serial_port_monitor.stop()
         self.destroy_session()
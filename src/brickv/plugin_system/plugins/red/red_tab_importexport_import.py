@@ -33,12 +33,12 @@ from brickv.async_call import async_call
 from brickv.utils import get_main_window, get_home_path, get_open_file_name
 from brickv.plugin_system.plugins.red.ui_red_tab_importexport_import import Ui_REDTabImportExportImport
 from brickv.plugin_system.plugins.red.api import *
-from brickv.plugin_system.plugins.red.program_utils import Constants, ChunkedUploaderBase, ExpandingProgressDialog
+from brickv.plugin_system.plugins.red.program_utils import Constants, UploadJob, UploadScheduler, ExpandingProgressDialog
 from brickv.plugin_system.plugins.red.script_manager import report_script_result
 
-class ChunkedUploader(ChunkedUploaderBase):
-    def __init__(self, widget, done_callback):
-        ChunkedUploaderBase.__init__(self, widget.session)
+class ArchiveUploader(UploadScheduler):
+    def __init__(self, widget, jobs, done_callback):
+        UploadScheduler.__init__(self, widget.session, jobs)
 
         self.widget        = widget
         self.done_callback = done_callback
@@ -65,7 +65,7 @@ class ChunkedUploader(ChunkedUploaderBase):
             self.widget.progress.set_progress_text(message)
 
     def done(self):
-        self.widget.chunked_uploader = None
+        self.widget.archive_uploader = None
 
         self.done_callback()
 
@@ -81,7 +81,7 @@ class REDTabImportExportImport(QWidget, Ui_REDTabImportExportImport):
         self.image_version       = None # Set from REDTabImportExport
         self.refresh_in_progress = False
         self.progress            = None
-        self.chunked_uploader    = None
+        self.archive_uploader    = None
 
         self.button_browse_archive.clicked.connect(self.browse_archive)
         self.edit_archive.textChanged.connect(self.update_ui_state)
@@ -251,10 +251,10 @@ class REDTabImportExportImport(QWidget, Ui_REDTabImportExportImport):
         script_instance_ref = [None]
 
         def progress_canceled():
-            chunked_uploader = self.chunked_uploader
+            archive_uploader = self.archive_uploader
 
-            if chunked_uploader != None:
-                chunked_uploader.canceled = True
+            if archive_uploader != None:
+                archive_uploader.cancel()
 
             script_instance = script_instance_ref[0]
 
@@ -342,21 +342,12 @@ class REDTabImportExportImport(QWidget, Ui_REDTabImportExportImport):
             # step 2/4: upload archive to temporary import directory
             import_directory_ref[0] = result.stdout.strip()
             target_path             = posixpath.join(import_directory_ref[0], 'archive.tfrba')
-            self.chunked_uploader   = ChunkedUploader(self, extract_archive)
-
-            if not self.chunked_uploader.prepare(source_path):
-                return
-
-            try:
-                target_file = REDFile(self.session).open(target_path, REDFile.FLAG_WRITE_ONLY | REDFile.FLAG_CREATE | REDFile.FLAG_NON_BLOCKING | REDFile.FLAG_EXCLUSIVE, 0o644, 1000, 1000) # FIXME: async_call
-            except (Error, REDError) as e:
-                QMessageBox.information(get_main_window(), 'Import Error',
-                                        'Could not open target file {0}: {1}'.format(target_path, e))
-                return
+            self.archive_uploader   = ArchiveUploader(self, [UploadJob(source_path, target_path, 0o644, False)],
+                                                      extract_archive)
 
             self.progress.setLabelText('Step 2 of 4: Uploading archive')
             self.progress.set_progress_text_visible(True)
-            self.chunked_uploader.start(target_path, target_file)
+            self.archive_uploader.start()
 
         # step 1/4: create temporary import directory
         script_instance_ref[0] = self.script_manager.execute_script('import_directory', cb_import_directory, execute_as_user=True)
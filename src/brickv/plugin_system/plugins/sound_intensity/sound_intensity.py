@@ -25,9 +25,11 @@ Boston, MA 02111-1307, USA.
 from brickv.plugin_system.plugin_base import PluginBase
 from brickv.bindings.bricklet_sound_intensity import BrickletSoundIntensity
 from brickv.async_call import async_call
-#from brickv.plot_widget import PlotWidget
+from brickv.plot_widget import PlotWidget
 from brickv.utils import CallbackEmulator
 
+import time
+
 from PyQt4.QtGui import QVBoxLayout, QLabel, QHBoxLayout, QWidget, \
                         QLinearGradient, QPainter, QSizePolicy, QColor
 from PyQt4.QtCore import Qt
@@ -88,8 +90,10 @@ class SoundIntensity(PluginBase):
         self.current_value = None
         self.thermo = TuningThermo()
 
-        #plot_list = [['', Qt.red, self.get_current_value]]
-        #self.plot_widget = PlotWidget('Intensity Value', plot_list)
+        # the intensity is polled every 25ms, push every value to the plot
+        # instead of letting the plot sample it every 100ms
+        plot_list = [['', Qt.red, None]]
+        self.plot_widget = PlotWidget('Intensity Value', plot_list)
 
         layout_h = QHBoxLayout()
         layout_h.addStretch()
@@ -104,28 +108,24 @@ class SoundIntensity(PluginBase):
         layout = QVBoxLayout(self)
         layout.addLayout(layout_h)
         layout.addLayout(layout_h2)
-        layout.addStretch()
-        #layout.addWidget(QLabel('')) # abuse a label as a fixed-size spacer
-        #layout.addWidget(self.plot_widget)
-
-    def get_current_value(self):
-        return self.current_value
+        layout.addWidget(self.plot_widget)
 
     def cb_intensity(self, intensity):
         self.thermo.set_value(intensity)
         self.current_value = intensity
         self.intensity_label.setText(str(intensity))
+        self.plot_widget.push_samples(0, [time.time()], [intensity])
 
     def start(self):
         async_call(self.si.get_intensity, None, self.cb_intensity, self.increase_error_count)
         self.cbe_intensity.set_period(25)
 
-        #self.plot_widget.stop = False
+        self.plot_widget.stop = False
 
     def stop(self):
         self.cbe_intensity.set_period(0)
 
-        #self.plot_widget.stop = True
+        self.plot_widget.stop = True
 
     def destroy(self):
         pass
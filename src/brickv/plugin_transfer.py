@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+"""
+brickv (Brick Viewer)
+
+plugin_transfer.py: Pipelined writing and verifying of Bricklet plugins
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public
+License along with this program; if not, write to the
+Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+Boston, MA 02111-1307, USA.
+"""
+
+import time
+import struct
+import logging
+import threading
+from collections import deque
+
+from PyQt4.QtCore import QObject, pyqtSignal
+
+from brickv.bindings.ip_connection import IPConnection, Error, get_function_id_from_data, \
+                                          get_sequence_number_from_data, get_error_code_from_data
+
+try:
+    from queue import Queue, Empty
+except ImportError:
+    from Queue import Queue, Empty # Python 2 fallback
+
+# the sequence numbers cycle through 15 values that are shared with all other
+# requests on the connection, so the window stays well below that. the Brick
+# handles the requests one after the other, more requests in flight only fill
+# its receive buffer without making the transfer faster
+MAX_WINDOW = 8
+MAX_RETRIES = 3
+
+# a response that takes this much longer than the requests queued in front of
+# it explain means the Brick cannot keep up, the window is shrunk then
+CONGESTION_FACTOR = 2.0
+
+OP_WRITE = 0
+OP_READ = 1
+
+OP_FUNCTION_IDS = {
+    OP_WRITE: IPConnection.FUNCTION_WRITE_BRICKLET_PLUGIN,
+    OP_READ: IPConnection.FUNCTION_READ_BRICKLET_PLUGIN
+}
+
+OP_MESSAGES = {
+    OP_WRITE: 'Could not write Bricklet plugin',
+    OP_READ: 'Could not read Bricklet plugin back for verification'
+}
+
+class PluginTransferError(Exception):
+    def __init__(self, message, error=None):
+        Exception.__init__(self, message)
+
+        self.message = message
+        self.error = error # ip_connection.Error or None
+
+def split_plugin(plugin):
+    chunks = []
+
+    for offset in range(0, len(plugin), IPConnection.PLUGIN_CHUNK_SIZE):
+        chunk = list(plugin[offset:offset + IPConnection.PLUGIN_CHUNK_SIZE])
+        chunk += [0] * (IPConnection.PLUGIN_CHUNK_SIZE - len(chunk))
+
+        chunks.append(chunk)
+
+    return chunks
+
+def error_from_code(function_id, error_code):
+    if error_code == 1:
+        return Error(Error.INVALID_PARAMETER, 'Got invalid parameter for function {0}'.format(function_id))
+    elif error_code == 2:
+        return Error(Error.NOT_SUPPORTED, 'Function {0} is not supported'.format(function_id))
+    else:
+        return Error(Error.UNKNOWN_ERROR_CODE, 'Function {0} returned an unknown error'.format(function_id))
+
+class PluginTransfer(QObject):
+    """
+    Writes a Bricklet plugin in a background thread and reads every chunk
+    back for verification right after its write was acknowledged. Several
+    requests are kept in flight, the size of that window is adapted to the
+    measured response times. Lost responses are retried with a window of 1.
+    """
+
+    progress_changed = pyqtSignal(int, int) # value, maximum
+    finished = pyqtSignal(object) # None on success, otherwise a PluginTransferError
+
+    def __init__(self, ipcon, device, port, plugin):
+        QObject.__init__(self)
+
+        self.ipcon = ipcon
+        self.device = device
+        self.port = port
+        self.chunks = split_plugin(plugin)
+        self.thread = None
+        self.window = 1
+        self.max_window_used = 1
+        self.responses_since_change = 0
+        self.min_rtt = None
+        self.retry_count = 0
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    # internal
+    def run(self):
+        start = time.time()
+
+        try:
+            self.transfer()
+        except PluginTransferError as e:
+            self.finished.emit(e)
+            return
+        except Error as e:
+            self.finished.emit(PluginTransferError(OP_MESSAGES[OP_WRITE], e))
+            return
+        except:
+            logging.exception('Error while transferring Bricklet plugin')
+            self.finished.emit(PluginTransferError(OP_MESSAGES[OP_WRITE]))
+            return
+
+        logging.info('Wrote and verified {0} plugin chunks in {1:.2f} s (window up to {2}, {3} retries)'
+                     .format(len(self.chunks), time.time() - start, self.max_window_used, self.retry_count))
+
+        self.finished.emit(None)
+
+    # internal
+    def transfer(self):
+        maximum = len(self.chunks) * 2
+        done = 0
+        pending = deque((OP_WRITE, position) for position in range(len(self.chunks)))
+        outstanding = {} # sequence number -> (op, position, sent_at)
+        retries = {} # (op, position) -> count
+        queue = Queue()
+
+        self.progress_changed.emit(0, maximum)
+
+        with self.device.request_lock:
+            self.device.pipelined_response_queue = queue
+
+            try:
+                while done < maximum:
+                    while len(pending) > 0 and len(outstanding) < self.window:
+                        op, position = pending[0]
+                        sequence_number = self.send(op, position, lambda s: s not in outstanding)
+
+                        # the sequence number is still in flight, the next
+                        # response has to be received first
+                        if sequence_number == None:
+                            break
+
+                        pending.popleft()
+                        outstanding[sequence_number] = (op, position, time.time())
+
+                    try:
+                        packet = queue.get(True, self.ipcon.timeout)
+                    except Empty:
+                        self.handle_timeout(queue, pending, outstanding, retries)
+                        continue
+
+                    sequence_number = get_sequence_number_from_data(packet)
+                    function_id = get_function_id_from_data(packet)
+
+                    # ignore responses that arrived after their timeout
+                    if sequence_number not in outstanding or \
+                       OP_FUNCTION_IDS[outstanding[sequence_number][0]] != function_id:
+                        continue
+
+                    op, position, sent_at = outstanding.pop(sequence_number)
+                    error_code = get_error_code_from_data(packet)
+
+                    self.adapt_window(time.time() - sent_at)
+
+                    if error_code != 0:
+                        raise PluginTransferError(OP_MESSAGES[op], error_from_code(function_id, error_code))
+
+                    if op == OP_WRITE:
+                        # verify the chunk next, before the remaining writes
+                        pending.appendleft((OP_READ, position))
+                    elif list(struct.unpack('<32B', packet[8:40])) != self.chunks[position]:
+                        raise PluginTransferError('Could not flash Bricklet plugin: Verification error')
+
+                    done += 1
+                    self.progress_changed.emit(done, maximum)
+            finally:
+                self.device.pipelined_response_queue = None
+
+    # internal
+    def send(self, op, position, accept):
+        if op == OP_WRITE:
+            return self.ipcon.write_bricklet_plugin_pipelined(self.device, self.port, position,
+                                                              self.chunks[position], accept)
+        else:
+            return self.ipcon.read_bricklet_plugin_pipelined(self.device, self.port, position, accept)
+
+    # internal
+    def adapt_window(self, rtt):
+        if self.min_rtt == None or rtt < self.min_rtt:
+            self.min_rtt = rtt
+
+        if self.window > 1 and rtt > self.min_rtt * self.window * CONGESTION_FACTOR:
+            self.window -= 1
+            self.responses_since_change = 0
+            return
+
+        self.responses_since_change += 1
+
+        if self.responses_since_change >= self.window and self.window < MAX_WINDOW:
+            self.window += 1
+            self.responses_since_change = 0
+            self.max_window_used = max(self.max_window_used, self.window)
+
+    # internal
+    def handle_timeout(self, queue, pending, outstanding, retries):
+        lost = sorted(outstanding.values(), key=lambda item: item[2])
+
+        outstanding.clear()
+
+        for op, position, sent_at in reversed(lost):
+            key = (op, position)
+            retries[key] = retries.get(key, 0) + 1
+
+            if retries[key] > MAX_RETRIES:
+                raise PluginTransferError(OP_MESSAGES[op],
+                                          Error(Error.TIMEOUT, 'Did not receive response for function {0} in time'
+                                                               .format(OP_FUNCTION_IDS[op])))
+
+            pending.appendleft(key)
+
+        self.retry_count += len(lost)
+        self.window = 1
+        self.responses_since_change = 0
+
+        # drop late responses, the requests are sent again
+        while not queue.empty():
+            try:
+                queue.get(False)
+            except Empty:
+                break
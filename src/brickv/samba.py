@@ -23,7 +23,9 @@ Boston, MA 02111-1307, USA.
 
 import sys
 import glob
+import time
 import struct
+import threading
 from serial import Serial, SerialException
 
 if sys.platform.startswith('linux'):
@@ -46,17 +48,21 @@ elif sys.platform == 'win32':
     from win32file import CreateFile
     from win32api import CloseHandle
 
-    wmi = None
+    # a COM object can only be used in the apartment of the thread that
+    # created it, therefore every thread gets its own WMI object
+    wmi_local = threading.local()
 
     def get_serial_ports():
         success = False
         ports = []
-        global wmi
 
         # try WMI first
         try:
+            wmi = getattr(wmi_local, 'wmi', None)
+
             if wmi is None:
                 wmi = win32com.client.GetObject('winmgmts:')
+                wmi_local.wmi = wmi
 
             for port in wmi.InstancesOf('Win32_SerialPort'):
                 ports.append((port.DeviceID, port.Name, ''))
@@ -86,6 +92,11 @@ elif sys.platform == 'win32':
 
         return ports
 
+    # releases the WMI object of the calling thread, has to be called before
+    # the thread uninitializes COM
+    def release_serial_ports():
+        wmi_local.wmi = None
+
 else:
     def get_serial_ports():
         return []
@@ -109,6 +120,7 @@ EEFC_FSR_FLOCKE = 0b0100
 EEFC_FCR_FKEY = 0x5A
 
 EEFC_FCR_FCMD_WP   = 0x01 # Write Page
+EEFC_FCR_FCMD_EWP  = 0x03 # Erase Page and Write Page
 EEFC_FCR_FCMD_EA   = 0x05 # Erase All
 EEFC_FCR_FCMD_SLB  = 0x08 # Set Lock Bit
 EEFC_FCR_FCMD_CLB  = 0x09 # Clear Lock Bit
@@ -137,6 +149,27 @@ RSTC_MR_KEY_OFFSET = 24
 
 RSTC_MR_ERSTL_OFFSET = 8
 
+# the flash write buffer only accepts 32 bit writes, but the S command writes
+# bytes. therefore pages are sent into SRAM with the S command and then copied
+# into the flash write buffer by this applet. it is the thumb version of the
+# WordCopy applet of BOSSA, it copies WORDS words from SRC to DST and restores
+# the stack pointer to STACK before it returns, if RESET is 0
+WORD_COPY_APPLET = '\x09\x48\x0a\x49\x0a\x4a\x02\xe0\x08\xc9\x08\xc0\x01\x3a\x00\x2a' \
+                   '\xfa\xd1\x04\x48\x00\x28\x01\xd1\x01\x48\x85\x46\x70\x47\xc0\x46'
+
+WORD_COPY_APPLET_STACK = 0x20 # offsets of the parameters
+WORD_COPY_APPLET_RESET = 0x24
+WORD_COPY_APPLET_DST   = 0x28
+WORD_COPY_APPLET_SRC   = 0x2C
+WORD_COPY_APPLET_WORDS = 0x30
+
+# SRAM below 0x20001000 is used by SAM-BA itself
+SRAM_APPLET_ADDRESS = 0x20001000
+SRAM_BUFFER_ADDRESS = 0x20001100
+SRAM_BUFFER_PAGE_COUNT = 16
+
+READ_CHUNK_PAGE_COUNT = 16
+
 # http://www.varsanofiev.com/inside/at91_sam_ba.htm
 # http://sourceforge.net/apps/mediawiki/lejos/index.php?title=Documentation:SAM-BA
 
@@ -147,9 +180,12 @@ class SAMBARebootError(SAMBAException):
     pass
 
 class SAMBA(object):
-    def __init__(self, port_name, progress=None):
+    def __init__(self, port_name, progress=None, bulk_write=True):
         self.current_mode = None
         self.progress = progress
+        self.bulk_write = bulk_write # False forces writing word by word
+        self.word_copy_applet_installed = False
+        self.write_timings = [] # (title, mode, page count, seconds)
 
         try:
             self.port = Serial(port_name, 115200, timeout=5)
@@ -234,7 +270,10 @@ class SAMBA(object):
 
         return uid2 << 32 | uid1
 
-    def flash(self, firmware, imu_calibration, lock_imu_calibration_pages):
+    # in differential mode the flash is not erased as a whole, only the pages
+    # that differ from the new content are erased and written. pages after
+    # the firmware keep their content
+    def flash(self, firmware, imu_calibration, lock_imu_calibration_pages, differential=False):
         # Split firmware into pages
         firmware_pages = []
         offset = 0
@@ -248,23 +287,14 @@ class SAMBA(object):
             firmware_pages.append(page)
             offset += self.flash_page_size
 
-        # Flash Programming Erata: FWS must be 6
-        self.write_uint32(EEFC_FMR, 0x06 << 8)
-
-        # Unlock
-        for region in range(self.flash_lockbit_count):
-            self.wait_for_flash_ready('while unlocking flash pages')
-            page_num = (region * self.flash_page_count) / self.flash_lockbit_count
-            self.write_flash_command(EEFC_FCR_FCMD_CLB, page_num)
-
-        self.wait_for_flash_ready('after unlocking flash pages')
-
-        # Erase All
-        self.write_flash_command(EEFC_FCR_FCMD_EA, 0)
-        self.wait_for_flash_ready('while erasing flash pages')
+        # Unlock and Erase All, only unlock in differential mode
+        if differential:
+            self.unlock()
+        else:
+            self.erase()
 
         # Write firmware
-        self.write_pages(firmware_pages, 0, 'Writing firmware')
+        self.write_pages(firmware_pages, 0, 'Writing firmware', differential)
 
         # Write IMU calibration
         if imu_calibration is not None:
@@ -298,7 +328,7 @@ class SAMBA(object):
             # Write IMU calibration
             page_num_offset = (ic_relative_address - ic_prefix_length) / self.flash_page_size
 
-            self.write_pages(imu_calibration_pages, page_num_offset, 'Writing IMU calibration')
+            self.write_pages(imu_calibration_pages, page_num_offset, 'Writing IMU calibration', differential)
 
         # Lock firmware
         self.lock_pages(0, len(firmware_pages))
@@ -329,6 +359,25 @@ class SAMBA(object):
         except SAMBAException as e:
             raise SAMBARebootError(str(e))
 
+    def unlock(self):
+        # Flash Programming Erata: FWS must be 6
+        self.write_uint32(EEFC_FMR, 0x06 << 8)
+
+        # Unlock
+        for region in range(self.flash_lockbit_count):
+            self.wait_for_flash_ready('while unlocking flash pages')
+            page_num = (region * self.flash_page_count) / self.flash_lockbit_count
+            self.write_flash_command(EEFC_FCR_FCMD_CLB, page_num)
+
+        self.wait_for_flash_ready('after unlocking flash pages')
+
+    def erase(self):
+        self.unlock()
+
+        # Erase All
+        self.write_flash_command(EEFC_FCR_FCMD_EA, 0)
+        self.wait_for_flash_ready('while erasing flash pages')
+
     def reset_progress(self, title, length):
         if self.progress is not None:
             self.progress.reset(title, length)
@@ -337,44 +386,164 @@ class SAMBA(object):
         if self.progress is not None:
             self.progress.update(value)
 
-    def write_pages(self, pages, page_num_offset, title):
-        self.reset_progress(title, len(pages))
+    # writes the pages starting at page_num_offset. in differential mode the
+    # flash is not erased before, then only the pages that differ from the
+    # current flash content are erased and written
+    def write_pages(self, pages, page_num_offset, title, differential=False):
+        start = time.time()
+
+        if differential:
+            changed_page_nums = self.compare_pages(pages, page_num_offset, 'Reading current flash content')
+            items = [(page_num_offset + i, pages[i]) for i in changed_page_nums]
+            write_command = EEFC_FCR_FCMD_EWP
+        else:
+            items = [(page_num_offset + i, page) for i, page in enumerate(pages)]
+            write_command = EEFC_FCR_FCMD_WP
+
+        self.reset_progress(title, len(items))
 
-        page_num = 0
+        i = 0
+        mode = 'word'
+        erase_first_page = False
 
-        for page in pages:
+        if self.bulk_write and len(items) > 0:
+            i = self.write_pages_bulk(items, write_command)
+
+            if i > 0:
+                mode = 'bulk'
+            else:
+                # the bootloader does not support the bulk path, stay with
+                # the word path for the rest of the flashing. the first page
+                # might be written partially already and has to be erased
+                self.bulk_write = False
+                erase_first_page = True
+
+        for page_num, page in items[i:]:
+            address = self.flash_base + page_num * self.flash_page_size
             offset = 0
 
             while offset < len(page):
-                address = self.flash_base + (page_num_offset + page_num) * self.flash_page_size + offset
-                self.write_word(address, page[offset:offset + 4])
+                self.write_word(address + offset, page[offset:offset + 4])
                 offset += 4
 
+            if i == 0 and erase_first_page:
+                command = EEFC_FCR_FCMD_EWP
+            else:
+                command = write_command
+
             self.wait_for_flash_ready('while writing flash pages')
-            self.write_flash_command(EEFC_FCR_FCMD_WP, page_num_offset + page_num)
+            self.write_flash_command(command, page_num)
             self.wait_for_flash_ready('while writing flash pages')
 
-            page_num += 1
-            self.update_progress(page_num)
+            i += 1
+            self.update_progress(i)
 
-    def verify_pages(self, pages, page_num_offset, title, title_in_error):
-        self.reset_progress('Verifying written ' + title, len(pages))
+        self.write_timings.append((title, mode, len(items), len(pages) - len(items), time.time() - start))
 
-        offset = page_num_offset * self.flash_page_size
-        page_num = 0
+    # writes the (page number, page) items through SRAM. returns the number of
+    # written items, or 0 if the first page could not be written correctly.
+    # errors after the first page are not caused by the bulk path and are raised
+    def write_pages_bulk(self, items, write_command):
+        try:
+            self.install_word_copy_applet()
+            self.write_pages_from_sram(items, 0, 1, write_command)
 
-        for page in pages:
-            read_page = self.read_bytes(self.flash_base + offset, len(page))
-            offset += len(page)
+            page_num, page = items[0]
 
-            if read_page != page:
-                if title_in_error:
-                    raise SAMBAException('Verification error ({0})'.format(title))
-                else:
-                    raise SAMBAException('Verification error')
+            if self.read_bytes(self.flash_base + page_num * self.flash_page_size, self.flash_page_size) != page:
+                return 0
+        except SAMBAException:
+            return 0
+
+        i = 1
+
+        while i < len(items):
+            count = min(len(items) - i, SRAM_BUFFER_PAGE_COUNT)
+
+            self.write_pages_from_sram(items, i, count, write_command)
+
+            i += count
+
+        return i
+
+    def install_word_copy_applet(self):
+        if self.word_copy_applet_installed:
+            return
+
+        # the initial stack pointer of SAM-BA is the first entry of its vector
+        # table, which is mapped to address 0 while SAM-BA is running
+        stack = self.read_uint32(0)
+        applet = WORD_COPY_APPLET + struct.pack('<IIIII', stack, 0, 0, 0, self.flash_page_size / 4)
+
+        self.write_bytes(SRAM_APPLET_ADDRESS, applet)
+        self.word_copy_applet_installed = True
+
+    # sends count items starting at index first with one S command into SRAM
+    # and copies them one by one into the flash write buffer
+    def write_pages_from_sram(self, items, first, count, write_command):
+        self.write_bytes(SRAM_BUFFER_ADDRESS, ''.join([page for page_num, page in items[first:first + count]]))
 
-            page_num += 1
-            self.update_progress(page_num)
+        for i in range(count):
+            page_num = items[first + i][0]
+            src = SRAM_BUFFER_ADDRESS + i * self.flash_page_size
+            dst = self.flash_base + page_num * self.flash_page_size
+
+            self.write_uint32(SRAM_APPLET_ADDRESS + WORD_COPY_APPLET_SRC, src)
+            self.write_uint32(SRAM_APPLET_ADDRESS + WORD_COPY_APPLET_DST, dst)
+            self.go(SRAM_APPLET_ADDRESS + 1) # thumb mode
+
+            self.wait_for_flash_ready('while writing flash pages')
+            self.write_flash_command(write_command, page_num)
+            self.wait_for_flash_ready('while writing flash pages')
+
+            self.update_progress(first + i + 1)
+
+    def format_write_timings(self):
+        lines = []
+
+        for title, mode, written_count, skipped_count, duration in self.write_timings:
+            if written_count > 0:
+                line = '{0}: {1} pages in {2:.2f} s ({3:.1f} ms per page, {4} writes)' \
+                       .format(title, written_count, duration, duration * 1000.0 / written_count, mode)
+            else:
+                line = '{0}: no pages written in {1:.2f} s'.format(title, duration)
+
+            if skipped_count > 0:
+                line += ', {0} unchanged pages skipped'.format(skipped_count)
+
+            lines.append(line)
+
+        return '\n'.join(lines)
+
+    # reads the flash content of the pages starting at page_num_offset in
+    # chunks of READ_CHUNK_PAGE_COUNT pages and returns the indices of the
+    # pages that differ
+    def compare_pages(self, pages, page_num_offset, title):
+        self.reset_progress(title, len(pages))
+
+        changed_page_nums = []
+        i = 0
+
+        while i < len(pages):
+            count = min(len(pages) - i, READ_CHUNK_PAGE_COUNT)
+            address = self.flash_base + (page_num_offset + i) * self.flash_page_size
+            read_pages = self.read_bytes(address, count * self.flash_page_size)
+
+            for k in range(count):
+                if read_pages[k * self.flash_page_size:(k + 1) * self.flash_page_size] != pages[i + k]:
+                    changed_page_nums.append(i + k)
+
+            i += count
+            self.update_progress(i)
+
+        return changed_page_nums
+
+    def verify_pages(self, pages, page_num_offset, title, title_in_error):
+        if len(self.compare_pages(pages, page_num_offset, 'Verifying written ' + title)) > 0:
+            if title_in_error:
+                raise SAMBAException('Verification error ({0})'.format(title))
+            else:
+                raise SAMBAException('Verification error')
 
     def lock_pages(self, page_num, page_count):
         start_page_num = page_num - (page_num % self.flash_pages_per_lockregion)
@@ -447,27 +616,19 @@ class SAMBA(object):
 
         return response[2:-1]
 
+    # only for SRAM, see WORD_COPY_APPLET
     def write_bytes(self, address, bytes_):
-        self.change_mode('T')
+        self.change_mode('N')
 
         try:
-            # FIXME: writes '33337777BBBBFFFF' instead of '0123456789ABCDEF'
             self.port.write('S%X,%X#' % (address, len(bytes_)))
+            # SAM-BA gets confused if the command and the data arrive in the
+            # same USB packet
+            self.port.flush()
             self.port.write(bytes_)
         except:
             raise SAMBAException('Write error while writing to address 0x%08X' % address)
 
-        try:
-            response = self.port.read(3)
-        except:
-            raise SAMBAException('Read error while writing to address 0x%08X' % address)
-
-        if len(response) == 0:
-            raise SAMBAException('Timeout while writing to address 0x%08X' % address)
-
-        if response != '\n\r>':
-            raise SAMBAException('Protocol error while writing to address 0x%08X' % address)
-
     def reset(self):
         self.reset_progress('Triggering Brick reset', 0)
 
@@ -482,6 +643,9 @@ class SAMBA(object):
 
         try:
             self.port.write('G%X#' % address)
+            # SAM-BA gets confused if the next command arrives in the same
+            # USB packet
+            self.port.flush()
         except:
             raise SAMBAException('Write error while executing code at address 0x%08X' % address)
 
@@ -506,3 +670,139 @@ class SAMBA(object):
 
     def write_flash_command(self, command, argument):
         self.write_uint32(EEFC_FCR, (EEFC_FCR_FKEY << 24) | (argument << 8) | command)
+
+BATCH_FLASH_STATE_WAITING = 'Waiting'
+BATCH_FLASH_STATE_FLASHING = 'Flashing'
+BATCH_FLASH_STATE_DONE = 'Done'
+BATCH_FLASH_STATE_FAILED = 'Failed'
+BATCH_FLASH_STATE_SKIPPED = 'Skipped' # no Brick in bootloader
+
+class BatchFlashJob(object):
+    """
+    Flashes one Brick in its own thread. Its progress and result are read
+    by polling its attributes, it is also the progress object of its SAMBA
+    instance.
+    """
+
+    def __init__(self, port_name, firmware, bulk_write, differential):
+        self.port_name = port_name
+        self.firmware = firmware
+        self.bulk_write = bulk_write
+        self.differential = differential
+        self.state = BATCH_FLASH_STATE_WAITING
+        self.title = ''
+        self.value = 0
+        self.maximum = 0
+        self.message = ''
+        self.uid64 = None
+        self.duration = None
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+
+    def reset(self, title, length):
+        self.title = title
+        self.value = 0
+        self.maximum = length
+
+    def update(self, value):
+        self.value = value
+
+    def cancel(self):
+        pass
+
+    def setMaximum(self, value):
+        self.maximum = value
+
+    def is_finished(self):
+        return self.state in [BATCH_FLASH_STATE_DONE, BATCH_FLASH_STATE_FAILED, BATCH_FLASH_STATE_SKIPPED]
+
+    def finish(self, state, message, start):
+        self.message = message
+        self.duration = time.time() - start
+        self.state = state
+
+    def run(self):
+        start = time.time()
+        self.state = BATCH_FLASH_STATE_FLASHING
+
+        try:
+            samba = SAMBA(self.port_name, self, self.bulk_write)
+        except SAMBAException as e:
+            if str(e) == 'No Brick in Bootloader found':
+                self.finish(BATCH_FLASH_STATE_SKIPPED, str(e), start)
+            else:
+                self.finish(BATCH_FLASH_STATE_FAILED, 'Could not connect to Brick: {0}'.format(e), start)
+
+            return
+        except Exception as e:
+            self.finish(BATCH_FLASH_STATE_FAILED, 'Could not connect to Brick: {0}'.format(e), start)
+            return
+
+        try:
+            self.uid64 = samba.read_uid64()
+            samba.flash(self.firmware, None, False, self.differential)
+            self.finish(BATCH_FLASH_STATE_DONE, 'Successfully restarted Brick', start)
+        except SAMBARebootError:
+            self.finish(BATCH_FLASH_STATE_DONE, 'Manual restart of Brick required', start)
+        except Exception as e:
+            self.finish(BATCH_FLASH_STATE_FAILED, 'Could not flash Brick: {0}'.format(e), start)
+        finally:
+            try:
+                samba.port.close()
+            except:
+                pass
+
+class BatchFlasher(object):
+    """
+    Flashes the same firmware to the Bricks in bootloader mode at several
+    serial ports at once. Every port is flashed and verified by its own
+    BatchFlashJob, ports without a Brick in bootloader mode are skipped.
+    """
+
+    def __init__(self, port_names, firmware, bulk_write=True, differential=False):
+        self.jobs = [BatchFlashJob(port_name, firmware, bulk_write, differential) for port_name in port_names]
+
+    def start(self):
+        for job in self.jobs:
+            job.thread.start()
+
+    def is_finished(self):
+        for job in self.jobs:
+            if not job.is_finished():
+                return False
+
+        return True
+
+    def wait(self, timeout=None):
+        for job in self.jobs:
+            job.thread.join(timeout)
+
+    def count(self, state):
+        return len([job for job in self.jobs if job.state == state])
+
+    def format_summary(self):
+        return '{0} flashed, {1} failed, {2} skipped'.format(self.count(BATCH_FLASH_STATE_DONE),
+                                                             self.count(BATCH_FLASH_STATE_FAILED),
+                                                             self.count(BATCH_FLASH_STATE_SKIPPED))
+
+    # format_uid gets the 64 bit UID of a Brick and returns it as string
+    def format_report(self, format_uid=lambda uid64: '%016X' % uid64):
+        lines = ['{0:<24}{1:<10}{2:<18}{3:>10}  {4}'.format('Port', 'State', 'UID', 'Time [s]', 'Message')]
+
+        for job in self.jobs:
+            if job.uid64 != None:
+                uid = format_uid(job.uid64)
+            else:
+                uid = '-'
+
+            if job.duration != None:
+                duration = '{0:.1f}'.format(job.duration)
+            else:
+                duration = '-'
+
+            lines.append('{0:<24}{1:<10}{2:<18}{3:>10}  {4}'.format(job.port_name, job.state, uid, duration, job.message))
+
+        lines.append('')
+        lines.append(self.format_summary())
+
+        return '\n'.join(lines)
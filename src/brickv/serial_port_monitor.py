@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+brickv (Brick Viewer)
+
+serial_port_monitor.py: Background watcher of the serial ports
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public
+License along with this program; if not, write to the
+Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+Boston, MA 02111-1307, USA.
+"""
+
+import os
+import sys
+import time
+import select
+import logging
+import threading
+
+from PyQt4.QtCore import QObject, pyqtSignal
+
+from brickv.samba import get_serial_ports
+
+POLL_INTERVAL = 1.0 # seconds
+SETTLE_DELAY = 0.25 # seconds, udev creates the links and sets the permissions after the device node
+
+INOTIFY_WATCH_PATH = '/dev'
+IN_ATTRIB = 0x00000004
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+
+BOOTLOADER_USB_ID = ('03eb', '6124') # Atmel SAM-BA
+
+# returns an inotify file descriptor watching INOTIFY_WATCH_PATH or None if
+# inotify is not available
+def open_inotify():
+    if not sys.platform.startswith('linux'):
+        return None
+
+    try:
+        import ctypes
+        import ctypes.util
+
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        fd = libc.inotify_init()
+    except (OSError, AttributeError):
+        return None
+
+    if fd < 0:
+        return None
+
+    if libc.inotify_add_watch(fd, INOTIFY_WATCH_PATH, IN_CREATE | IN_DELETE | IN_ATTRIB) < 0:
+        os.close(fd)
+        return None
+
+    return fd
+
+# returns the (vendor, product) ID of the USB device of a serial port or None
+# if it is unknown. sysfs does not report changes through inotify, so it is
+# only used to identify the ports
+def get_linux_usb_id(port_name):
+    path = os.path.realpath('/sys/class/tty/{0}/device'.format(os.path.basename(port_name)))
+
+    for i in range(3):
+        try:
+            with open(os.path.join(path, 'idVendor'), 'rb') as f:
+                vendor = f.read().strip()
+
+            with open(os.path.join(path, 'idProduct'), 'rb') as f:
+                product = f.read().strip()
+
+            return (vendor, product)
+        except IOError:
+            path = os.path.dirname(path)
+
+    return None
+
+# port is a (name, description, hardware ID) tuple from get_serial_ports
+def looks_like_bootloader_port(port):
+    return 'ttyACM' in port[0] or \
+           'ttyUSB' in port[0] or \
+           'usbmodemfd' in port[0] or \
+           'AT91 USB to Serial Converter' in port[1] or \
+           'GPS Camera Detect' in port[1]
+
+def is_bootloader_port(port):
+    if sys.platform.startswith('linux'):
+        usb_id = get_linux_usb_id(port[0])
+
+        if usb_id != None:
+            return usb_id == BOOTLOADER_USB_ID
+
+    return looks_like_bootloader_port(port)
+
+class SerialPortMonitor(QObject):
+    """
+    Keeps the list of serial ports up-to-date in a background thread. On
+    Linux the thread waits for inotify events of /dev, otherwise it polls
+    every POLL_INTERVAL seconds. Only changes are signaled.
+    """
+
+    ports_changed = pyqtSignal(object) # list of ports as returned by get_serial_ports
+    bootloader_ports_added = pyqtSignal(object) # list of port names
+
+    def __init__(self):
+        QObject.__init__(self)
+
+        self.ports = None
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stop_event = None
+        self.wakeup_event = None
+        self.wakeup_pipe = None
+
+    def start(self):
+        if self.thread != None:
+            return
+
+        with self.lock:
+            self.ports = None # report the first scan as change
+
+        self.stop_event = threading.Event()
+        self.wakeup_event = threading.Event()
+        self.wakeup_pipe = None
+
+        inotify_fd = open_inotify()
+
+        if inotify_fd != None:
+            self.wakeup_pipe = os.pipe()
+        else:
+            logging.debug('Serial port monitor falls back to polling')
+
+        self.thread = threading.Thread(target=self.loop,
+                                       args=(self.stop_event, self.wakeup_event, inotify_fd, self.wakeup_pipe))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        if self.thread == None:
+            return
+
+        self.stop_event.set()
+        self.wakeup()
+        self.thread = None
+
+    # makes the thread scan now, instead of waiting for the next event
+    def rescan(self):
+        if self.thread != None:
+            self.wakeup()
+
+    # returns None if the first scan is not done yet
+    def get_ports(self):
+        with self.lock:
+            return self.ports
+
+    # internal
+    def wakeup(self):
+        self.wakeup_event.set()
+
+        if self.wakeup_pipe != None:
+            os.write(self.wakeup_pipe[1], b'x')
+
+    # internal
+    def loop(self, stop_event, wakeup_event, inotify_fd, wakeup_pipe):
+        if sys.platform == 'win32':
+            import pythoncom
+            from brickv.samba import release_serial_ports
+
+            # get_serial_ports uses WMI, it creates a WMI object for this
+            # thread that has to be released before COM is uninitialized
+            pythoncom.CoInitialize()
+
+        try:
+            while not stop_event.is_set():
+                self.scan()
+
+                if inotify_fd != None:
+                    self.wait_for_inotify(inotify_fd, wakeup_pipe[0])
+                else:
+                    wakeup_event.wait(POLL_INTERVAL)
+                    wakeup_event.clear()
+        finally:
+            if inotify_fd != None:
+                os.close(inotify_fd)
+                os.close(wakeup_pipe[0])
+                os.close(wakeup_pipe[1])
+
+            if sys.platform == 'win32':
+                release_serial_ports()
+                pythoncom.CoUninitialize()
+
+    # internal
+    def wait_for_inotify(self, inotify_fd, wakeup_fd):
+        readable = select.select([inotify_fd, wakeup_fd], [], [])[0]
+
+        if wakeup_fd in readable:
+            os.read(wakeup_fd, 64)
+
+        if inotify_fd in readable:
+            time.sleep(SETTLE_DELAY)
+
+            # one scan covers all events that arrived in the meantime
+            while len(select.select([inotify_fd], [], [], 0)[0]) > 0:
+                os.read(inotify_fd, 4096)
+
+    # internal
+    def scan(self):
+        try:
+            ports = get_serial_ports()
+        except:
+            logging.exception('Could not discover serial ports')
+            return
+
+        with self.lock:
+            old_ports = self.ports
+            self.ports = ports
+
+        if ports == old_ports:
+            return
+
+        self.ports_changed.emit(ports)
+
+        if old_ports == None:
+            return
+
+        old_port_names = set(port[0] for port in old_ports)
+        added = [port[0] for port in ports if port[0] not in old_port_names and is_bootloader_port(port)]
+
+        if len(added) > 0:
+            self.bootloader_ports_added.emit(added)
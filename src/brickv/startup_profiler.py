@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""
+brickv (Brick Viewer)
+
+startup_profiler.py: Wall time report of the startup phases
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public
+License along with this program; if not, write to the
+Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+Boston, MA 02111-1307, USA.
+"""
+
+# this module is imported before PyQt4 and must not import it itself
+
+import sys
+import time
+import functools
+import threading
+
+try:
+    import __builtin__ as builtins
+except ImportError:
+    import builtins # Python 3 fallback
+
+# --profile-startup enables the profiler, the other options imply it
+OPTION_PROFILE = '--profile-startup'
+OPTION_REPORT = '--profile-startup-report' # followed by a file name
+OPTION_CPROFILE = '--profile-startup-cprofile' # followed by a file name
+OPTION_QUIT = '--profile-startup-quit' # quit after the first paint
+
+# module name prefix -> import category, the first match wins
+IMPORT_CATEGORIES = [
+    ('PyQt4', 'import PyQt4'),
+    ('sip', 'import PyQt4'),
+    ('OpenGL', 'import OpenGL'),
+    ('brickv.bindings', 'import bindings'),
+    ('brickv.plugin_system', 'import plugins'),
+    ('brickv', 'import brickv'),
+    ('', 'import other')
+]
+
+class StartupProfiler(object):
+    """
+    Collects the wall time of the startup phases. Imports are timed by a
+    hook on __import__ and attributed to the category of the imported
+    module, excluding the time of nested imports. Other phases are timed
+    by wrapping functions, milestones are recorded as events.
+    """
+
+    def __init__(self, start_time, report_filename, cprofile_filename, quit_after_first_paint):
+        self.start_time = start_time
+        self.report_filename = report_filename
+        self.cprofile_filename = cprofile_filename
+        self.quit_after_first_paint = quit_after_first_paint
+        self.durations = {} # phase -> seconds
+        self.phase_order = []
+        self.events = [] # (name, seconds since start)
+        self.import_stack = [] # child time of the imports in progress
+        self.main_thread = threading.current_thread()
+        self.original_import = builtins.__import__
+        self.cprofile = None
+        self.reported = False
+
+        builtins.__import__ = self.timed_import
+
+        if self.cprofile_filename != None:
+            import cProfile
+
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+
+    def add_duration(self, phase, duration):
+        if phase not in self.durations:
+            self.durations[phase] = 0.0
+            self.phase_order.append(phase)
+
+        self.durations[phase] += duration
+
+    def add_event(self, name):
+        self.events.append((name, time.time() - self.start_time))
+
+    def timed_import(self, name, *args, **kwargs):
+        if threading.current_thread() is not self.main_thread:
+            return self.original_import(name, *args, **kwargs)
+
+        start = time.time()
+        self.import_stack.append(0.0)
+
+        try:
+            return self.original_import(name, *args, **kwargs)
+        finally:
+            duration = time.time() - start
+            child_duration = self.import_stack.pop()
+
+            if len(self.import_stack) > 0:
+                self.import_stack[-1] += duration
+
+            for prefix, category in IMPORT_CATEGORIES:
+                if name.startswith(prefix):
+                    self.add_duration(category, duration - child_duration)
+                    break
+
+    # replaces owner.name by a wrapper that adds its run time to phase. if
+    # event is given then the first call is recorded as event as well
+    def wrap(self, owner, name, phase, event=None):
+        function = getattr(owner, name)
+        state = {'called': False}
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.time()
+
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.add_duration(phase, time.time() - start)
+
+                if event != None and not state['called']:
+                    state['called'] = True
+                    self.add_event(event)
+
+        setattr(owner, name, wrapper)
+
+    def wrap_config(self, config):
+        for name in dir(config):
+            if name.startswith('get_') and callable(getattr(config, name)):
+                self.wrap(config, name, 'config reads')
+
+    # imports are done, the remaining ones are done lazily and not of interest
+    def imports_done(self):
+        builtins.__import__ = self.original_import
+        self.add_event('imports done')
+
+    def first_paint(self, app):
+        self.add_event('first paint')
+
+        if self.quit_after_first_paint:
+            self.report()
+            app.quit()
+
+    def format_report(self):
+        lines = ['Brick Viewer startup profile', '',
+                 '{0:<40}{1:>12}'.format('Phase', 'Time [ms]')]
+
+        for phase in self.phase_order:
+            lines.append('{0:<40}{1:12.1f}'.format(phase, self.durations[phase] * 1000.0))
+
+        lines += ['', 'imports exclude nested imports, other phases include nested phases',
+                  '', '{0:<40}{1:>12}'.format('Event', 'At [ms]')]
+
+        for name, at in self.events:
+            lines.append('{0:<40}{1:12.1f}'.format(name, at * 1000.0))
+
+        return '\n'.join(lines) + '\n'
+
+    def report(self):
+        if self.reported:
+            return
+
+        self.reported = True
+        report = self.format_report()
+
+        sys.stderr.write(report)
+
+        if self.report_filename != None:
+            with open(self.report_filename, 'wb') as f:
+                f.write(report)
+
+        if self.cprofile != None:
+            self.cprofile.disable()
+            self.cprofile.dump_stats(self.cprofile_filename)
+
+if '_profiler' not in globals():
+    _profiler = None
+
+# removes the profiler options from argv and starts the profiler if one of
+# them was given
+def start(argv, start_time):
+    global _profiler
+
+    enabled = False
+    report_filename = None
+    cprofile_filename = None
+    quit_after_first_paint = False
+    remaining = []
+    i = 0
+
+    while i < len(argv):
+        arg = argv[i]
+
+        if arg == OPTION_PROFILE:
+            enabled = True
+        elif arg in [OPTION_REPORT, OPTION_CPROFILE] and i + 1 < len(argv):
+            enabled = True
+            i += 1
+
+            if arg == OPTION_REPORT:
+                report_filename = argv[i]
+            else:
+                cprofile_filename = argv[i]
+        elif arg == OPTION_QUIT:
+            enabled = True
+            quit_after_first_paint = True
+        else:
+            remaining.append(arg)
+
+        i += 1
+
+    argv[:] = remaining
+
+    if enabled:
+        _profiler = StartupProfiler(start_time, report_filename, cprofile_filename, quit_after_first_paint)
+
+# returns None if profiling is disabled
+def get_startup_profiler():
+    return _profiler
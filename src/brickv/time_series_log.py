@@ -0,0 +1,391 @@
+# -*- coding: utf-8 -*-
+"""
+brickv (Brick Viewer)
+
+time_series_log.py: Indexed, memory-mapped time series log format
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public
+License along with this program; if not, write to the
+Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+Boston, MA 02111-1307, USA.
+"""
+
+import os
+import sys
+import mmap
+import time
+import bisect
+import struct
+from array import array
+
+from brickv.config_cache import write_file_atomically
+
+# a log consists of a data file and an index file next to it, both are
+# append-only and all values are little endian.
+#
+# data file: header block (magic 'BVTS', u8 version, u32 block size) padded
+#            to block size, followed by fixed-size blocks. each block holds
+#            samples of one channel: u16 channel, u16 sample count,
+#            i64 first timestamp [us], i64 first value, then sample count - 1
+#            u32 timestamp deltas [us] and sample count - 1 i32 value deltas
+#
+# index file: records, either a channel definition 'C': u16 channel,
+#             name, unit (u16 length + UTF-8 each), f64 divisor, or a block
+#             entry 'B': u16 channel, u32 block number, i64 first timestamp,
+#             i64 last timestamp [us]
+MAGIC = 'BVTS'
+VERSION = 1
+BLOCK_SIZE = 4096 # bytes
+BLOCK_HEADER_FORMAT = '<HHqq'
+BLOCK_HEADER_SIZE = struct.calcsize(BLOCK_HEADER_FORMAT)
+BLOCK_SAMPLE_COUNT = 1 + (BLOCK_SIZE - BLOCK_HEADER_SIZE) // 8
+MAX_TIMESTAMP_DELTA = 0xFFFFFFFF # us
+MAX_VALUE_DELTA = 0x7FFFFFFF
+MAX_BLOCK_AGE = 60 # seconds, incomplete blocks are written after this, bounds the loss on a crash
+INDEX_EXTENSION = '.idx'
+LITTLE_ENDIAN = sys.byteorder == 'little'
+
+RECORD_CHANNEL = 'C'
+RECORD_BLOCK = 'B'
+RECORD_BLOCK_FORMAT = '<HIqq'
+RECORD_BLOCK_SIZE = struct.calcsize(RECORD_BLOCK_FORMAT)
+
+class Error(Exception):
+    pass
+
+def pack_string(s):
+    s = s.encode('utf-8')
+
+    return struct.pack('<H', len(s)) + s
+
+def unpack_string(data, offset):
+    length = struct.unpack_from('<H', data, offset)[0]
+    offset += 2
+
+    return data[offset:offset + length].decode('utf-8'), offset + length
+
+def to_little_endian(a):
+    if not LITTLE_ENDIAN:
+        a.byteswap()
+
+    return a
+
+class Channel(object):
+    def __init__(self, channel_id, name, unit, divisor):
+        self.channel_id = channel_id
+        self.name = name
+        self.unit = unit
+        self.divisor = divisor
+
+        # index of the blocks of this channel, sorted by time
+        self.block_numbers = []
+        self.block_first_timestamps = []
+        self.block_last_timestamps = []
+
+class OpenBlock(object):
+    def __init__(self, channel_id, timestamp, value, now):
+        self.channel_id = channel_id
+        self.first_timestamp = timestamp
+        self.first_value = value
+        self.last_timestamp = timestamp
+        self.last_value = value
+        self.timestamp_deltas = array('I')
+        self.value_deltas = array('i')
+        self.created = now
+
+    def can_append(self, timestamp, value):
+        return len(self.timestamp_deltas) + 1 < BLOCK_SAMPLE_COUNT and \
+               0 <= timestamp - self.last_timestamp <= MAX_TIMESTAMP_DELTA and \
+               abs(value - self.last_value) <= MAX_VALUE_DELTA
+
+    def append(self, timestamp, value):
+        self.timestamp_deltas.append(timestamp - self.last_timestamp)
+        self.value_deltas.append(value - self.last_value)
+        self.last_timestamp = timestamp
+        self.last_value = value
+
+    def pack(self):
+        count = len(self.timestamp_deltas)
+        data = struct.pack(BLOCK_HEADER_FORMAT, self.channel_id, count + 1,
+                           self.first_timestamp, self.first_value)
+        data += to_little_endian(array('I', self.timestamp_deltas)).tostring()
+        data += to_little_endian(array('i', self.value_deltas)).tostring()
+
+        return data + '\0' * (BLOCK_SIZE - len(data))
+
+class TimeSeriesLogWriter(object):
+    """
+    Appends integer samples of any number of channels to a log. Samples are
+    collected per channel and written as fixed-size blocks once a block is
+    full or older than MAX_BLOCK_AGE.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.channels = {} # (name, unit, divisor) -> channel id
+        self.open_blocks = {} # channel id -> OpenBlock
+
+        if os.path.exists(filename):
+            reader = TimeSeriesLogReader(filename)
+
+            for channel in reader.channels:
+                self.channels[(channel.name, channel.unit, channel.divisor)] = channel.channel_id
+
+            valid_index = reader.valid_index
+            reader.close()
+
+            self.data_file = open(filename, 'r+b')
+            self.data_file.seek(0, os.SEEK_END)
+
+            # drop a torn block at the end of the file
+            size = self.data_file.tell()
+            self.data_file.truncate(size - size % BLOCK_SIZE)
+            self.data_file.seek(0, os.SEEK_END)
+
+            # drop a torn record at the end of the index, otherwise the reader
+            # stops there and misses everything appended after it. also drop
+            # the records of blocks that did not make it into the data file,
+            # their block numbers are used again from here on
+            if os.path.getsize(filename + INDEX_EXTENSION) != len(valid_index):
+                write_file_atomically(os.path.abspath(filename + INDEX_EXTENSION),
+                                      lambda f: f.write(valid_index))
+        else:
+            self.data_file = open(filename, 'wb')
+
+            header = MAGIC + struct.pack('<BI', VERSION, BLOCK_SIZE)
+
+            self.data_file.write(header + '\0' * (BLOCK_SIZE - len(header)))
+
+        self.next_block_number = self.data_file.tell() // BLOCK_SIZE
+        self.index_file = open(filename + INDEX_EXTENSION, 'ab')
+
+    def get_channel(self, name, unit, divisor):
+        key = (name, unit, float(divisor))
+
+        if key not in self.channels:
+            channel_id = len(self.channels)
+
+            self.channels[key] = channel_id
+            self.index_file.write(RECORD_CHANNEL + struct.pack('<H', channel_id) +
+                                  pack_string(name) + pack_string(unit) +
+                                  struct.pack('<d', key[2]))
+
+        return self.channels[key]
+
+    # timestamp in seconds, value as integer
+    def append(self, channel_id, timestamp, value):
+        now = time.time()
+        timestamp = int(round(timestamp * 1000000))
+        value = int(value)
+        open_block = self.open_blocks.get(channel_id)
+
+        if open_block != None and not open_block.can_append(timestamp, value):
+            self.write_block(open_block)
+            open_block = None
+
+        if open_block == None:
+            self.open_blocks[channel_id] = OpenBlock(channel_id, timestamp, value, now)
+        else:
+            open_block.append(timestamp, value)
+
+            if now - open_block.created >= MAX_BLOCK_AGE:
+                self.write_block(open_block)
+
+    def write_block(self, open_block):
+        self.data_file.write(open_block.pack())
+        self.index_file.write(RECORD_BLOCK + struct.pack(RECORD_BLOCK_FORMAT, open_block.channel_id,
+                                                         self.next_block_number,
+                                                         open_block.first_timestamp,
+                                                         open_block.last_timestamp))
+
+        self.next_block_number += 1
+
+        del self.open_blocks[open_block.channel_id]
+
+    # the data file is synced before the index file, so the index never
+    # references a block that is not on disk. open blocks that reached
+    # MAX_BLOCK_AGE are written first, append only checks the age when the
+    # channel gets a new sample, which a stalled channel doesn't
+    def flush(self):
+        now = time.time()
+
+        for open_block in self.open_blocks.values():
+            if now - open_block.created >= MAX_BLOCK_AGE:
+                self.write_block(open_block)
+
+        self.data_file.flush()
+        os.fsync(self.data_file.fileno())
+        self.index_file.flush()
+        os.fsync(self.index_file.fileno())
+
+    def close(self):
+        for open_block in self.open_blocks.values():
+            self.write_block(open_block)
+
+        self.flush()
+        self.data_file.close()
+        self.index_file.close()
+
+class TimeSeriesLogReader(object):
+    """
+    Reads a log through mmap. Only the index file is read completely, the
+    blocks of the requested time range are located with bisect and decoded
+    directly from the mapping.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.channels = []
+
+        with open(filename, 'rb') as f:
+            if len(f.read(1)) == 0:
+                raise Error('Log file {0} is empty'.format(filename))
+
+            self.data_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self.data_map[:len(MAGIC)] != MAGIC:
+            self.data_map.close()
+            raise Error('{0} is not a time series log'.format(filename))
+
+        version, block_size = struct.unpack_from('<BI', self.data_map, len(MAGIC))
+
+        if version != VERSION or block_size != BLOCK_SIZE:
+            self.data_map.close()
+            raise Error('Unsupported time series log version {0}'.format(version))
+
+        self.block_count = len(self.data_map) // BLOCK_SIZE
+
+        with open(filename + INDEX_EXTENSION, 'rb') as f:
+            self.parse_index(f.read())
+
+    def parse_index(self, data):
+        offset = 0
+        valid_records = [] # complete records that reference existing blocks
+
+        try:
+            while offset < len(data):
+                start = offset
+                record = data[offset]
+                offset += 1
+
+                if record == RECORD_CHANNEL:
+                    channel_id = struct.unpack_from('<H', data, offset)[0]
+                    name, offset = unpack_string(data, offset + 2)
+                    unit, offset = unpack_string(data, offset)
+                    divisor = struct.unpack_from('<d', data, offset)[0]
+                    offset += 8
+
+                    self.channels.append(Channel(channel_id, name, unit, divisor))
+                    valid_records.append(data[start:offset])
+                elif record == RECORD_BLOCK:
+                    channel_id, block_number, first_timestamp, last_timestamp = \
+                        struct.unpack_from(RECORD_BLOCK_FORMAT, data, offset)
+                    offset += RECORD_BLOCK_SIZE
+
+                    # ignore blocks that did not make it into the data file
+                    if block_number >= self.block_count:
+                        continue
+
+                    channel = self.channels[channel_id]
+
+                    channel.block_numbers.append(block_number)
+                    channel.block_first_timestamps.append(first_timestamp)
+                    channel.block_last_timestamps.append(last_timestamp)
+                    valid_records.append(data[start:offset])
+                else:
+                    break
+        except (struct.error, IndexError, UnicodeDecodeError):
+            pass # torn record at the end of the index
+
+        # the index without a torn end and stale block records, used by the
+        # writer to repair the index when it reopens the log
+        self.valid_index = ''.join(valid_records)
+
+    # returns (first, last) timestamp in seconds over all channels
+    def get_time_range(self):
+        firsts = [channel.block_first_timestamps[0] for channel in self.channels if len(channel.block_numbers) > 0]
+        lasts = [channel.block_last_timestamps[-1] for channel in self.channels if len(channel.block_numbers) > 0]
+
+        if len(firsts) == 0:
+            return None, None
+
+        return min(firsts) / 1000000.0, max(lasts) / 1000000.0
+
+    def decode_block(self, block_number):
+        offset = block_number * BLOCK_SIZE
+        channel_id, count, first_timestamp, first_value = \
+            struct.unpack_from(BLOCK_HEADER_FORMAT, self.data_map, offset)
+        offset += BLOCK_HEADER_SIZE
+        delta_count = count - 1
+
+        timestamp_deltas = array('I')
+        timestamp_deltas.fromstring(self.data_map[offset:offset + delta_count * 4])
+        offset += delta_count * 4
+
+        value_deltas = array('i')
+        value_deltas.fromstring(self.data_map[offset:offset + delta_count * 4])
+
+        to_little_endian(timestamp_deltas)
+        to_little_endian(value_deltas)
+
+        timestamps = [first_timestamp]
+        values = [first_value]
+        timestamp = first_timestamp
+        value = first_value
+
+        for i in xrange(delta_count):
+            timestamp += timestamp_deltas[i]
+            value += value_deltas[i]
+
+            timestamps.append(timestamp)
+            values.append(value)
+
+        return timestamps, values
+
+    # yields (timestamps [s], values) per block of a channel in the given
+    # time range [s], so long ranges can be processed without loading them
+    # completely. if max_block_count is given then only every n-th block is
+    # decoded to limit the work for very long ranges
+    def iter_samples(self, channel, start, end, max_block_count=None):
+        start_us = int(start * 1000000)
+        end_us = int(end * 1000000)
+        first = bisect.bisect_left(channel.block_last_timestamps, start_us)
+        last = bisect.bisect_right(channel.block_first_timestamps, end_us)
+        step = 1
+
+        if max_block_count != None and last - first > max_block_count:
+            step = (last - first + max_block_count - 1) // max_block_count
+
+        divisor = channel.divisor
+
+        for i in xrange(first, last, step):
+            timestamps, values = self.decode_block(channel.block_numbers[i])
+            begin = bisect.bisect_left(timestamps, start_us)
+            stop = bisect.bisect_right(timestamps, end_us)
+
+            yield [timestamp / 1000000.0 for timestamp in timestamps[begin:stop]], \
+                  [value / divisor for value in values[begin:stop]]
+
+    # returns (timestamps [s], values) of a channel in the given time range [s]
+    def get_samples(self, channel, start, end, max_block_count=None):
+        xs = []
+        ys = []
+
+        for block_xs, block_ys in self.iter_samples(channel, start, end, max_block_count):
+            xs.extend(block_xs)
+            ys.extend(block_ys)
+
+        return xs, ys
+
+    def close(self):
+        self.data_map.close()